@@ -0,0 +1,73 @@
+"""
+Concurrent reads for the async views.
+
+Django 4.2's async ORM (``aget``, ``afirst``, ``async for`` ...) runs every
+query of a request on that request's one thread, so gathering several of its
+coroutines still runs the queries one after another. gather() runs each read
+on a thread of a pool of ASYNC_DB_THREADS instead. Every pool thread has its
+own database connection, which it keeps within CONN_MAX_AGE like a request
+thread would, so a page's independent queries overlap:
+
+    appointments, results = await asyncdb.gather(
+        Appointment.objects.filter(patient=patient),
+        partial(slots.next_available, days=14),
+    )
+
+A queryset is evaluated to a list; a callable is called. Each read runs on a
+different connection and outside the request's transaction, so use it only
+for reads that do not depend on each other. Execute wrappers on the request's
+connections (profiling, metrics) are applied to the pool's connections too,
+so they see the pool's queries, from several threads at once.
+
+This does not make the async views faster than the sync ones: on a single
+CPU, benchmark_async_views measured them slower (see ASYNC_VIEWS).
+"""
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections, connections
+from django.db.models import QuerySet
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _executor():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(settings.ASYNC_DB_THREADS, thread_name_prefix="asyncdb")
+        return _pool
+
+
+def _run(read, wrappers):
+    # the executor does not pass the caller's context on, so the thread uses
+    # its own connections; drop them when stale, as a new request would
+    close_old_connections()
+    with ExitStack() as stack:
+        for alias, funcs in wrappers.items():
+            for func in funcs:
+                stack.enter_context(connections[alias].execute_wrapper(func))
+        return list(read) if isinstance(read, QuerySet) else read()
+
+
+async def _request_wrappers():
+    # the request's connections belong to its thread
+    databases = await sync_to_async(connections.all)()
+    return {conn.alias: list(conn.execute_wrappers) for conn in databases}
+
+
+async def gather(*reads):
+    """Results of ``reads``, in order, run concurrently."""
+    wrappers = await _request_wrappers()
+    loop = asyncio.get_running_loop()
+    return await asyncio.gather(*(loop.run_in_executor(_executor(), _run, read, wrappers) for read in reads))
+
+
+async def fetch(read):
+    """Evaluate one queryset, or call one function, on the pool."""
+    return (await gather(read))[0]
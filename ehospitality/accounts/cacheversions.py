@@ -0,0 +1,51 @@
+"""
+Versioned cache keys for entries built from the database.
+
+Deleting a cached entry when the data behind it changes races with readers:
+one that missed, queried the database before the change committed and writes
+its result after the delete puts the stale entry back for its whole timeout.
+So an entry is stored under ``<name>:<version>`` instead, and invalidating
+moves the name to a new version once the transaction commits:
+
+    keys = cacheversions.keys(names)            # before querying the database
+    cached = cache.get_many(keys.values())
+    ...
+    cacheversions.bump(names)                   # in the writer
+
+A late write from a reader that saw the old version lands under a key nobody
+reads any more and expires on its own. Versions are random rather than
+counted, so a version that was evicted from the cache cannot come back and
+find old entries.
+"""
+import secrets
+
+from django.core.cache import cache
+from django.db import transaction
+
+
+def _version_key(name):
+    return f"version:{name}"
+
+
+def _new_version():
+    return secrets.token_hex(4)
+
+
+def keys(names):
+    """``{name: cache key of its current version}``."""
+    version_keys = {_version_key(name): name for name in names}
+    versions = cache.get_many(version_keys)
+    unversioned = [key for key in version_keys if key not in versions]
+    if unversioned:
+        for key in unversioned:
+            cache.add(key, _new_version(), None)
+        # another process may have added it first
+        versions.update(cache.get_many(unversioned))
+    return {name: f"{name}:{versions[key]}" for key, name in version_keys.items()}
+
+
+def bump(names):
+    """Move ``names`` to new versions once the current transaction commits."""
+    names = list(names)
+    if names:
+        transaction.on_commit(lambda: cache.set_many({_version_key(name): _new_version() for name in names}, None))
@@ -0,0 +1,38 @@
+"""
+Batch relation loading for views.
+
+Each view declares the relation paths its template walks, e.g.
+``("doctor__user", "items")``, and wraps its queryset in load(). Paths that
+only follow foreign keys / one-to-ones are joined with select_related; paths
+that cross a reverse or many-to-many relation are fetched with
+prefetch_related, one query per hop. A page then costs a fixed number of
+queries no matter how many rows it shows.
+"""
+from functools import lru_cache
+
+
+@lru_cache(maxsize=None)
+def _plan(model, paths):
+    joins, prefetches = [], []
+    for path in paths:
+        current, to_one = model, []
+        for part in path.split("__"):
+            field = current._meta.get_field(part)
+            if field.many_to_many or field.one_to_many:
+                prefetches.append(path)
+                break
+            to_one.append(part)
+            current = field.related_model
+        if to_one:
+            joins.append("__".join(to_one))
+    return tuple(dict.fromkeys(joins)), tuple(dict.fromkeys(prefetches))
+
+
+def load(queryset, relations):
+    """Return ``queryset`` set up to fetch ``relations`` in batch."""
+    joins, prefetches = _plan(queryset.model, tuple(relations))
+    if joins:
+        queryset = queryset.select_related(*joins)
+    if prefetches:
+        queryset = queryset.prefetch_related(*prefetches)
+    return queryset
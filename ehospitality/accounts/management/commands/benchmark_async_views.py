@@ -0,0 +1,293 @@
+import asyncio
+import json
+import logging
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from importlib import import_module
+from wsgiref.util import setup_testing_defaults
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.urls import reverse
+
+from accounts.models import User
+from .loadtest import SEARCH_TERMS, percentile
+
+MODES = ("sync", "async")
+# (role, url name, query string) of the pages that have async variants
+ENDPOINTS = (
+    ("patient", "patient:patient_dashboard", ""),
+    ("patient", "patient:resources", ""),
+    ("patient", "patient:resources", "q={term}"),
+    ("patient", "patient:find_slots", ""),
+    ("patient", "patient:find_slots_feed", "days=14&limit=20"),
+    ("doctor", "doctor:dashboard", ""),
+    ("doctor", "doctor:availability_feed", ""),
+)
+
+
+# ------------ drivers ------------
+def wsgi_request(application, path, query, cookie):
+    environ = {"PATH_INFO": path, "QUERY_STRING": query, "HTTP_COOKIE": cookie}
+    setup_testing_defaults(environ)
+    status = []
+
+    def start_response(line, headers, exc_info=None):
+        status.append(int(line.split(" ", 1)[0]))
+
+    body = application(environ, start_response)
+    try:
+        for _ in body:
+            pass
+    finally:
+        if hasattr(body, "close"):
+            body.close()
+    return status[0]
+
+
+async def asgi_request(application, path, query, cookie):
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET", "scheme": "http",
+        "path": path, "raw_path": path.encode(), "query_string": query.encode(), "root_path": "",
+        "headers": [(b"host", b"127.0.0.1"), (b"cookie", cookie.encode())],
+        "client": ("127.0.0.1", 50000), "server": ("127.0.0.1", 80),
+    }
+    done = asyncio.Event()
+    received = []
+    status = []
+
+    async def receive():
+        if not received:
+            received.append(True)
+            return {"type": "http.request", "body": b"", "more_body": False}
+        # the client stays connected until the response is complete
+        await done.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            status.append(message["status"])
+        elif message["type"] == "http.response.body" and not message.get("more_body"):
+            done.set()
+
+    await application(scope, receive, send)
+    done.set()
+    return status[0]
+
+
+class Run:
+    """Timings of one concurrency level."""
+
+    def __init__(self):
+        self.samples = []
+        self.peak_threads = 0
+        self._lock = threading.Lock()
+
+    def add(self, name, status, seconds):
+        with self._lock:
+            self.samples.append((name, status, seconds))
+            self.peak_threads = max(self.peak_threads, threading.active_count())
+
+
+def run_sync(application, requests, concurrency, run):
+    queue = deque(requests)
+
+    def worker():
+        while True:
+            try:
+                name, path, query, cookie = queue.popleft()
+            except IndexError:
+                return
+            started = time.perf_counter()
+            try:
+                status = wsgi_request(application, path, query, cookie)
+            except Exception:
+                status = 0
+            run.add(name, status, time.perf_counter() - started)
+
+    with ThreadPoolExecutor(concurrency) as pool:
+        for _ in range(concurrency):
+            pool.submit(worker)
+
+
+def run_async(application, requests, concurrency, run):
+    queue = deque(requests)
+
+    async def worker():
+        while queue:
+            name, path, query, cookie = queue.popleft()
+            started = time.perf_counter()
+            try:
+                status = await asgi_request(application, path, query, cookie)
+            except Exception:
+                status = 0
+            run.add(name, status, time.perf_counter() - started)
+
+    async def main():
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+
+    asyncio.run(main())
+
+
+# ------------ command ------------
+class Command(BaseCommand):
+    help = (
+        "Compare the read-heavy pages as sync views under WSGI with their async variants under "
+        "ASGI, at several concurrency levels. Each mode runs in a child process that calls "
+        "ehospitality.wsgi or ehospitality.asgi directly, without a network server, as the "
+        "synthetic users from generate_data."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--concurrency", default="1,10,50,100",
+                            help="Comma separated numbers of requests in flight (default 1,10,50,100).")
+        parser.add_argument("--requests", type=int, default=400, help="Requests per concurrency level.")
+        parser.add_argument("--db-latency-ms", type=float, default=0.0,
+                            help="Delay added to every SQL query, to stand in for a database on another host.")
+        parser.add_argument("--prefix", default="synth-", help="Username prefix of the users to act as.")
+        parser.add_argument("--seed", type=int, default=1)
+        parser.add_argument("--output", help="Also write the results as JSON to this file.")
+        parser.add_argument("--mode", choices=MODES, help="Run one mode in this process and print JSON (internal).")
+
+    def handle(self, *args, **options):
+        try:
+            levels = [int(n) for n in options["concurrency"].split(",")]
+        except ValueError:
+            raise CommandError("--concurrency takes numbers like 1,10,50.")
+        if min(levels) < 1 or options["requests"] < 1 or options["db_latency_ms"] < 0:
+            raise CommandError("--concurrency and --requests must be positive, --db-latency-ms not negative.")
+        if options["mode"]:
+            self.stdout.write(json.dumps(self.measure(options["mode"], levels, options)))
+            return
+
+        if settings.DEBUG:
+            self.stderr.write("DEBUG is on: every query is kept in memory; numbers will be worse than in production.")
+        if settings.PROFILING_ENABLED:
+            self.stderr.write(f"Profiling {settings.PROFILING_SAMPLE_RATE:.0%} of the requests adds to their latency.")
+        results = {mode: self.child(mode, options) for mode in MODES}
+        self.report(results, levels)
+        if options["output"]:
+            with open(options["output"], "w") as fh:
+                json.dump({
+                    "database": connections["default"].vendor,
+                    "options": {k: options[k] for k in ("concurrency", "requests", "db_latency_ms", "seed")},
+                    "results": results,
+                }, fh, indent=2)
+            self.stdout.write(f"results written to {options['output']}")
+
+    def child(self, mode, options):
+        argv = [
+            sys.executable, str(settings.BASE_DIR / "manage.py"), "benchmark_async_views", "--mode", mode,
+            "--concurrency", options["concurrency"], "--requests", str(options["requests"]),
+            "--db-latency-ms", str(options["db_latency_ms"]), "--prefix", options["prefix"],
+            "--seed", str(options["seed"]), "--verbosity", str(options["verbosity"]),
+        ]
+        # the URLconf picks sync or async views from ASYNC_VIEWS when it is imported
+        env = dict(os.environ, ASYNC_VIEWS="1" if mode == "async" else "0")
+        self.stdout.write(f"running {mode} views under {'ASGI' if mode == 'async' else 'WSGI'} ...")
+        done = subprocess.run(argv, env=env, stdout=subprocess.PIPE, text=True)
+        if done.returncode:
+            raise CommandError(f"the {mode} run failed")
+        return json.loads(done.stdout.strip().splitlines()[-1])
+
+    def requests(self, options):
+        rng = random.Random(options["seed"])
+        cookies = {}
+        engine = import_module(settings.SESSION_ENGINE)
+        for role in ("patient", "doctor"):
+            users = list(User.objects.filter(username__startswith=options["prefix"], role=role).order_by("id")[:200])
+            if not users:
+                raise CommandError(f"No {role} named {options['prefix']}*; run generate_data first.")
+            cookies[role] = []
+            for user in users:
+                session = engine.SessionStore()
+                session["user_id"] = user.id
+                session["role"] = user.role
+                session.save()
+                cookies[role].append(f"{settings.SESSION_COOKIE_NAME}={session.session_key}")
+        requests = []
+        for i in range(options["requests"]):
+            role, name, query = ENDPOINTS[i % len(ENDPOINTS)]
+            requests.append((name, reverse(name), query.format(term=rng.choice(SEARCH_TERMS)).replace(" ", "+"),
+                             rng.choice(cookies[role])))
+        rng.shuffle(requests)
+        return requests
+
+    def measure(self, mode, levels, options):
+        if settings.ASYNC_VIEWS != (mode == "async"):
+            raise CommandError("Run without --mode; it sets ASYNC_VIEWS for each child process.")
+        if mode == "async":
+            from ehospitality.asgi import application
+            runner = run_async
+        else:
+            from ehospitality.wsgi import application
+            runner = run_sync
+        # loading the application configured logging again; keep the request logs out of the report
+        for name in ("django.request", "accounts.profiling"):
+            logging.getLogger(name).disabled = options["verbosity"] < 2
+        latency = options["db_latency_ms"] / 1000
+        if latency:
+            def delay(execute, sql, params, many, context):
+                time.sleep(latency)
+                return execute(sql, params, many, context)
+
+            def add_delay(sender, connection, **kwargs):
+                if delay not in connection.execute_wrappers:
+                    connection.execute_wrappers.append(delay)
+
+            connection_created.connect(add_delay, weak=False)
+
+        requests = self.requests(options)
+        # connections, caches and templates are loaded before anything is timed
+        runner(application, requests[:len(ENDPOINTS) * 4], min(levels), Run())
+        results = []
+        for concurrency in levels:
+            run = Run()
+            started = time.perf_counter()
+            runner(application, requests, concurrency, run)
+            results.append(self.summarize(concurrency, run, time.perf_counter() - started))
+        return results
+
+    def summarize(self, concurrency, run, seconds):
+        times = sorted(s for _, _, s in run.samples)
+        endpoints = {}
+        for name in sorted({n for n, _, _ in run.samples}):
+            values = sorted(s for n, _, s in run.samples if n == name)
+            endpoints[name] = {"p50_ms": percentile(values, 50) * 1000, "p95_ms": percentile(values, 95) * 1000}
+        return {
+            "concurrency": concurrency,
+            "requests": len(times),
+            "errors": sum(1 for _, status, _ in run.samples if status != 200),
+            "rps": len(times) / seconds,
+            "p50_ms": percentile(times, 50) * 1000,
+            "p95_ms": percentile(times, 95) * 1000,
+            "p99_ms": percentile(times, 99) * 1000,
+            "peak_threads": run.peak_threads,
+            "endpoints": endpoints,
+        }
+
+    def report(self, results, levels):
+        self.stdout.write(f"\n{'in flight':>9}  {'mode':<6}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}"
+                          f"{'errors':>8}{'threads':>9}")
+        for i, concurrency in enumerate(levels):
+            for mode in MODES:
+                r = results[mode][i]
+                self.stdout.write(f"{concurrency:>9}  {mode:<6}{r['rps']:>9.1f}{r['p50_ms']:>9.1f}{r['p95_ms']:>9.1f}"
+                                  f"{r['p99_ms']:>9.1f}{r['errors']:>8}{r['peak_threads']:>9}")
+        top = {mode: results[mode][-1]["endpoints"] for mode in MODES}
+        self.stdout.write(f"\np95 ms per page at {levels[-1]} in flight:")
+        for name in top["sync"]:
+            sync, other = top["sync"][name]["p95_ms"], top["async"].get(name, {}).get("p95_ms")
+            change = f"{(other - sync) / sync * 100:+.0f}%" if other is not None and sync else "n/a"
+            self.stdout.write(f"  {name:<28}{sync:>9.1f}{other or 0:>9.1f}  {change}")
+        errors = sum(r["errors"] for mode in MODES for r in results[mode])
+        if errors:
+            self.stdout.write(self.style.WARNING(f"{errors} requests did not answer 200; see the errors column."))
@@ -0,0 +1,45 @@
+import logging
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from accounts import querybudgets
+
+
+class Command(BaseCommand):
+    help = (
+        "Request every page of the accounts, patient, doctor and adminpanel apps at several "
+        "data volumes and fail if a view exceeds its query budget or its query count grows "
+        "with the number of rows. Runs against a throwaway test database; `manage.py test "
+        "accounts` runs the same check."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--volumes", default="5,40",
+            help="Comma separated rows per table to seed, smallest first (default 5,40).",
+        )
+        parser.add_argument("--report", default="query-budgets.json", help="Where to write the JSON report.")
+
+    def handle(self, *args, **options):
+        volumes = sorted(int(v) for v in options["volumes"].split(","))
+        # the request profiles would repeat what this command prints
+        logging.getLogger("accounts.profiling").disabled = options["verbosity"] < 2
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            results = querybudgets.BudgetRun(log=self.stdout.write).run(volumes)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        querybudgets.write_report(options["report"], volumes, results)
+        failures = querybudgets.failure_lines(results)
+        for line in failures:
+            self.stderr.write(line)
+        self.stdout.write(f"report written to {options['report']}")
+        over = sum(1 for r in results if r["failures"])
+        if over:
+            raise CommandError(f"{over} of {len(results)} views are over budget.")
+        self.stdout.write(self.style.SUCCESS(f"All {len(results)} views are within budget."))
@@ -0,0 +1,428 @@
+import http.client
+import json
+import logging
+import random
+import subprocess
+import threading
+import time
+from collections import Counter
+from datetime import timedelta
+from http.cookies import SimpleCookie
+from urllib.parse import urlencode, urlsplit
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.core.servers.basehttp import ThreadedWSGIServer, WSGIRequestHandler
+from django.db import connection
+from django.urls import reverse
+from django.utils import timezone
+
+from accounts.models import User
+
+ROLES = ("patient", "doctor", "admin")
+SEARCH_TERMS = ("diabetes", "fever", "heart", "diet", "asthma", "vaccination", "blood pressure", "sleep")
+
+
+# ------------ server ------------
+def count_queries(application):
+    """Wrap a WSGI application so every response carries the number of SQL queries it ran."""
+    def app(environ, start_response):
+        queries = [0]
+
+        def count(execute, sql, params, many, context):
+            queries[0] += 1
+            return execute(sql, params, many, context)
+
+        def start(status, headers, exc_info=None):
+            return start_response(status, headers + [("X-Query-Count", str(queries[0]))], exc_info)
+
+        with connection.execute_wrapper(count):
+            return application(environ, start)
+    return app
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+class Server(ThreadedWSGIServer):
+    # the socketserver default backlog of 5 turns a burst of users into refused connections
+    request_queue_size = 1024
+
+
+def start_server(port=0):
+    from ehospitality.wsgi import application
+
+    server = Server(("127.0.0.1", port), QuietHandler, allow_reuse_address=True)
+    server.set_app(count_queries(application))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+# ------------ virtual users ------------
+class Recorder:
+    """Collects (endpoint, status, seconds, queries) samples of the running stage."""
+
+    def __init__(self):
+        self.samples = []
+        self.events = Counter()
+        self._lock = threading.Lock()
+
+    def add(self, name, status, seconds, queries):
+        with self._lock:
+            self.samples.append((name, status, seconds, queries))
+
+    def event(self, name):
+        with self._lock:
+            self.events[name] += 1
+
+
+class LoginFailed(Exception):
+    pass
+
+
+class Browser:
+    """One virtual user's HTTP/1.1 keep-alive connection and cookie jar."""
+
+    def __init__(self, port, recorder):
+        self.port = port
+        self.recorder = recorder
+        self.cookies = {}
+        self.conn = None
+
+    def close(self):
+        if self.conn:
+            self.conn.close()
+            self.conn = None
+
+    def _send(self, method, path, body, headers):
+        for attempt in (1, 2):
+            if self.conn is None:
+                self.conn = http.client.HTTPConnection("127.0.0.1", self.port, timeout=60)
+            try:
+                self.conn.request(method, path, body, headers)
+                response = self.conn.getresponse()
+                return response, response.read()
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                # the server closed an idle keep-alive connection; retry once on a new one
+                self.close()
+                if attempt == 2:
+                    raise
+
+    def request(self, method, path, name, data=None):
+        headers = {}
+        if self.cookies:
+            headers["Cookie"] = "; ".join(f"{k}={v}" for k, v in self.cookies.items())
+        body = None
+        if data is not None:
+            data = dict(data, csrfmiddlewaretoken=self.cookies.get(settings.CSRF_COOKIE_NAME, ""))
+            body = urlencode(data)
+            headers["Content-Type"] = "application/x-www-form-urlencoded"
+        started = time.perf_counter()
+        try:
+            response, content = self._send(method, path, body, headers)
+        except (OSError, http.client.HTTPException):
+            self.close()
+            self.recorder.add(name, 0, time.perf_counter() - started, None)
+            return None
+        elapsed = time.perf_counter() - started
+        for value in response.headers.get_all("Set-Cookie") or ():
+            cookie = SimpleCookie()
+            cookie.load(value)
+            for key, morsel in cookie.items():
+                if morsel.value and morsel["max-age"] != "0":
+                    self.cookies[key] = morsel.value
+                else:
+                    self.cookies.pop(key, None)
+        queries = response.getheader("X-Query-Count")
+        self.recorder.add(name, response.status, elapsed, int(queries) if queries else None)
+        response.content = content
+        return response
+
+    def get(self, name, *args, query=""):
+        return self.request("GET", reverse(name, args=args) + query, name)
+
+    def post(self, name, data, *args):
+        return self.request("POST", reverse(name, args=args), name, data)
+
+    def login(self, username, password):
+        self.get("accounts:login")
+        response = self.post("accounts:login", {"username": username, "password": password})
+        if response is None or response.status != 302:
+            raise LoginFailed(username)
+
+
+def patient_journey(browser, rng, options):
+    browser.get("patient:patient_dashboard")
+    browser.get("patient:resources")
+    browser.get("patient:resources", query="?" + urlencode({"q": rng.choice(SEARCH_TERMS)}))
+    browser.get("patient:book_appointment")
+    if options["read_only"]:
+        return
+    response = browser.get("patient:find_slots_feed", query="?days=14&limit=20")
+    if response is None or response.status != 200:
+        return
+    free = json.loads(response.content)["slots"]
+    if not free:
+        browser.recorder.event("no free slot")
+        return
+    slot = rng.choice(free)
+    response = browser.post("patient:book_appointment", {"doctor": slot["doctor_id"], "date": slot["date"],
+                                                         "time": slot["time"]})
+    if response is None or response.status != 302:
+        # someone else took the slot between the search and the booking
+        browser.recorder.event("slot taken")
+        return
+    hold_id = int(urlsplit(response.getheader("Location")).path.rstrip("/").rsplit("/", 1)[1])
+    response = browser.post("patient:confirm_appointment", {"action": "confirm"}, hold_id)
+    browser.recorder.event("booked" if response is not None and response.status == 302 else "confirm failed")
+
+
+def doctor_journey(browser, rng, options):
+    browser.get("doctor:dashboard")
+    browser.get("doctor:appointments_list")
+    day = timezone.localdate() + timedelta(days=rng.randrange(1, 7))
+    browser.get("doctor:appointments_list", query=f"?date={day.isoformat()}")
+
+
+def admin_journey(browser, rng, options):
+    browser.get("adminpanel:admin_dashboard")
+    browser.get("adminpanel:manage_appointments")
+
+
+JOURNEYS = {"patient": patient_journey, "doctor": doctor_journey, "admin": admin_journey}
+
+
+# ------------ reporting ------------
+def percentile(values, p):
+    """Nearest-rank percentile of sorted ``values``."""
+    if not values:
+        return None
+    return values[max(0, min(len(values) - 1, int(round(p / 100 * len(values) + 0.5)) - 1))]
+
+
+def summarize(samples, seconds):
+    by_name = {}
+    for name, status, elapsed, queries in samples:
+        by_name.setdefault(name, []).append((status, elapsed, queries))
+    endpoints = {}
+    for name, rows in sorted(by_name.items()):
+        latencies = sorted(elapsed for _, elapsed, _ in rows)
+        queries = [q for _, _, q in rows if q is not None]
+        endpoints[name] = {
+            "requests": len(rows),
+            "errors": sum(1 for status, _, _ in rows if not status or status >= 400),
+            "rps": round(len(rows) / seconds, 2),
+            "mean_ms": round(sum(latencies) / len(latencies) * 1000, 2),
+            "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+            "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+            "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+            "max_ms": round(latencies[-1] * 1000, 2),
+            "queries": round(sum(queries) / len(queries), 1) if queries else None,
+        }
+    latencies = sorted(elapsed for _, _, elapsed, _ in samples)
+    errors = sum(e["errors"] for e in endpoints.values())
+    return {
+        "requests": len(samples),
+        "errors": errors,
+        "error_rate": round(errors / len(samples), 4) if samples else 0,
+        "rps": round(len(samples) / seconds, 2),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2) if latencies else None,
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2) if latencies else None,
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2) if latencies else None,
+        "endpoints": endpoints,
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True, cwd=settings.BASE_DIR,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = (
+        "Load test the app over HTTP: start ehospitality.wsgi in a local threaded WSGI server, "
+        "run patient, doctor and admin virtual users through scripted journeys in stages of "
+        "increasing concurrency, and report latency percentiles, throughput and SQL queries per "
+        "endpoint. Uses the configured database and its users (see generate_data); patient "
+        "journeys book appointments unless --read-only."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", default="5,10,25,50", help="Concurrent virtual users per stage, comma separated.")
+        parser.add_argument("--duration", type=float, default=20.0, help="Seconds per stage.")
+        parser.add_argument("--mix", default="patient=7,doctor=2,admin=1", help="Share of virtual users per role.")
+        parser.add_argument("--think", type=float, default=0.0, help="Seconds a user pauses between journeys.")
+        parser.add_argument("--prefix", default="synth-", help="Only log in as users whose username starts with this.")
+        parser.add_argument("--password", default="synthetic", help="Password of those users.")
+        parser.add_argument("--read-only", action="store_true", help="Do not book appointments.")
+        parser.add_argument("--slo-ms", type=float, default=1000.0,
+                            help="A stage whose p95 exceeds this (or with over 1%% errors) is over capacity.")
+        parser.add_argument("--seed", type=int, default=1)
+        parser.add_argument("--port", type=int, default=0, help="Port to serve on; a free one by default.")
+        parser.add_argument("--output", default="loadtest.json", help="Where to write the JSON results.")
+        parser.add_argument("--compare", help="Earlier JSON results to compare against.")
+
+    def handle(self, *args, **options):
+        try:
+            stages = [int(n) for n in options["users"].split(",")]
+            mix = {role: float(share) for role, share in (item.split("=") for item in options["mix"].split(","))}
+        except ValueError:
+            raise CommandError("--users takes numbers like 5,10,25 and --mix pairs like patient=7,doctor=2.")
+        if set(mix) - set(ROLES) or not sum(mix.values()) or min(stages) < 1 or options["duration"] <= 0:
+            raise CommandError(f"--mix roles are {', '.join(ROLES)}; --users and --duration must be positive.")
+        baseline = None
+        if options["compare"]:
+            with open(options["compare"]) as fh:
+                baseline = json.load(fh)
+        if settings.DEBUG:
+            self.stderr.write("DEBUG is on: every query is kept in memory and error pages are slow; "
+                              "numbers will be worse than in production.")
+        if settings.PROFILING_ENABLED:
+            self.stderr.write(f"Profiling {settings.PROFILING_SAMPLE_RATE:.0%} of the requests adds to their latency.")
+
+        accounts = self.accounts(mix, options)
+        server = start_server(options["port"])
+        # server errors are counted per endpoint; their tracebacks and the
+        # request profiles are only logged with -v 2
+        for name in ("django.request", "accounts.profiling"):
+            logging.getLogger(name).disabled = options["verbosity"] < 2
+        port = server.server_address[1]
+        self.stdout.write(f"serving ehospitality.wsgi on http://127.0.0.1:{port}/")
+        results = []
+        try:
+            for users in stages:
+                result = self.stage(port, users, mix, accounts, options)
+                results.append(result)
+                self.report(result, options)
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        tipped = next((r["users"] for r in results if r["over_capacity"]), None)
+        report = {
+            "commit": _git_commit(),
+            "started": timezone.now().isoformat(),
+            "database": connection.vendor,
+            "debug": settings.DEBUG,
+            "profiling_sample_rate": settings.PROFILING_SAMPLE_RATE if settings.PROFILING_ENABLED else 0,
+            "options": {k: options[k] for k in ("users", "duration", "mix", "think", "read_only", "slo_ms", "seed")},
+            "over_capacity_at": tipped,
+            "stages": results,
+        }
+        with open(options["output"], "w") as fh:
+            json.dump(report, fh, indent=2)
+        self.stdout.write(f"results written to {options['output']}")
+        if baseline:
+            self.compare(baseline, report)
+        if tipped:
+            self.stdout.write(self.style.WARNING(f"Over capacity from {tipped} concurrent users."))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"Within --slo-ms {options['slo_ms']:.0f} at every stage."))
+
+    def accounts(self, mix, options):
+        """Usernames to log in as, per role."""
+        accounts = {}
+        for role in mix:
+            if role == "admin":
+                # the generated data has no admin; make one the virtual admins can share
+                username = f"{options['prefix']}admin"
+                if not User.objects.filter(username=username).exists():
+                    User.objects.create(username=username, role="admin", password=make_password(options["password"]))
+            accounts[role] = list(
+                User.objects.filter(role=role, username__startswith=options["prefix"])
+                .order_by("id").values_list("username", flat=True)[:5000]
+            )
+            if mix[role] and not accounts[role]:
+                raise CommandError(
+                    f"No {role} users named {options['prefix']}*; run generate_data first or pass --prefix."
+                )
+        connection.close()
+        return accounts
+
+    def stage(self, port, users, mix, accounts, options):
+        rng = random.Random(f"{options['seed']}:{users}")
+        roles = rng.choices(list(mix), list(mix.values()), k=users)
+        recorder = Recorder()
+        deadline = time.monotonic() + options["duration"]
+        failures = Counter()
+
+        def virtual_user(role, user_rng):
+            browser = Browser(port, recorder)
+            try:
+                browser.login(user_rng.choice(accounts[role]), options["password"])
+                while time.monotonic() < deadline:
+                    JOURNEYS[role](browser, user_rng, options)
+                    if options["think"]:
+                        time.sleep(options["think"])
+            except LoginFailed:
+                failures["login failed"] += 1
+            finally:
+                browser.close()
+
+        started = time.monotonic()
+        threads = [
+            threading.Thread(target=virtual_user, args=(role, random.Random(rng.random())), daemon=True)
+            for role in roles
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        seconds = time.monotonic() - started
+
+        result = {"users": users, "roles": dict(Counter(roles)), "seconds": round(seconds, 2)}
+        result.update(summarize(recorder.samples, seconds))
+        result["events"] = dict(recorder.events + failures)
+        result["over_capacity"] = bool(
+            result["error_rate"] > 0.01 or (result["p95_ms"] or 0) > options["slo_ms"] or failures
+        )
+        return result
+
+    def report(self, result, options):
+        self.stdout.write(
+            f"\n{result['users']} users: {result['requests']} requests in {result['seconds']}s, "
+            f"{result['rps']} req/s, p50 {result['p50_ms']} ms, p95 {result['p95_ms']} ms, "
+            f"p99 {result['p99_ms']} ms, {result['errors']} errors"
+            + (f", {result['events']}" if result["events"] else "")
+        )
+        self.stdout.write(f"  {'endpoint':<36}{'req':>7}{'req/s':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'queries':>9}{'err':>6}")
+        for name, e in result["endpoints"].items():
+            self.stdout.write(
+                f"  {name:<36}{e['requests']:>7}{e['rps']:>9}{e['p50_ms']:>9}{e['p95_ms']:>9}{e['p99_ms']:>9}"
+                f"{e['queries'] if e['queries'] is not None else '-':>9}{e['errors']:>6}"
+            )
+        if result["over_capacity"]:
+            self.stdout.write(self.style.WARNING(f"  over capacity (--slo-ms {options['slo_ms']:.0f})"))
+
+    def compare(self, baseline, report):
+        self.stdout.write(f"\ncompared with {baseline.get('commit') or 'baseline'} (p95 ms, req/s):")
+        old_stages = {s["users"]: s for s in baseline.get("stages", [])}
+
+        def change(new, old):
+            if new is None or not old:
+                return "      -"
+            return f"{(new - old) / old * 100:+6.0f}%"
+
+        for stage in report["stages"]:
+            old = old_stages.get(stage["users"])
+            if not old:
+                continue
+            self.stdout.write(
+                f"{stage['users']} users: p95 {old['p95_ms']} -> {stage['p95_ms']} ({change(stage['p95_ms'], old['p95_ms'])}), "
+                f"req/s {old['rps']} -> {stage['rps']} ({change(stage['rps'], old['rps'])})"
+            )
+            for name, e in stage["endpoints"].items():
+                before = old["endpoints"].get(name)
+                if before:
+                    self.stdout.write(
+                        f"  {name:<36} p95 {change(e['p95_ms'], before['p95_ms'])}  "
+                        f"req/s {change(e['rps'], before['rps'])}  queries {before['queries']} -> {e['queries']}"
+                    )
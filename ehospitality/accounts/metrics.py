@@ -0,0 +1,308 @@
+"""
+Prometheus metrics, served as text at /metrics.
+
+MetricsMiddleware (accounts.middleware) counts every request by resolved URL
+name, method and status. It also records each request's latency, its number
+of SQL queries and each query's latency as histograms. The booking flow adds
+bookings and lost slot races. The gauges (unpaid bills, active sessions,
+live slot holds, queued payment jobs) are read from the database when
+/metrics is scraped, e.g.
+
+    histogram_quantile(0.95, sum by (le) (rate(
+        ehospitality_http_request_duration_seconds_bucket{view="patient:book_appointment"}[5m])))
+
+    rate(ehospitality_bookings_total[5m]) * 60
+
+Each thread writes to its own shard of plain dicts, so recording never takes
+a lock; a scrape copies the shards, folding in those of finished threads. A
+scrape can see a request in a histogram bucket a moment before its sum.
+
+Under a pre-fork server every worker has its own shards. Set
+METRICS_MULTIPROCESS_DIR to a directory the workers share. Each worker then
+writes its totals there at most every METRICS_FLUSH_SECONDS, and /metrics
+adds up the files of all workers, including those that have exited. Empty
+the directory when the server is restarted.
+"""
+import atexit
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.contrib.sessions.models import Session
+from django.db import connections
+from django.db.models import Sum
+from django.utils import timezone
+
+PREFIX = "ehospitality_"
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89)
+QUERY_LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1)
+METHODS = {"GET", "HEAD", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"}
+
+# name -> (type, help[, buckets])
+METRICS = {
+    "http_requests_total": ("counter", "Requests by URL name, method and status."),
+    "http_errors_total": ("counter", "Requests answered with a 5xx status, by URL name."),
+    "http_request_duration_seconds": ("histogram", "Request latency by URL name.", LATENCY_BUCKETS),
+    "db_queries_per_request": ("histogram", "SQL queries run by one request, by URL name.", QUERY_COUNT_BUCKETS),
+    "db_query_duration_seconds": ("histogram", "Latency of single SQL queries.", QUERY_LATENCY_BUCKETS),
+    "bookings_total": ("counter", "Appointments booked through the confirm step."),
+    "booking_conflicts_total": ("counter", "Slots lost to another patient (IntegrityError), by booking step."),
+    "agenda_cache_hits_total": ("counter", "Doctor agenda days served from the cache."),
+    "agenda_cache_misses_total": ("counter", "Doctor agenda days read from the database."),
+    "unpaid_bills": ("gauge", "Bills not paid yet."),
+    "unpaid_amount": ("gauge", "Total of the unpaid bills."),
+    "active_sessions": ("gauge", "Unexpired sessions in the session table."),
+    "slot_holds": ("gauge", "Slots held on the confirm step right now."),
+    "payment_jobs_pending": ("gauge", "Checkout-session jobs queued or running."),
+}
+
+
+class _Shard:
+    __slots__ = ("thread", "counters", "histograms")
+
+    def __init__(self, thread=None):
+        self.thread = thread
+        self.counters = {}
+        # (name, labels) -> [count per bucket..., count above the last bucket, sum]
+        self.histograms = {}
+
+    def merge(self, counters, histograms):
+        for key, value in counters.items():
+            self.counters[key] = self.counters.get(key, 0) + value
+        for key, values in histograms.items():
+            mine = self.histograms.get(key)
+            if mine is None:
+                self.histograms[key] = list(values)
+            else:
+                for i, value in enumerate(values):
+                    mine[i] += value
+
+
+_local = threading.local()
+_shards = []
+_retired = _Shard()
+_lock = threading.Lock()
+_last_flush = 0.0
+_snapshot_file = (None, None)
+
+
+def _retire_finished():
+    # a finished thread writes no more; keep its numbers in one place.
+    # Called with _lock held, on scrape and whenever a thread starts recording,
+    # so a server that spawns a thread per request keeps one shard per live thread
+    for shard in [s for s in _shards if not s.thread.is_alive()]:
+        _retired.merge(shard.counters, shard.histograms)
+        _shards.remove(shard)
+
+
+def _shard():
+    try:
+        return _local.shard
+    except AttributeError:
+        shard = _local.shard = _Shard(threading.current_thread())
+        with _lock:
+            _retire_finished()
+            _shards.append(shard)
+        return shard
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+def inc(name, amount=1, **labels):
+    counters = _shard().counters
+    key = _key(name, labels)
+    counters[key] = counters.get(key, 0) + amount
+
+
+def observe(name, value, **labels):
+    histograms = _shard().histograms
+    key = _key(name, labels)
+    buckets = METRICS[name][2]
+    values = histograms.get(key)
+    if values is None:
+        values = histograms[key] = [0] * (len(buckets) + 2)
+    values[bisect_left(buckets, value)] += 1
+    values[-1] += value
+
+
+# ------------ requests ------------
+@contextmanager
+def counting_queries(databases=None):
+    """Observe the latency of every query run in the block; yields [query count]."""
+    count = [0]
+    # accounts.asyncdb runs this wrapper on several threads at once
+    lock = threading.Lock()
+
+    def execute(execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            with lock:
+                count[0] += 1
+            observe("db_query_duration_seconds", time.perf_counter() - started)
+
+    with ExitStack() as stack:
+        for conn in connections.all() if databases is None else databases:
+            stack.enter_context(conn.execute_wrapper(execute))
+        yield count
+
+
+def request_done(request, response, seconds, queries):
+    match = request.resolver_match
+    # unresolved paths share one label, so random URLs cannot blow up the series count
+    view = match.view_name if match else "unmatched"
+    method = request.method if request.method in METHODS else "other"
+    inc("http_requests_total", view=view, method=method, status=str(response.status_code))
+    if response.status_code >= 500:
+        inc("http_errors_total", view=view)
+    observe("http_request_duration_seconds", seconds, view=view)
+    observe("db_queries_per_request", queries, view=view)
+    if settings.METRICS_MULTIPROCESS_DIR and time.monotonic() - _last_flush >= settings.METRICS_FLUSH_SECONDS:
+        flush()
+
+
+# ------------ collection ------------
+def _process_counters():
+    from doctor import agenda
+
+    stats = agenda.stats()
+    return {
+        ("agenda_cache_hits_total", ()): stats["hits"],
+        ("agenda_cache_misses_total", ()): stats["misses"],
+    }
+
+
+def snapshot():
+    """(counters, histograms) of this process."""
+    total = _Shard()
+    with _lock:
+        _retire_finished()
+        live = list(_shards)
+        total.merge(_retired.counters, _retired.histograms)
+    for shard in live:
+        total.merge(shard.counters.copy(), {k: list(v) for k, v in shard.histograms.copy().items()})
+    total.merge(_process_counters(), {})
+    return total.counters, total.histograms
+
+
+def _encode(mapping):
+    return [[name, list(map(list, labels)), value] for (name, labels), value in mapping.items()]
+
+
+def _decode(rows):
+    return {(name, tuple(map(tuple, labels))): value for name, labels, value in rows}
+
+
+def flush():
+    """Write this process's totals to METRICS_MULTIPROCESS_DIR."""
+    global _last_flush, _snapshot_file
+    _last_flush = time.monotonic()
+    pid = os.getpid()
+    if _snapshot_file[0] != pid:
+        # the start time tells a recycled pid from the process that had it before
+        _snapshot_file = (pid, os.path.join(settings.METRICS_MULTIPROCESS_DIR, f"{pid}-{time.time_ns()}.json"))
+    counters, histograms = snapshot()
+    path = _snapshot_file[1]
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{threading.get_ident()}.tmp"
+    with open(tmp, "w") as fh:
+        json.dump({"counters": _encode(counters), "histograms": _encode(histograms)}, fh)
+    os.replace(tmp, path)
+
+
+def _flush_at_exit():
+    if settings.METRICS_ENABLED and settings.METRICS_MULTIPROCESS_DIR:
+        flush()
+
+
+atexit.register(_flush_at_exit)
+
+
+def collect():
+    """(counters, histograms) of this process, or of every worker in multiprocess mode."""
+    directory = settings.METRICS_MULTIPROCESS_DIR
+    if not directory:
+        return snapshot()
+    flush()
+    total = _Shard()
+    for name in sorted(os.listdir(directory)):
+        if not name.endswith(".json"):
+            continue
+        try:
+            with open(os.path.join(directory, name)) as fh:
+                data = json.load(fh)
+        except (OSError, ValueError):
+            continue
+        total.merge(_decode(data["counters"]), _decode(data["histograms"]))
+    return total.counters, total.histograms
+
+
+def gauges():
+    from adminpanel.models import PatientBalance
+    from patient.models import PaymentJob, SlotHold
+
+    now = timezone.now()
+    unpaid = PatientBalance.objects.aggregate(count=Sum("unpaid_count"), amount=Sum("outstanding"))
+    values = {
+        "unpaid_bills": unpaid["count"] or 0,
+        "unpaid_amount": unpaid["amount"] or 0,
+        "slot_holds": SlotHold.objects.filter(expires_at__gt=now).count(),
+        "payment_jobs_pending": PaymentJob.objects.filter(status__in=("queued", "running")).count(),
+    }
+    # signed-cookie sessions (accounts.sessions) are not stored anywhere to count
+    if settings.SESSION_ENGINE == "django.contrib.sessions.backends.db":
+        values["active_sessions"] = Session.objects.filter(expire_date__gt=now).count()
+    return {(name, ()): value for name, value in values.items()}
+
+
+# ------------ exposition ------------
+def _number(value):
+    if isinstance(value, int):
+        return str(value)
+    return repr(float(value))
+
+
+def _labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", r"\\").replace("\n", r"\n").replace('"', r"\"") for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+def render():
+    """All metrics in the Prometheus text exposition format."""
+    counters, histograms = collect()
+    values = dict(counters)
+    values.update(gauges())
+    series = {}
+    for (name, labels), value in values.items():
+        series.setdefault(name, []).append((labels, value))
+    for (name, labels), value in histograms.items():
+        series.setdefault(name, []).append((labels, value))
+
+    lines = []
+    for name, spec in METRICS.items():
+        kind, help_text = spec[0], spec[1]
+        full = PREFIX + name
+        lines.append(f"# HELP {full} {help_text}")
+        lines.append(f"# TYPE {full} {kind}")
+        for labels, value in sorted(series.get(name, ()), key=lambda item: item[0]):
+            if kind != "histogram":
+                lines.append(f"{full}{_labels(labels)} {_number(value)}")
+                continue
+            cumulative = 0
+            for bound, count in zip(spec[2] + ("+Inf",), value[:-1]):
+                cumulative += count
+                lines.append(f"{full}_bucket{_labels(labels, [('le', bound)])} {cumulative}")
+            lines.append(f"{full}_sum{_labels(labels)} {_number(value[-1])}")
+            lines.append(f"{full}_count{_labels(labels)} {cumulative}")
+    return "\n".join(lines) + "\n"
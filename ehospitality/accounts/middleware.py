@@ -0,0 +1,166 @@
+import random
+import time
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed, SynchronousOnlyOperation
+from django.db import connections
+from django.utils.deprecation import MiddlewareMixin
+from django.utils.functional import cached_property
+
+from doctor.models import DoctorProfile
+from patient.models import PatientProfile
+from . import metrics, profiling
+from .models import User
+
+
+class SessionIdentity:
+    """
+    The user stored in ``session['user_id']`` by login_view, with the matching
+    patient/doctor profile. Everything is loaded on first access, in one query.
+    Async views use auser()/apatient()/adoctor() instead of the properties.
+    """
+
+    def __init__(self, session):
+        self.user_id = session.get("user_id")
+
+    @cached_property
+    def user(self):
+        if not self.user_id:
+            return None
+        with profiling.phase("identity"):
+            return (
+                User.objects.select_related("patientprofile", "doctor_profile")
+                .filter(pk=self.user_id)
+                .first()
+            )
+
+    @property
+    def role(self):
+        return self.user.role if self.user else None
+
+    @cached_property
+    def patient(self):
+        if self.role != "patient":
+            return None
+        try:
+            return self.user.patientprofile
+        except PatientProfile.DoesNotExist:
+            return PatientProfile.objects.create(user=self.user)
+
+    @cached_property
+    def doctor(self):
+        if self.role != "doctor":
+            return None
+        try:
+            return self.user.doctor_profile
+        except DoctorProfile.DoesNotExist:
+            return DoctorProfile.objects.create(user=self.user)
+
+
+    async def auser(self):
+        if "user" not in self.__dict__:
+            user = None
+            if self.user_id:
+                with profiling.phase("identity"):
+                    user = await (
+                        User.objects.select_related("patientprofile", "doctor_profile")
+                        .filter(pk=self.user_id)
+                        .afirst()
+                    )
+            self.__dict__["user"] = user
+        return self.user
+
+    async def apatient(self):
+        await self.auser()
+        return await self._aprofile("patient")
+
+    async def adoctor(self):
+        await self.auser()
+        return await self._aprofile("doctor")
+
+    async def _aprofile(self, name):
+        try:
+            # the profile came joined to the user
+            return getattr(self, name)
+        except SynchronousOnlyOperation:
+            # it is missing and has to be created
+            return await sync_to_async(getattr)(self, name)
+
+
+class SessionIdentityMiddleware(MiddlewareMixin):
+    """Puts a lazily resolved SessionIdentity on ``request.identity``."""
+
+    def process_request(self, request):
+        # loads the session; in async requests MiddlewareMixin runs this on the request's thread
+        with profiling.phase("identity"):
+            request.identity = SessionIdentity(request.session)
+
+
+# the two below run in either mode; under ASGI they take the request's
+# connections from its thread, since creating them on the event loop
+# thread would tie them to it
+class ProfilingMiddleware(MiddlewareMixin):
+    """
+    Times a sample of the requests by phase; see accounts.profiling. Goes first
+    in MIDDLEWARE so the total covers the whole stack, and is left out of it
+    unless PROFILING_ENABLED is set.
+    """
+
+    def __init__(self, get_response):
+        if not settings.PROFILING_ENABLED:
+            raise MiddlewareNotUsed
+        super().__init__(get_response)
+        profiling.install()
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if random.random() >= settings.PROFILING_SAMPLE_RATE:
+            return self.get_response(request)
+        with profiling.Profile(request).running() as profile:
+            response = self.get_response(request)
+            profile.view_finished()
+        profile.finish(response)
+        return response
+
+    async def __acall__(self, request):
+        if random.random() >= settings.PROFILING_SAMPLE_RATE:
+            return await self.get_response(request)
+        databases = await sync_to_async(connections.all)()
+        with profiling.Profile(request, is_async=True).running(databases) as profile:
+            response = await self.get_response(request)
+            profile.view_finished()
+        profile.finish(response)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        profile = profiling.current()
+        if profile is not None:
+            profile.view_started(request.resolver_match.view_name)
+
+
+class MetricsMiddleware(MiddlewareMixin):
+    """Feeds the request metrics served at /metrics; see accounts.metrics."""
+
+    def __init__(self, get_response):
+        if not settings.METRICS_ENABLED:
+            raise MiddlewareNotUsed
+        super().__init__(get_response)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        started = time.perf_counter()
+        with metrics.counting_queries() as queries:
+            response = self.get_response(request)
+        metrics.request_done(request, response, time.perf_counter() - started, queries[0])
+        return response
+
+    async def __acall__(self, request):
+        started = time.perf_counter()
+        databases = await sync_to_async(connections.all)()
+        with metrics.counting_queries(databases) as queries:
+            response = await self.get_response(request)
+        metrics.request_done(request, response, time.perf_counter() - started, queries[0])
+        return response
@@ -7,7 +7,9 @@ class User(AbstractUser):
         ('doctor', 'Doctor'),
         ('patient', 'Patient'),
     ]
-    role = models.CharField(max_length=20, choices=ROLE_CHOICES, default='patient')
+    role = models.CharField(max_length=20, choices=ROLE_CHOICES, default='patient', db_index=True)
+    # bumped on logout to revoke signed-cookie sessions (see accounts.sessions)
+    session_epoch = models.PositiveIntegerField(default=0)
 
     def is_patient(self):
         return self.role == 'patient'
@@ -0,0 +1,229 @@
+"""
+Per-request profiling.
+
+ProfilingMiddleware (accounts.middleware) samples PROFILING_SAMPLE_RATE of
+the requests and times them in phases:
+
+    identity  session load and the SessionIdentity user query
+    view      the view and the response middleware after it
+    db        every SQL query, with the slowest one and the line that ran it
+    template  template rendering (lazy querysets evaluated there included)
+
+The phases overlap (db time is also view or template time). They go out as a
+Server-Timing header, which the browser devtools show under Timing, and as
+one JSON line on the ``accounts.profiling`` logger. A request slower than
+PROFILING_SLOW_MS arms a cProfile capture of the next sampled request to the
+same view, written to PROFILING_DIR when it is set; each view is captured at
+most once per PROFILING_CAPTURE_INTERVAL seconds.
+
+A streaming response is timed only up to its first byte, and async
+requests are never captured with cProfile.
+"""
+import cProfile
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+PHASES = ("identity", "view", "db", "template")
+SQL_CHARS = 500
+
+_current = ContextVar("profile", default=None)
+_armed = set()
+_captured = {}
+_lock = threading.Lock()
+
+
+def current():
+    return _current.get()
+
+
+@contextmanager
+def phase(name):
+    """Add the time spent in the block to ``name`` of the running profile, if any."""
+    profile = _current.get()
+    if profile is None or profile.depth[name]:
+        # not sampled, or nested in the same phase, which is already being timed
+        yield
+        return
+    profile.depth[name] += 1
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        profile.timings[name] += time.perf_counter() - started
+        profile.depth[name] -= 1
+
+
+def _origin():
+    """The project line that ran the current query, as ``path:line in function``."""
+    frame = sys._getframe(2)
+    root = str(settings.BASE_DIR) + os.sep
+    orm = os.sep + os.path.join("django", "db") + os.sep
+    in_orm = False
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if orm in filename:
+            # frames before the ORM are execute wrappers; the caller comes after it
+            in_orm = True
+        elif in_orm and filename.startswith(root) and "site-packages" not in filename and filename != __file__:
+            return f"{os.path.relpath(filename, root)}:{frame.f_lineno} in {frame.f_code.co_name}"
+        frame = frame.f_back
+    return None
+
+
+class Profile:
+    def __init__(self, request, is_async=False):
+        self.request = request
+        self.is_async = is_async
+        self.started = time.perf_counter()
+        self.timings = defaultdict(float)
+        self.depth = Counter()
+        self.queries = 0
+        self.slowest = None
+        self.view_name = None
+        self.view_start = None
+        self.profiler = None
+        self.capture = None
+        # accounts.asyncdb runs execute() on several threads at once
+        self._lock = threading.Lock()
+
+    def execute(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            origin = _origin()
+            with self._lock:
+                self.queries += 1
+                self.timings["db"] += elapsed
+                if self.slowest is None or elapsed > self.slowest[0]:
+                    self.slowest = (elapsed, sql, origin)
+
+    @contextmanager
+    def running(self, databases=None):
+        token = _current.set(self)
+        try:
+            with ExitStack() as stack:
+                for conn in connections.all() if databases is None else databases:
+                    stack.enter_context(conn.execute_wrapper(self.execute))
+                yield self
+        finally:
+            _current.reset(token)
+            self.stop_profiler()
+            self.total = time.perf_counter() - self.started
+
+    def view_started(self, view_name):
+        self.view_name = view_name
+        self.view_start = time.perf_counter()
+        # cProfile follows one thread, and an async request hops between several
+        if view_name and not self.is_async and _take(view_name):
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+            except ValueError:
+                # another profiler (a debugger, coverage) owns this thread
+                return
+            self.profiler = profiler
+
+    def view_finished(self):
+        if self.view_start is not None:
+            self.timings["view"] += time.perf_counter() - self.view_start
+
+    def stop_profiler(self):
+        if self.profiler is None:
+            return
+        self.profiler.disable()
+        name = (self.view_name or "unknown").replace(":", "-")
+        os.makedirs(settings.PROFILING_DIR, exist_ok=True)
+        self.capture = os.path.join(
+            settings.PROFILING_DIR,
+            f"{time.strftime('%Y%m%d-%H%M%S')}-{name}-{(time.perf_counter() - self.started) * 1000:.0f}ms.prof",
+        )
+        self.profiler.dump_stats(self.capture)
+        self.profiler = None
+
+    def server_timing(self):
+        metrics = [f"total;dur={self.total * 1000:.1f}"]
+        for name in PHASES:
+            if name in self.timings:
+                metric = f"{name};dur={self.timings[name] * 1000:.1f}"
+                if name == "db":
+                    noun = "query" if self.queries == 1 else "queries"
+                    metric += f';desc="{self.queries} {noun}"'
+                metrics.append(metric)
+        return ", ".join(metrics)
+
+    def record(self, response):
+        record = {
+            "method": self.request.method,
+            "path": self.request.path,
+            "view": self.view_name,
+            "status": response.status_code,
+            "total_ms": round(self.total * 1000, 1),
+            "queries": self.queries,
+        }
+        for name in PHASES:
+            record[f"{name}_ms"] = round(self.timings.get(name, 0) * 1000, 1)
+        if self.slowest:
+            seconds, sql, origin = self.slowest
+            record["slowest_sql"] = {"ms": round(seconds * 1000, 1), "sql": sql[:SQL_CHARS], "origin": origin}
+        if self.capture:
+            record["profile"] = self.capture
+        return record
+
+    def finish(self, response):
+        """Add the Server-Timing header, log the request and arm a capture if it was slow."""
+        header = self.server_timing()
+        if response.has_header("Server-Timing"):
+            header = response["Server-Timing"] + ", " + header
+        response["Server-Timing"] = header
+        slow = self.total * 1000 >= settings.PROFILING_SLOW_MS
+        logger.log(logging.WARNING if slow else logging.INFO, json.dumps(self.record(response)))
+        if slow and self.view_name and not self.capture and settings.PROFILING_DIR:
+            _arm(self.view_name)
+
+
+# ------------ cProfile captures ------------
+def _arm(view_name):
+    with _lock:
+        last = _captured.get(view_name)
+        if last is None or time.monotonic() - last >= settings.PROFILING_CAPTURE_INTERVAL:
+            _armed.add(view_name)
+
+
+def _take(view_name):
+    with _lock:
+        if view_name not in _armed:
+            return False
+        _armed.discard(view_name)
+        _captured[view_name] = time.monotonic()
+        return True
+
+
+# ------------ template timing ------------
+def install():
+    """Time template rendering; a no-op after the first call."""
+    from django.template.backends.django import Template
+
+    if getattr(Template.render, "profiled", False):
+        return
+    render = Template.render
+
+    def timed_render(self, context=None, request=None):
+        with phase("template"):
+            return render(self, context, request)
+
+    timed_render.profiled = True
+    Template.render = timed_render
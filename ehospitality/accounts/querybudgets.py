@@ -0,0 +1,297 @@
+"""
+Query budgets for every page of the accounts, patient, doctor and adminpanel
+apps.
+
+BudgetRun seeds the database at growing data volumes and requests every url
+of those apps as the matching role, each in a rolled-back transaction so
+every view sees the same data. A view fails when it goes over its budget in
+QUERY_BUDGETS (DEFAULT_BUDGET otherwise), when it runs more queries with more
+rows, or on a 500; its most repeated statements point at the per-row query.
+
+accounts.tests runs it as part of ``manage.py test``; ``manage.py
+check_query_budgets`` runs it on its own against a throwaway database and
+prints every view's numbers.
+"""
+import json
+import re
+import time
+from collections import Counter
+from datetime import time as clock, timedelta
+
+from django.db import connection, transaction
+from django.template.base import Template
+from django.test import Client
+from django.urls import URLResolver, get_resolver
+from django.utils import timezone
+
+from accounts.models import User
+from adminpanel import counters
+from adminpanel.models import Facility
+from doctor.models import DoctorAvailability, DoctorProfile, Prescription, PrescriptionItem
+from patient.models import Appointment, Billing, HealthResource, MedicalHistory, PaymentJob, SlotHold
+from patient.slots import materialize
+
+# url namespaces under test and the role each one is requested as
+ROLES = {
+    "accounts": None,
+    "patient": "patient",
+    "doctor": "doctor",
+    "adminpanel": "admin",
+}
+
+# queries a single GET may run; views not listed get DEFAULT_BUDGET
+DEFAULT_BUDGET = 6
+QUERY_BUDGETS = {
+    "patient:patient_dashboard": 7,
+    "patient:book_appointment": 6,
+    "patient:find_slots": 7,
+    "patient:timeline": 8,
+    "doctor:patient_detail": 9,
+    "doctor:patient_timeline": 9,
+    "doctor:prescribe": 5,
+    "doctor:add_prescription": 4,
+    "adminpanel:admin_dashboard": 3,
+}
+
+# views that cannot be requested at all
+SKIPPED = {
+    "patient:patient_register": "template patient/register.html does not exist",
+    "patient:patient_login": "template patient/login.html does not exist",
+}
+
+# views whose work is proportional to the data they touch (GET deletes
+# cascade through per-row signal receivers); their budget is not enforced
+UNBOUNDED = {"adminpanel:delete_user", "adminpanel:delete_doctor", "adminpanel:delete_patient"}
+
+# which seeded object fills a url argument; "pk" depends on the view
+URL_ARGS = {
+    "hold_id": "hold",
+    "bill_id": "bill",
+    "patient_id": "patient",
+    "appointment_id": "appointment",
+    "user_id": "user",
+    "facility_id": "facility",
+    "doctor_id": "doctor",
+    "history_id": "history",
+    "job_id": "payment_job",
+    "period": "period",
+    "kind": "export",
+    "pk": "appointment",
+}
+PK_ARGS = {
+    "doctor:availability_delete": "availability",
+    "adminpanel:edit_resource": "resource",
+    "adminpanel:delete_resource": "resource",
+}
+
+
+class RenderTimer:
+    """Times top-level Template.render calls and the SQL they trigger."""
+
+    def __init__(self):
+        self.elapsed = 0.0
+        self.depth = 0
+        self._original = Template.render
+
+    def install(self):
+        timer, original = self, self._original
+
+        def render(template, context):
+            if timer.depth:
+                return original(template, context)
+            timer.depth += 1
+            started = time.perf_counter()
+            try:
+                return original(template, context)
+            finally:
+                timer.elapsed += time.perf_counter() - started
+                timer.depth -= 1
+
+        Template.render = render
+
+    def uninstall(self):
+        Template.render = self._original
+
+
+class BudgetRun:
+    """One pass over every view at each volume; the database must start empty."""
+
+    def __init__(self, log=print):
+        self.timer = RenderTimer()
+        self.log = log
+
+    # ------------ seeding ------------
+    def seed_base(self):
+        today = timezone.localdate()
+        admin = User.objects.create(username="budget-admin", role="admin")
+        doctor = DoctorProfile.objects.create(
+            user=User.objects.create(username="budget-doctor", role="doctor"),
+            specialization="Cardiology", department="Cardiology",
+        )
+        patient = User.objects.create(username="budget-patient", role="patient").patientprofile
+        availability = DoctorAvailability.objects.create(
+            doctor=doctor, day_of_week=today.weekday(), start_time=clock(9, 0), end_time=clock(17, 0),
+        )
+        hold = SlotHold.objects.create(
+            patient=patient, doctor=doctor, date=today + timedelta(days=1), time=clock(9, 0),
+            expires_at=timezone.now() + timedelta(days=1),
+        )
+        self.fixtures = {"admin": admin, "doctor": doctor, "patient": patient}
+        self.objects = {
+            "doctor": doctor.id, "patient": patient.id, "user": patient.user_id,
+            "availability": availability.id, "hold": hold.id, "export": "appointments",
+            "period": today.strftime("%Y-%m"),
+        }
+        self.seeded = 0
+
+    def grow(self, rows):
+        """Add rows until every table the views list holds ``rows`` of them."""
+        doctor, patient = self.fixtures["doctor"], self.fixtures["patient"]
+        today = timezone.localdate()
+        for i in range(self.seeded, rows):
+            day = today + timedelta(days=i + 2)
+            other_doctor = DoctorProfile.objects.create(
+                user=User.objects.create(username=f"budget-doctor-{i}", role="doctor"),
+                specialization="Cardiology", department="Cardiology",
+            )
+            other_patient = User.objects.create(username=f"budget-patient-{i}", role="patient").patientprofile
+            Appointment.objects.create(patient=patient, doctor=other_doctor, date=day, time=clock(10, 0))
+            seen = Appointment.objects.create(patient=other_patient, doctor=doctor, date=day, time=clock(11, 0))
+            rx = Prescription.objects.create(doctor=doctor, patient=patient, notes=f"visit {i}")
+            PrescriptionItem.objects.bulk_create([
+                PrescriptionItem(prescription=rx, drug_name=name, dosage="500 mg", frequency="1-0-1", duration="5 days")
+                for name in ("Paracetamol", "Amoxicillin")
+            ])
+            bill = Billing.objects.create(patient=patient, prescription=rx, amount=100 + i)
+            history = MedicalHistory.objects.create(patient=patient, diagnosis=f"diagnosis {i}")
+            facility = Facility.objects.create(name=f"Ward {i}", location="Block A", department="Cardiology")
+            resource = HealthResource.objects.create(title=f"Article {i}", content="Lorem ipsum " * 20)
+            if not i:
+                job = PaymentJob.objects.create(
+                    bill=bill, success_url="http://testserver/", cancel_url="http://testserver/",
+                    run_after=timezone.now(),
+                )
+                self.objects.update({
+                    "appointment": seen.id, "bill": bill.id, "history": history.id,
+                    "facility": facility.id, "resource": resource.id, "payment_job": job.id,
+                })
+        self.seeded = max(self.seeded, rows)
+        # what build_slot_inventory and reconcile_counters keep ready in production
+        materialize(DoctorProfile.objects.values_list("id", flat=True), [today + timedelta(days=i) for i in range(rows + 2)])
+        counters.reconcile()
+
+    # ------------ requests ------------
+    def discover(self):
+        for resolver in get_resolver().url_patterns:
+            if not isinstance(resolver, URLResolver) or resolver.app_name not in ROLES:
+                continue
+            for pattern in resolver.url_patterns:
+                name = f"{resolver.app_name}:{pattern.name or pattern.callback.__name__}"
+                if name in SKIPPED:
+                    self.log(f"skipping {name}: {SKIPPED[name]}")
+                    continue
+                yield resolver.app_name, name, str(resolver.pattern) + str(pattern.pattern)
+
+    def url_for(self, name, route):
+        def arg(match):
+            key = match.group(1)
+            source = PK_ARGS.get(name, URL_ARGS[key]) if key == "pk" else URL_ARGS[key]
+            return str(self.objects[source])
+        return "/" + re.sub(r"<(?:\w+:)?(\w+)>", arg, route)
+
+    def client_for(self, role):
+        client = Client(raise_request_exception=False)
+        if role:
+            user = User.objects.get(username=f"budget-{role}")
+            session = client.session
+            session["user_id"] = user.id
+            session["role"] = user.role
+            session.save()
+        return client
+
+    def measure(self, client, url):
+        timer = self.timer
+        stats = {"queries": 0, "template_queries": 0, "sql_seconds": 0.0}
+        statements = Counter()
+
+        def record(execute, sql, params, many, context):
+            started = time.perf_counter()
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                stats["queries"] += 1
+                stats["sql_seconds"] += time.perf_counter() - started
+                stats["template_queries"] += bool(timer.depth)
+                statements[sql] += 1
+
+        timer.elapsed = 0.0
+        # every request runs in a transaction that is rolled back, so the
+        # data stays the same for each view and volume
+        with connection.execute_wrapper(record), transaction.atomic():
+            started = time.perf_counter()
+            response = client.get(url)
+            if response.streaming:
+                # streamed responses only query while they are read
+                b"".join(response.streaming_content)
+            stats["total_seconds"] = time.perf_counter() - started
+            transaction.set_rollback(True)
+        stats["render_seconds"] = timer.elapsed
+        stats["status"] = response.status_code
+        return stats, statements
+
+    def run(self, volumes):
+        """Per-view results at each of ``volumes`` (rows per table, smallest first)."""
+        self.timer.install()
+        try:
+            return self._run(volumes)
+        finally:
+            self.timer.uninstall()
+
+    def _run(self, volumes):
+        self.seed_base()
+        views = list(self.discover())
+        results = {name: {"view": name, "url": None, "budget": QUERY_BUDGETS.get(name, DEFAULT_BUDGET),
+                          "volumes": {}, "failures": [], "repeated": []}
+                   for _, name, _ in views}
+
+        for rows in volumes:
+            self.grow(rows)
+            clients = {app: self.client_for(role) for app, role in ROLES.items()}
+            for app, name, route in views:
+                url = self.url_for(name, route)
+                # warm up once so one-off work (lazy inventory rows, per-process caches) is not counted
+                self.measure(clients[app], url)
+                stats, statements = self.measure(clients[app], url)
+                result = results[name]
+                result["url"] = url
+                result["volumes"][rows] = stats
+                if stats["status"] >= 500:
+                    result["failures"].append(f"HTTP {stats['status']} with {rows} rows")
+                if stats["queries"] > result["budget"] and name not in UNBOUNDED:
+                    result["failures"].append(f"{stats['queries']} queries with {rows} rows, budget {result['budget']}")
+                result["repeated"] = [(sql, n) for sql, n in statements.most_common(3) if n > 1]
+                self.log(
+                    f"{rows:>6} rows  {stats['status']}  {stats['queries']:>3} q  "
+                    f"{stats['sql_seconds'] * 1000:7.1f} ms sql  {stats['render_seconds'] * 1000:7.1f} ms render  {name}"
+                )
+
+        for result in results.values():
+            counts = [result["volumes"][rows]["queries"] for rows in volumes]
+            if counts[-1] > counts[0] and result["view"] not in UNBOUNDED:
+                result["failures"].append(f"queries grow with rows: {counts} for {volumes}")
+        return list(results.values())
+
+
+def failure_lines(results):
+    """Human readable lines for every view over budget, with its most repeated statements."""
+    lines = []
+    for r in results:
+        if r["failures"]:
+            lines.append(f"{r['view']}: {'; '.join(r['failures'])}")
+            lines.extend(f"    {n}x {sql[:160]}" for sql, n in r["repeated"])
+    return lines
+
+
+def write_report(path, volumes, results):
+    with open(path, "w") as fh:
+        json.dump({"volumes": volumes, "views": results}, fh, indent=2)
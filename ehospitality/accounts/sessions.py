@@ -0,0 +1,63 @@
+"""
+Signed-cookie session engine with server-side revocation.
+
+Enable with ``SESSION_ENGINE = 'accounts.sessions'``. The session data
+(user_id, role, ...) travels in a signed, expiring cookie, so requests never
+read the django_session table.
+
+Every session of a logged-in user is stamped with the user's session_epoch.
+Logging out (``request.session.flush()``) bumps the epoch, which revokes every
+cookie issued before. Epochs are read from the cache and fall back to the
+User row on a miss.
+"""
+from django.conf import settings
+from django.contrib.sessions.backends import signed_cookies
+from django.core.cache import cache
+from django.db.models import F
+
+from .models import User
+
+EPOCH_KEY = "_session_epoch"
+
+
+def _cache_key(user_id):
+    return f"session-epoch:{user_id}"
+
+
+def current_epoch(user_id):
+    """The user's session epoch, or None if the user no longer exists."""
+    epoch = cache.get(_cache_key(user_id))
+    if epoch is None:
+        epoch = User.objects.filter(pk=user_id).values_list("session_epoch", flat=True).first()
+        if epoch is not None:
+            cache.set(_cache_key(user_id), epoch, getattr(settings, "SESSION_EPOCH_CACHE_SECONDS", 60))
+    return epoch
+
+
+def revoke_sessions(user_id):
+    User.objects.filter(pk=user_id).update(session_epoch=F("session_epoch") + 1)
+    cache.delete(_cache_key(user_id))
+
+
+class SessionStore(signed_cookies.SessionStore):
+
+    def load(self):
+        data = super().load()
+        user_id = data.get("user_id")
+        if user_id is not None and data.get(EPOCH_KEY) != [user_id, current_epoch(user_id)]:
+            # revoked by a logout, or the user is gone
+            self.create()
+            return {}
+        return data
+
+    def save(self, must_create=False):
+        user_id = self._session.get("user_id")
+        if user_id is not None and self._session.get(EPOCH_KEY, [None])[0] != user_id:
+            self._session[EPOCH_KEY] = [user_id, current_epoch(user_id)]
+        super().save(must_create)
+
+    def flush(self):
+        user_id = self.get("user_id")
+        if user_id is not None:
+            revoke_sessions(user_id)
+        super().flush()
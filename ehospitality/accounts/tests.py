@@ -1,3 +1,44 @@
-from django.test import TestCase
+import os
 
-# Create your tests here.
+from django.core.cache import cache
+from django.test import TestCase, TransactionTestCase
+
+from . import cacheversions, querybudgets
+
+VOLUMES = [5, 40]
+# the per-view numbers, as check_query_budgets writes them
+REPORT = os.environ.get("QUERY_BUDGETS_REPORT", "query-budgets.json")
+
+
+class QueryBudgetTests(TransactionTestCase):
+    """
+    Every page stays within its query budget and runs no more queries with
+    more rows; see accounts.querybudgets. Not a TestCase, as the cache
+    invalidation the pages rely on waits for commits.
+    """
+
+    def setUp(self):
+        cache.clear()
+
+    def test_views_within_budget(self):
+        results = querybudgets.BudgetRun(log=lambda line: None).run(VOLUMES)
+        querybudgets.write_report(REPORT, VOLUMES, results)
+        for result in results:
+            with self.subTest(view=result["view"]):
+                self.assertEqual(result["failures"], [], "\n".join(querybudgets.failure_lines([result])))
+
+
+class CacheVersionTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_keys_are_stable_until_bumped_after_commit(self):
+        first = cacheversions.keys(["a", "b"])
+        self.assertEqual(cacheversions.keys(["a", "b"]), first)
+        with self.captureOnCommitCallbacks(execute=True):
+            cacheversions.bump(["a"])
+            # nothing moves before the commit
+            self.assertEqual(cacheversions.keys(["a"]), {"a": first["a"]})
+        after = cacheversions.keys(["a", "b"])
+        self.assertNotEqual(after["a"], first["a"])
+        self.assertEqual(after["b"], first["b"])
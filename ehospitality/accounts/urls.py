@@ -9,4 +9,6 @@ urlpatterns = [
     path('register/', views.register, name='register'),
     path('login/', views.login_view, name='login'),
     path('logout/', views.logout_view, name='logout'),
+    # no trailing slash: the path Prometheus scrapes by default
+    path('metrics', views.metrics_view, name='metrics'),
 ]
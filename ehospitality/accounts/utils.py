@@ -1,14 +1,11 @@
-from .models import User
+from functools import wraps
 
-def get_session_user(request):
+from django.shortcuts import redirect
 
-    uid = request.session.get('user_id')
-    if not uid:
-        return None
-    try:
-        return User.objects.get(pk=uid)
-    except User.DoesNotExist:
-        return None
+
+def get_session_user(request):
+    # resolved once per request by accounts.middleware.SessionIdentityMiddleware
+    return request.identity.user
 
 def require_role(request, allowed_roles):
 
@@ -18,3 +15,13 @@ def require_role(request, allowed_roles):
     if user.role not in allowed_roles:
         return None
     return user
+
+
+def admin_required(view):
+    """Send anyone but a logged-in admin to the login page."""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not require_role(request, ("admin",)):
+            return redirect("accounts:login")
+        return view(request, *args, **kwargs)
+    return wrapper
@@ -1,6 +1,10 @@
+from django.conf import settings
+from django.http import HttpResponse
 from django.shortcuts import render, redirect
+from django.utils.crypto import constant_time_compare
 from django.contrib import messages
 from django.contrib.auth import authenticate
+from . import metrics
 from .forms import UserRegisterForm
 
 
@@ -66,3 +70,13 @@ def logout_view(request):
     request.session.flush()
     messages.info(request, 'You are logged out.')
     return redirect('accounts:login')
+
+
+def metrics_view(request):
+    """Prometheus scrape endpoint; only served without a token while DEBUG is on."""
+    token = settings.METRICS_TOKEN
+    if not settings.METRICS_ENABLED or not (token or settings.DEBUG):
+        return HttpResponse(status=404)
+    if token and not constant_time_compare(request.headers.get("Authorization", ""), f"Bearer {token}"):
+        return HttpResponse(status=401, headers={"WWW-Authenticate": "Bearer"})
+    return HttpResponse(metrics.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
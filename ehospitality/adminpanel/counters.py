@@ -0,0 +1,64 @@
+"""
+Row counters for the admin dashboard.
+
+Instead of running COUNT(*) over every table on each dashboard load, the
+counts live in DashboardCounter rows that post_save/post_delete receivers
+increment and decrement. ``manage.py reconcile_counters`` (run it from cron)
+resets them from the real counts; code that bypasses signals, such as
+bulk_create, calls bump() itself.
+"""
+from django.apps import apps
+from django.db.models import F
+from django.db.models.signals import post_save, post_delete
+from django.utils import timezone
+
+from .models import DashboardCounter
+
+COUNTED_MODELS = {
+    "users": "accounts.User",
+    "doctors": "doctor.DoctorProfile",
+    "patients": "patient.PatientProfile",
+    "facilities": "adminpanel.Facility",
+    "resources": "patient.HealthResource",
+    "appointments": "patient.Appointment",
+}
+
+
+def bump(name, delta=1):
+    DashboardCounter.objects.filter(name=name).update(value=F("value") + delta)
+
+
+def reconcile(names=None):
+    """Recount the given counters (all by default) from their tables."""
+    counts = {}
+    for name in names or COUNTED_MODELS:
+        counts[name] = apps.get_model(COUNTED_MODELS[name]).objects.count()
+        DashboardCounter.objects.update_or_create(
+            name=name, defaults={"value": counts[name], "reconciled_at": timezone.now()}
+        )
+    return counts
+
+
+def read_counters():
+    """All counters in one query; counters that do not exist yet are built first."""
+    counts = dict(DashboardCounter.objects.values_list("name", "value"))
+    missing = [name for name in COUNTED_MODELS if name not in counts]
+    if missing:
+        counts.update(reconcile(missing))
+    return counts
+
+
+def _connect(name, model):
+    def saved(sender, instance, created, raw=False, **kwargs):
+        if created and not raw:
+            bump(name)
+
+    def deleted(sender, instance, **kwargs):
+        bump(name, -1)
+
+    post_save.connect(saved, sender=model, weak=False, dispatch_uid=f"counter-save-{name}")
+    post_delete.connect(deleted, sender=model, weak=False, dispatch_uid=f"counter-delete-{name}")
+
+
+for _name, _model in COUNTED_MODELS.items():
+    _connect(_name, _model)
@@ -0,0 +1,149 @@
+"""
+Streaming exports of appointments, bills and prescriptions.
+
+Rows are read in primary-key order, CHUNK_SIZE at a time (``id > last`` with
+a LIMIT), as plain values() tuples, and written out as they arrive, so the
+memory use of an export does not depend on its size. Keyset chunks are used
+instead of ``.iterator()`` because MySQL's client library buffers the whole
+result of a query even when Django iterates it.
+
+Every export can be limited to a date range: the appointment date, or the
+day a bill or prescription was created.
+"""
+import csv
+import json
+from datetime import datetime, time, timedelta
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+
+from doctor.models import Prescription, PrescriptionItem
+from patient.models import Appointment, Billing
+
+CHUNK_SIZE = 2000
+FORMATS = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+}
+
+APPOINTMENT_FIELDS = (
+    "id", "date", "time", "status",
+    "patient_id", "patient__user__username", "doctor_id", "doctor__user__username", "doctor__department",
+)
+BILL_FIELDS = (
+    "id", "created_at", "status", "amount", "patient_id", "patient__user__username",
+    "prescription_id", "stripe_payment_intent",
+)
+PRESCRIPTION_FIELDS = (
+    "id", "created_at", "patient_id", "patient__user__username", "doctor_id", "doctor__user__username", "notes",
+)
+ITEM_FIELDS = ("drug_name", "dosage", "frequency", "duration")
+
+
+def _column(field):
+    # patient__user__username -> patient_username
+    return field.replace("__user__", "_").replace("__", "_")
+
+
+def _day_start(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def _chunks(queryset, fields, chunk_size):
+    last = 0
+    while True:
+        rows = list(queryset.filter(pk__gt=last).order_by("pk").values_list(*fields)[:chunk_size])
+        if not rows:
+            return
+        yield rows
+        last = rows[-1][0]
+
+
+def _appointments(date_from, date_to, chunk_size):
+    qs = Appointment.objects.all()
+    if date_from:
+        qs = qs.filter(date__gte=date_from)
+    if date_to:
+        qs = qs.filter(date__lte=date_to)
+    for rows in _chunks(qs, APPOINTMENT_FIELDS, chunk_size):
+        for row in rows:
+            yield dict(zip(map(_column, APPOINTMENT_FIELDS), row))
+
+
+def _created_between(qs, date_from, date_to):
+    if date_from:
+        qs = qs.filter(created_at__gte=_day_start(date_from))
+    if date_to:
+        qs = qs.filter(created_at__lt=_day_start(date_to + timedelta(days=1)))
+    return qs
+
+
+def _bills(date_from, date_to, chunk_size):
+    qs = _created_between(Billing.objects.all(), date_from, date_to)
+    for rows in _chunks(qs, BILL_FIELDS, chunk_size):
+        for row in rows:
+            yield dict(zip(map(_column, BILL_FIELDS), row))
+
+
+def _prescriptions(date_from, date_to, chunk_size):
+    qs = _created_between(Prescription.objects.all(), date_from, date_to)
+    for rows in _chunks(qs, PRESCRIPTION_FIELDS, chunk_size):
+        # one query for the items of the whole chunk
+        items = {}
+        for prescription_id, *item in (
+            PrescriptionItem.objects.filter(prescription_id__in=[row[0] for row in rows])
+            .order_by("prescription_id", "id").values_list("prescription_id", *ITEM_FIELDS)
+        ):
+            items.setdefault(prescription_id, []).append(dict(zip(ITEM_FIELDS, item)))
+        for row in rows:
+            record = dict(zip(map(_column, PRESCRIPTION_FIELDS), row))
+            record["items"] = items.get(row[0], [])
+            yield record
+
+
+EXPORTS = {
+    "appointments": (_appointments, [_column(f) for f in APPOINTMENT_FIELDS]),
+    "bills": (_bills, [_column(f) for f in BILL_FIELDS]),
+    # CSV gets one line per item, NDJSON one object per prescription
+    "prescriptions": (_prescriptions, [_column(f) for f in PRESCRIPTION_FIELDS] + list(ITEM_FIELDS)),
+}
+
+
+class _Echo:
+    def write(self, value):
+        return value
+
+
+def _csv_lines(records, columns):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(columns)
+    for record in records:
+        items = record.pop("items", None)
+        base = [record[c] for c in columns if c in record]
+        if items is None:
+            yield writer.writerow(base)
+        elif not items:
+            yield writer.writerow(base + [""] * len(ITEM_FIELDS))
+        for item in items or ():
+            yield writer.writerow(base + [item[f] for f in ITEM_FIELDS])
+
+
+def _ndjson_lines(records):
+    for record in records:
+        yield json.dumps(record, cls=DjangoJSONEncoder) + "\n"
+
+
+def export_lines(kind, fmt, date_from=None, date_to=None, chunk_size=CHUNK_SIZE):
+    """Generate the lines of a ``kind`` export in format ``fmt``."""
+    if kind not in EXPORTS:
+        raise ValueError(f"Unknown export {kind!r}; choose from {', '.join(EXPORTS)}")
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown format {fmt!r}; choose from {', '.join(FORMATS)}")
+    rows, columns = EXPORTS[kind]
+    records = rows(date_from, date_to, chunk_size)
+    return _csv_lines(records, columns) if fmt == "csv" else _ndjson_lines(records)
+
+
+def filename(kind, fmt, date_from=None, date_to=None):
+    parts = [kind] + [d.isoformat() for d in (date_from, date_to) if d]
+    return f"{'-'.join(parts)}.{fmt}"
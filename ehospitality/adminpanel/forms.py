@@ -44,3 +44,10 @@ class HealthResourceForm(forms.ModelForm):
 
 
 
+
+
+class UserImportForm(forms.Form):
+    file = forms.FileField(help_text="CSV with a header row, or JSONL (one object per line).")
+    role = forms.ChoiceField(choices=[("patient", "Patient"), ("doctor", "Doctor")], initial="patient",
+                             help_text="Used for rows without a role column.")
+    dry_run = forms.BooleanField(required=False, help_text="Only validate, do not create anyone.")
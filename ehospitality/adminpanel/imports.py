@@ -0,0 +1,246 @@
+"""
+Bulk import of patients and doctors from CSV or JSONL.
+
+Rows are validated and written BATCH_SIZE at a time:
+
+1. each row is checked (username, email, role, field lengths) and usernames
+   that repeat in the file or already exist are rejected, one query per batch;
+2. passwords are hashed across a process pool - PBKDF2 is deliberately slow,
+   so this is where the time goes. A password that is already a Django hash
+   is stored as is, and a row without one gets an unusable password;
+3. the users are inserted with bulk_create, their ids read back by username
+   (MySQL does not return ids from bulk inserts) and the profiles inserted
+   with bulk_create.
+
+bulk_create sends no post_save, so the per-row create_patient_profile
+receiver and the dashboard counter receivers do not run; the counters are
+bumped once per batch instead.
+"""
+import csv
+import json
+import os
+import secrets
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.apps import apps
+from django.contrib.auth.hashers import UNUSABLE_PASSWORD_PREFIX, identify_hasher, make_password
+from django.contrib.auth.validators import UnicodeUsernameValidator
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import IntegrityError, transaction
+
+from accounts.models import User
+from doctor.models import DoctorProfile
+from patient.models import PatientProfile
+from . import counters
+
+BATCH_SIZE = 1000
+ROLES = ("patient", "doctor")
+USER_FIELDS = ("username", "email", "first_name", "last_name")
+PROFILE_FIELDS = {
+    "patient": (PatientProfile, ("phone", "address", "insurance_info")),
+    "doctor": (DoctorProfile, ("specialization", "department", "bio")),
+}
+MAX_ERRORS = 1000
+# uploads through the admin panel are hashed in the request, one PBKDF2 at a
+# time (about 0.4s each); keep that within a few seconds and send bigger files
+# to the command
+WEB_MAX_ROWS = 20
+
+_validate_username = UnicodeUsernameValidator()
+
+
+class ImportReport:
+    def __init__(self):
+        self.rows = 0
+        self.created = Counter()
+        self.errors = []
+        self.error_count = 0
+        self.started = time.perf_counter()
+        self.elapsed = 0.0
+
+    def error(self, line, username, message):
+        self.error_count += 1
+        if len(self.errors) < MAX_ERRORS:
+            self.errors.append((line, username, message))
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.elapsed if self.elapsed else 0.0
+
+
+def read_rows(fh, fmt):
+    """Yield (line number, dict) from a CSV (with a header row) or JSONL file."""
+    if fmt == "csv":
+        reader = csv.DictReader(fh)
+        for row in reader:
+            yield reader.line_num, row
+    elif fmt == "jsonl":
+        for line_no, line in enumerate(fh, start=1):
+            if line.strip():
+                try:
+                    row = json.loads(line)
+                except ValueError as e:
+                    row = {"_error": f"invalid JSON: {e}"}
+                yield line_no, row if isinstance(row, dict) else {"_error": "expected a JSON object"}
+    else:
+        raise ValueError(f"Unknown format {fmt!r}; use csv or jsonl")
+
+
+def _max_length(model, field):
+    return model._meta.get_field(field).max_length
+
+
+def _clean(row, default_role):
+    if "_error" in row:
+        raise ValidationError(row["_error"])
+    row = {k.strip().lower(): (v.strip() if isinstance(v, str) else v) for k, v in row.items() if k}
+    role = row.get("role") or default_role
+    if role not in ROLES:
+        raise ValidationError(f"role must be one of {', '.join(ROLES)}")
+    username = row.get("username") or ""
+    if not username:
+        raise ValidationError("username is required")
+    _validate_username(username)
+    if row.get("email"):
+        validate_email(row["email"])
+    model, profile_fields = PROFILE_FIELDS[role]
+    cleaned = {"role": role, "password": row.get("password") or None}
+    for name in USER_FIELDS:
+        value = str(row.get(name) or "")
+        if len(value) > _max_length(User, name):
+            raise ValidationError(f"{name} is longer than {_max_length(User, name)} characters")
+        cleaned[name] = value
+    for name in profile_fields:
+        value = str(row.get(name) or "")
+        limit = _max_length(model, name)
+        if limit and len(value) > limit:
+            raise ValidationError(f"{name} is longer than {limit} characters")
+        cleaned[name] = value
+    return cleaned
+
+
+def _unusable_password():
+    # what make_password(None) returns, without its per-call get_random_string
+    return UNUSABLE_PASSWORD_PREFIX + secrets.token_urlsafe(30)
+
+
+def _is_hashed(password):
+    try:
+        identify_hasher(password)
+    except ValueError:
+        return False
+    return True
+
+
+def _init_worker():
+    # needed where workers are spawned rather than forked
+    if not apps.ready:
+        django.setup()
+
+
+class Importer:
+    def __init__(self, default_role="patient", batch_size=BATCH_SIZE, workers=None, dry_run=False):
+        self.default_role = default_role
+        self.batch_size = batch_size
+        self.workers = workers or os.cpu_count() or 1
+        self.dry_run = dry_run
+        self.report = ImportReport()
+        self._seen = set()
+        self._pool = None
+
+    def __enter__(self):
+        if self.workers > 1:
+            self._pool = ProcessPoolExecutor(self.workers, initializer=_init_worker)
+        return self
+
+    def __exit__(self, *exc):
+        if self._pool:
+            self._pool.shutdown()
+
+    def run(self, rows):
+        batch = []
+        for line, row in rows:
+            batch.append((line, row))
+            if len(batch) >= self.batch_size:
+                self._batch(batch)
+                batch = []
+        if batch:
+            self._batch(batch)
+        self.report.elapsed = time.perf_counter() - self.report.started
+        return self.report
+
+    def _validate(self, batch):
+        valid = []
+        for line, row in batch:
+            try:
+                cleaned = _clean(row, self.default_role)
+            except ValidationError as e:
+                self.report.error(line, row.get("username", ""), "; ".join(e.messages))
+                continue
+            if cleaned["username"] in self._seen:
+                self.report.error(line, cleaned["username"], "username appears earlier in the file")
+                continue
+            self._seen.add(cleaned["username"])
+            valid.append((line, cleaned))
+
+        existing = set(
+            User.objects.filter(username__in=[c["username"] for _, c in valid]).values_list("username", flat=True)
+        )
+        for line, cleaned in valid:
+            if cleaned["username"] in existing:
+                self.report.error(line, cleaned["username"], "username already exists")
+        return [(line, c) for line, c in valid if c["username"] not in existing]
+
+    def _batch(self, batch):
+        self.report.rows += len(batch)
+        valid = self._validate(batch)
+        if not valid or self.dry_run:
+            return
+
+        hashes = [c["password"] or _unusable_password() for _, c in valid]
+        # only plain-text passwords need the slow hasher
+        todo = [i for i, (_, c) in enumerate(valid) if c["password"] and not _is_hashed(c["password"])]
+        plain = [valid[i][1]["password"] for i in todo]
+        if self._pool and len(plain) > 1:
+            hashed = self._pool.map(make_password, plain, chunksize=max(len(plain) // (self.workers * 4), 1))
+        else:
+            hashed = map(make_password, plain)
+        for i, value in zip(todo, hashed):
+            hashes[i] = value
+
+        try:
+            with transaction.atomic():
+                User.objects.bulk_create([
+                    User(password=hashed, role=c["role"], **{f: c[f] for f in USER_FIELDS})
+                    for (_, c), hashed in zip(valid, hashes)
+                ])
+                ids = dict(User.objects.filter(username__in=[c["username"] for _, c in valid])
+                           .values_list("username", "id"))
+                created = Counter()
+                for role, (model, fields) in PROFILE_FIELDS.items():
+                    profiles = [
+                        model(user_id=ids[c["username"]], **{f: c[f] for f in fields})
+                        for _, c in valid if c["role"] == role
+                    ]
+                    model.objects.bulk_create(profiles)
+                    created[role] = len(profiles)
+        except IntegrityError as e:
+            # a username taken between the check and the insert; nothing in the batch was written
+            for line, c in valid:
+                self.report.error(line, c["username"], f"batch rolled back: {e}")
+            return
+
+        counters.bump("users", len(valid))
+        counters.bump("patients", created["patient"])
+        counters.bump("doctors", created["doctor"])
+        self.report.created.update(created)
+
+
+def import_users(rows, **options):
+    """Import ``(line, row)`` pairs from read_rows(); returns an ImportReport."""
+    with Importer(**options) as importer:
+        return importer.run(rows)
@@ -0,0 +1,36 @@
+import sys
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from adminpanel import exports
+
+
+class Command(BaseCommand):
+    help = "Stream appointments, bills or prescriptions to a CSV or NDJSON file (or stdout)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("kind", choices=list(exports.EXPORTS))
+        parser.add_argument("--format", choices=list(exports.FORMATS), default="csv")
+        parser.add_argument("--date-from", type=date.fromisoformat)
+        parser.add_argument("--date-to", type=date.fromisoformat)
+        parser.add_argument("--output", help="File to write; defaults to stdout.")
+        parser.add_argument("--chunk-size", type=int, default=exports.CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        if options["chunk_size"] < 1:
+            raise CommandError("--chunk-size must be positive.")
+        lines = exports.export_lines(
+            options["kind"], options["format"], options["date_from"], options["date_to"], options["chunk_size"],
+        )
+        out = open(options["output"], "w", newline="") if options["output"] else sys.stdout
+        written = 0
+        try:
+            for line in lines:
+                out.write(line)
+                written += 1
+        finally:
+            if options["output"]:
+                out.close()
+        if options["output"]:
+            self.stderr.write(f"wrote {written} lines to {options['output']}")
@@ -0,0 +1,93 @@
+import os
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+
+from adminpanel import synthetic
+
+
+class Command(BaseCommand):
+    help = (
+        "Fill the database with realistic synthetic doctors, patients, appointments, histories, "
+        "prescriptions, bills, facilities and health resources for load and scale testing. "
+        "The same --seed on the same starting database gives the same data."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--doctors", type=int, default=100)
+        parser.add_argument("--patients", type=int, default=5000)
+        parser.add_argument("--appointments", type=int, default=50000)
+        parser.add_argument("--facilities", type=int, default=40)
+        parser.add_argument("--resources", type=int, default=300)
+        parser.add_argument("--days", type=int,
+                            help="Days of appointments; by default enough to book about 60%% of the slots.")
+        parser.add_argument("--future-days", type=int, default=28, help="How many of those days lie ahead.")
+        parser.add_argument("--seed", type=int, default=1)
+        parser.add_argument("--password", default="synthetic", help="Password of every generated user.")
+        parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                            help="Writer processes (always 1 on SQLite).")
+        parser.add_argument("--batch-size", type=int, default=synthetic.BATCH_SIZE, help="Rows per insert batch.")
+        parser.add_argument("--days-per-task", type=int, default=synthetic.DAYS_PER_TASK)
+
+    def handle(self, *args, **options):
+        for name in ("doctors", "patients", "appointments", "facilities", "resources", "future_days"):
+            if options[name] < 0:
+                raise CommandError(f"--{name.replace('_', '-')} cannot be negative.")
+        if options["workers"] < 1 or options["batch_size"] < 1 or options["days_per_task"] < 1:
+            raise CommandError("--workers, --batch-size and --days-per-task must be positive.")
+        if options["days"] is not None and options["days"] < 0:
+            raise CommandError("--days cannot be negative.")
+        started = time.perf_counter()
+        try:
+            plan = synthetic.plan(
+                options["doctors"], options["patients"], options["appointments"],
+                facilities=options["facilities"], resources=options["resources"], days=options["days"],
+                future_days=options["future_days"], seed=options["seed"], days_per_task=options["days_per_task"],
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+        days = [day for task in plan["tasks"] for day, _ in task["days"]]
+        if days:
+            self.stdout.write(f"appointments from {days[0]} to {days[-1]} in {len(plan['tasks'])} tasks")
+
+        users = synthetic.create_people(plan, options["password"], options["batch_size"])
+        places = synthetic.create_places(plan, options["batch_size"])
+        self.stdout.write(f"{users} users, {places} facilities and resources "
+                          f"({time.perf_counter() - started:.1f}s)")
+
+        workers = 1 if connection.vendor == "sqlite" else min(options["workers"], len(plan["tasks"]) or 1)
+        written = Counter()
+        if workers == 1:
+            for task in plan["tasks"]:
+                written += synthetic.fill(plan, task, options["batch_size"])
+                self.progress(written, plan, started, options)
+        else:
+            # forked workers must not share this process's database connections
+            connections.close_all()
+            with ProcessPoolExecutor(workers, initializer=synthetic.init_worker) as pool:
+                futures = [pool.submit(synthetic.fill, plan, task, options["batch_size"]) for task in plan["tasks"]]
+                for future in as_completed(futures):
+                    written += future.result()
+                    self.progress(written, plan, started, options)
+
+        filled = time.perf_counter()
+        synthetic.finish()
+        elapsed = time.perf_counter() - started
+        rows = users + places + sum(written.values())
+        for table in ("appointments", "histories", "prescriptions", "items", "bills"):
+            self.stdout.write(f"{table + ':':<15}{written[table]}")
+        self.stdout.write(f"counters, rollups and search index rebuilt in {time.perf_counter() - filled:.1f}s")
+        self.stdout.write(self.style.SUCCESS(
+            f"Generated {rows} rows in {elapsed:.1f}s ({rows / elapsed:.0f} rows/s) with {workers} "
+            f"worker{'s' if workers > 1 else ''}."
+        ))
+
+    def progress(self, written, plan, started, options):
+        if options["verbosity"] > 1:
+            self.stderr.write(
+                f"{written['appointments']} of {plan['appointments']} appointments "
+                f"({time.perf_counter() - started:.0f}s)"
+            )
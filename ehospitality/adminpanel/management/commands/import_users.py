@@ -0,0 +1,55 @@
+import csv
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from adminpanel import imports
+
+
+class Command(BaseCommand):
+    help = (
+        "Bulk import patients and doctors from a CSV (with a header row) or JSONL file. "
+        "Columns: username, email, first_name, last_name, password, role, plus phone/address/"
+        "insurance_info for patients and specialization/department/bio for doctors."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path")
+        parser.add_argument("--format", choices=["csv", "jsonl"], help="Defaults to the file extension.")
+        parser.add_argument("--role", choices=imports.ROLES, default="patient", help="Role for rows without one.")
+        parser.add_argument("--batch-size", type=int, default=imports.BATCH_SIZE)
+        parser.add_argument("--workers", type=int, help="Password hashing processes (default: one per CPU).")
+        parser.add_argument("--dry-run", action="store_true", help="Validate only, write nothing.")
+        parser.add_argument("--errors", help="Write every rejected row to this CSV file.")
+
+    def handle(self, *args, **options):
+        fmt = options["format"] or os.path.splitext(options["path"])[1].lstrip(".").lower()
+        if fmt not in ("csv", "jsonl"):
+            raise CommandError("Cannot tell the format from the file name; pass --format.")
+        if options["batch_size"] < 1:
+            raise CommandError("--batch-size must be positive.")
+
+        with open(options["path"], newline="", encoding="utf-8-sig") as fh:
+            report = imports.import_users(
+                imports.read_rows(fh, fmt),
+                default_role=options["role"], batch_size=options["batch_size"],
+                workers=options["workers"], dry_run=options["dry_run"],
+            )
+
+        for line, username, message in report.errors[:20]:
+            self.stderr.write(f"line {line} ({username or '-'}): {message}")
+        if report.error_count > 20:
+            self.stderr.write(f"... and {report.error_count - 20} more")
+        if options["errors"]:
+            with open(options["errors"], "w", newline="") as out:
+                writer = csv.writer(out)
+                writer.writerow(["line", "username", "error"])
+                writer.writerows(report.errors)
+
+        self.stdout.write(f"rows:      {report.rows}")
+        self.stdout.write(f"patients:  {report.created['patient']}")
+        self.stdout.write(f"doctors:   {report.created['doctor']}")
+        self.stdout.write(f"rejected:  {report.error_count}")
+        self.stdout.write(f"elapsed:   {report.elapsed:.1f}s ({report.rows_per_second:.0f} rows/s)")
+        if options["dry_run"]:
+            self.stdout.write("dry run: nothing was written")
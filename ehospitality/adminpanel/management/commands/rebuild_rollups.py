@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from adminpanel import rollups
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the revenue and patient balance rollups from the Billing table, "
+        "reading --chunk-size bill ids at a time. Stop everything that writes bills "
+        "(the web workers, process_payments, reconcile_payments) while it runs: the rollup "
+        "tables stay locked until it finishes, and a bill written as it starts can be "
+        "counted twice."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=rollups.CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        if options["chunk_size"] < 1:
+            raise CommandError("--chunk-size must be positive.")
+        started = time.perf_counter()
+
+        def progress(done, last):
+            self.stderr.write(f"read bills up to id {done} of {last}")
+
+        written = rollups.rebuild(options["chunk_size"], progress if options["verbosity"] > 1 else None)
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt rollups: {written} rows in {time.perf_counter() - started:.1f}s."
+        ))
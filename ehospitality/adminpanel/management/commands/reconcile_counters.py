@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from adminpanel.counters import reconcile
+
+
+class Command(BaseCommand):
+    help = "Recount the admin dashboard counters from their tables."
+
+    def handle(self, *args, **options):
+        for name, value in reconcile().items():
+            self.stdout.write(f"{name}: {value}")
+        self.stdout.write(self.style.SUCCESS("Dashboard counters reconciled."))
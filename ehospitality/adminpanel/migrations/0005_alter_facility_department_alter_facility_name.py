@@ -0,0 +1,23 @@
+# Generated by Django 4.2.30 on 2026-10-18 10:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('adminpanel', '0004_dashboardcounter'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='facility',
+            name='department',
+            field=models.CharField(db_index=True, max_length=200),
+        ),
+        migrations.AlterField(
+            model_name='facility',
+            name='name',
+            field=models.CharField(db_index=True, max_length=200),
+        ),
+    ]
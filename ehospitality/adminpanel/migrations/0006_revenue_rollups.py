@@ -0,0 +1,62 @@
+# Generated by Django 4.2.30 on 2026-10-18 10:37
+
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+
+
+def build_rollups(apps, schema_editor):
+    # the same totals manage.py rebuild_rollups computes, in one pass
+    Billing = apps.get_model('patient', 'Billing')
+    RevenueRollup = apps.get_model('adminpanel', 'RevenueRollup')
+    PatientBalance = apps.get_model('adminpanel', 'PatientBalance')
+    RevenueRollup.objects.bulk_create([
+        RevenueRollup(day=row['day'], department=row['department'] or '', doctor_id=row['doctor'] or 0,
+                      status=row['bill_status'], bill_count=row['n'], amount=row['total'])
+        for row in Billing.objects.order_by().values(
+            day=TruncDate('created_at'), department=F('prescription__doctor__department'),
+            doctor=F('prescription__doctor_id'), bill_status=F('status'),
+        ).annotate(n=Count('id'), total=Sum('amount'))
+    ], batch_size=1000)
+    PatientBalance.objects.bulk_create([
+        PatientBalance(patient_id=row['patient_id'], unpaid_count=row['n'], outstanding=row['total'])
+        for row in Billing.objects.filter(status='unpaid').order_by().values('patient_id')
+        .annotate(n=Count('id'), total=Sum('amount'))
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('doctor', '0004_prescription_doctor_pres_patient_3bd8f2_idx'),
+        ('patient', '0010_billing_paid_at_paymentjob'),
+        ('adminpanel', '0005_alter_facility_department_alter_facility_name'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PatientBalance',
+            fields=[
+                ('patient', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='balance', serialize=False, to='patient.patientprofile')),
+                ('unpaid_count', models.IntegerField(default=0)),
+                ('outstanding', models.DecimalField(db_index=True, decimal_places=2, default=0, max_digits=14)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='RevenueRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('department', models.CharField(blank=True, max_length=120)),
+                ('doctor_id', models.PositiveBigIntegerField(default=0)),
+                ('status', models.CharField(max_length=20)),
+                ('bill_count', models.IntegerField(default=0)),
+                ('amount', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+            ],
+            options={
+                'unique_together': {('day', 'department', 'doctor_id', 'status')},
+            },
+        ),
+        migrations.RunPython(build_rollups, migrations.RunPython.noop),
+    ]
@@ -1,11 +1,47 @@
 from django.db import models
 class Facility(models.Model):
-    name = models.CharField(max_length=200)
+    name = models.CharField(max_length=200, db_index=True)
     location = models.CharField(max_length=200)
-    department = models.CharField(max_length=200)
+    department = models.CharField(max_length=200, db_index=True)
     resources = models.TextField(blank=True, null=True)
 
     def __str__(self):
         return f"{self.name} - {self.department}"
 
 
+class DashboardCounter(models.Model):
+    """Row counts shown on the admin dashboard, kept current by adminpanel.counters."""
+    name = models.CharField(max_length=50, unique=True)
+    value = models.BigIntegerField(default=0)
+    reconciled_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.name}: {self.value}"
+
+
+class RevenueRollup(models.Model):
+    """Bill counts and totals per day, department, doctor and status, kept current by adminpanel.rollups."""
+    day = models.DateField()
+    department = models.CharField(max_length=120, blank=True)
+    # the prescribing doctor; 0 for bills not linked to a prescription
+    doctor_id = models.PositiveBigIntegerField(default=0)
+    status = models.CharField(max_length=20)
+    bill_count = models.IntegerField(default=0)
+    amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        unique_together = ("day", "department", "doctor_id", "status")
+
+    def __str__(self):
+        return f"{self.day} {self.department or '-'} doctor {self.doctor_id} {self.status}: {self.amount}"
+
+
+class PatientBalance(models.Model):
+    """A patient's unpaid bills, kept current by adminpanel.rollups."""
+    patient = models.OneToOneField("patient.PatientProfile", on_delete=models.CASCADE, primary_key=True,
+                                   related_name="balance")
+    unpaid_count = models.IntegerField(default=0)
+    outstanding = models.DecimalField(max_digits=14, decimal_places=2, default=0, db_index=True)
+
+    def __str__(self):
+        return f"Patient {self.patient_id} owes {self.outstanding}"
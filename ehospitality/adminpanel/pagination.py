@@ -0,0 +1,125 @@
+"""
+Cursor (keyset) pagination for the admin list pages.
+
+Pages are addressed by the sort key of their first/last row instead of an
+OFFSET, so every page is one indexed range scan no matter how deep it is.
+The ordering must end in a unique field (normally ``id``) and its fields must
+not be nullable.
+"""
+import base64
+import json
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Q
+
+PER_PAGE = 50
+
+
+def _field(model, path):
+    field = None
+    for part in path.split("__"):
+        field = model._meta.get_field(part)
+        model = field.related_model
+    return field
+
+
+def _encode(values):
+    raw = json.dumps([str(v) for v in values]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def _decode(cursor, fields):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json.loads(raw)
+        if len(values) != len(fields):
+            return None
+        return [field.to_python(value) for field, value in zip(fields, values)]
+    except Exception:
+        # a mangled cursor just starts over from the first page
+        return None
+
+
+def keyset_filter(ordering, values, reverse=False):
+    """Q for the rows that sort after ``values`` (before them with reverse=True)."""
+    q = Q()
+    for i, key in enumerate(ordering):
+        name = key.lstrip("-")
+        descending = key.startswith("-") != reverse
+        step = Q(**{f"{name}__{'lt' if descending else 'gt'}": values[i]})
+        for prev_key, prev_value in zip(ordering[:i], values[:i]):
+            step &= Q(**{prev_key.lstrip("-"): prev_value})
+        q |= step
+    return q
+
+
+def _flip(key):
+    return key[1:] if key.startswith("-") else "-" + key
+
+
+class KeysetPage:
+    def __init__(self, object_list, request, ordering, has_next, has_previous):
+        self.object_list = object_list
+        self.has_next = has_next and bool(object_list)
+        self.has_previous = has_previous and bool(object_list)
+        self._request = request
+        self._ordering = ordering
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def _values(self, obj):
+        values = []
+        for key in self._ordering:
+            value = obj
+            for part in key.lstrip("-").split("__"):
+                value = getattr(value, part)
+            values.append(value)
+        return values
+
+    def _query(self, direction, obj):
+        params = self._request.GET.copy()
+        params.pop("after", None)
+        params.pop("before", None)
+        params[direction] = _encode(self._values(obj))
+        return params.urlencode()
+
+    @property
+    def next_query(self):
+        return self._query("after", self.object_list[-1]) if self.has_next else ""
+
+    @property
+    def previous_query(self):
+        return self._query("before", self.object_list[0]) if self.has_previous else ""
+
+
+def paginate(request, queryset, ordering, per_page=PER_PAGE):
+    """
+    One page of ``queryset`` sorted by ``ordering``, positioned by the
+    ``after``/``before`` cursors in the query string.
+    """
+    try:
+        fields = [_field(queryset.model, key.lstrip("-")) for key in ordering]
+    except FieldDoesNotExist:
+        raise ValueError(f"Cannot paginate {queryset.model.__name__} by {ordering}")
+
+    after = request.GET.get("after")
+    before = request.GET.get("before")
+    values = _decode(after or before, fields) if (after or before) else None
+
+    if values and before:
+        rows = list(
+            queryset.filter(keyset_filter(ordering, values, reverse=True))
+            .order_by(*[_flip(key) for key in ordering])[:per_page + 1]
+        )
+        has_previous = len(rows) > per_page
+        rows = rows[:per_page][::-1]
+        return KeysetPage(rows, request, ordering, has_next=True, has_previous=has_previous)
+
+    if values:
+        queryset = queryset.filter(keyset_filter(ordering, values))
+    rows = list(queryset.order_by(*ordering)[:per_page + 1])
+    return KeysetPage(rows[:per_page], request, ordering, has_next=len(rows) > per_page, has_previous=bool(values))
@@ -0,0 +1,238 @@
+"""
+Revenue and outstanding-balance rollups.
+
+RevenueRollup holds the number and total of bills per creation day,
+department, prescribing doctor and status; PatientBalance holds each
+patient's unpaid bills. The finance pages and API read only these tables.
+
+They are kept current incrementally: each Billing remembers what it looked
+like when loaded (Billing.from_db), and the receivers below subtract the old
+state and add the new one whenever a bill is created, changed or deleted.
+Code that writes bills without signals (bulk_create, bulk_update) calls
+bills_created() or bills_changed() itself.
+
+``manage.py rebuild_rollups`` recomputes both tables from Billing in
+chunks, with bill writes stopped. Run it after loading data without signals, or after moving a doctor
+to another department: bills already counted stay under the old department
+until then.
+"""
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Max, Min, Sum
+from django.db.models.functions import TruncDate
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from doctor.models import Prescription
+from patient.models import Billing
+from .models import PatientBalance, RevenueRollup
+
+CHUNK_SIZE = 20000
+CENTS = Decimal("0.01")
+STATE_FIELDS = ("patient_id", "prescription_id", "status", "amount", "created_at")
+
+
+def _state(bill):
+    return tuple(getattr(bill, f) for f in STATE_FIELDS)
+
+
+def _doctors(prescription_ids):
+    ids = {pid for pid in prescription_ids if pid}
+    if not ids:
+        return {}
+    return {
+        pid: (doctor_id, department or "")
+        for pid, doctor_id, department in
+        Prescription.objects.filter(id__in=ids).values_list("id", "doctor_id", "doctor__department")
+    }
+
+
+def _add(model, key, count_field, amount_field, count, amount, create=True):
+    changes = {count_field: F(count_field) + count, amount_field: F(amount_field) + amount}
+    if model.objects.filter(**key).update(**changes) or not create:
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(**key, **{count_field: count, amount_field: amount})
+    except IntegrityError:
+        # created by a concurrent writer in the meantime
+        model.objects.filter(**key).update(**changes)
+
+
+def record(changes):
+    """Apply ``[(old state, new state)]`` bill changes; a state is None for a bill that did not/no longer exists."""
+    changes = [(old, new) for old, new in changes if old != new]
+    if not changes:
+        return
+    doctors = _doctors(state[1] for pair in changes for state in pair if state)
+    revenue = defaultdict(lambda: [0, Decimal(0)])
+    balances = defaultdict(lambda: [0, Decimal(0)])
+    for old, new in changes:
+        for state, sign in ((old, -1), (new, 1)):
+            if state is None:
+                continue
+            patient_id, prescription_id, status, amount, created_at = state
+            amount = Decimal(str(amount))
+            doctor_id, department = doctors.get(prescription_id, (0, ""))
+            key = (timezone.localdate(created_at), department, doctor_id, status)
+            revenue[key][0] += sign
+            revenue[key][1] += sign * amount
+            if status == "unpaid":
+                balances[patient_id][0] += sign
+                balances[patient_id][1] += sign * amount
+
+    with transaction.atomic():
+        for (day, department, doctor_id, status), (count, amount) in sorted(revenue.items()):
+            if count or amount:
+                _add(RevenueRollup, {"day": day, "department": department, "doctor_id": doctor_id, "status": status},
+                     "bill_count", "amount", count, amount)
+        for patient_id, (count, amount) in sorted(balances.items()):
+            if count or amount:
+                # a missing balance is only ever created by a new unpaid bill; this also
+                # keeps cascading patient deletes from recreating the balance row
+                _add(PatientBalance, {"patient_id": patient_id}, "unpaid_count", "outstanding", count, amount,
+                     create=count > 0)
+
+
+def bills_created(bills):
+    """Count bills written with bulk_create."""
+    record([(None, _state(bill)) for bill in bills])
+    for bill in bills:
+        bill._loaded_bill = _state(bill)
+
+
+def bills_changed(bills):
+    """Count changes to loaded bills written with bulk_update or QuerySet.update."""
+    record([(bill._loaded_bill, _state(bill)) for bill in bills])
+    for bill in bills:
+        bill._loaded_bill = _state(bill)
+
+
+# ------------ receivers ------------
+@receiver(pre_save, sender=Billing)
+def remember_bill(sender, instance, raw=False, **kwargs):
+    loaded = getattr(instance, "_loaded_bill", None)
+    if raw or not instance.pk or (loaded and None not in (loaded[0], loaded[2], loaded[3], loaded[4])):
+        return
+    # not loaded from the database, or loaded with deferred fields: read what is stored
+    instance._loaded_bill = Billing.objects.filter(pk=instance.pk).values_list(*STATE_FIELDS).first()
+
+
+@receiver(post_save, sender=Billing)
+def bill_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    old = None if created else getattr(instance, "_loaded_bill", None)
+    record([(old, _state(instance))])
+    instance._loaded_bill = _state(instance)
+
+
+@receiver(post_delete, sender=Billing)
+def bill_deleted(sender, instance, **kwargs):
+    record([(getattr(instance, "_loaded_bill", None) or _state(instance), None)])
+
+
+# ------------ rebuild ------------
+def rebuild(chunk_size=CHUNK_SIZE, progress=None):
+    """
+    Recompute both tables from Billing, ``chunk_size`` bill ids at a time;
+    returns the number of rows written.
+
+    The tables are emptied first and refilled in the same transaction, so
+    their rows stay locked until the rebuild commits: the receivers of a bill
+    written meanwhile wait for it and then apply their change on top, instead
+    of updating rows the rebuild is about to replace. A bill that commits just
+    before the scan but whose receiver is still waiting is counted twice, so
+    stop writing bills while this runs (see ``manage.py rebuild_rollups``).
+    """
+    with transaction.atomic():
+        RevenueRollup.objects.all().delete()
+        PatientBalance.objects.all().delete()
+
+        bounds = Billing.objects.aggregate(first=Min("id"), last=Max("id"))
+        revenue = defaultdict(lambda: [0, Decimal(0)])
+        balances = defaultdict(lambda: [0, Decimal(0)])
+        start = bounds["first"] or 0
+        while bounds["last"] is not None and start <= bounds["last"]:
+            chunk = Billing.objects.filter(id__gte=start, id__lt=start + chunk_size).order_by()
+            for row in (
+                chunk.values(day=TruncDate("created_at"), department=F("prescription__doctor__department"),
+                             doctor=F("prescription__doctor_id"), bill_status=F("status"))
+                .annotate(n=Count("id"), total=Sum("amount"))
+            ):
+                key = (row["day"], row["department"] or "", row["doctor"] or 0, row["bill_status"])
+                revenue[key][0] += row["n"]
+                revenue[key][1] += row["total"]
+            for patient_id, n, total in (
+                chunk.filter(status="unpaid").values("patient_id").annotate(n=Count("id"), total=Sum("amount"))
+                .values_list("patient_id", "n", "total")
+            ):
+                balances[patient_id][0] += n
+                balances[patient_id][1] += total
+            start += chunk_size
+            if progress:
+                progress(min(start - 1, bounds["last"]), bounds["last"])
+
+        RevenueRollup.objects.bulk_create([
+            RevenueRollup(day=day, department=department, doctor_id=doctor_id, status=status,
+                          bill_count=count, amount=amount)
+            for (day, department, doctor_id, status), (count, amount) in revenue.items()
+        ], batch_size=1000)
+        PatientBalance.objects.bulk_create([
+            PatientBalance(patient_id=patient_id, unpaid_count=count, outstanding=amount)
+            for patient_id, (count, amount) in balances.items()
+        ], batch_size=1000)
+    return len(revenue) + len(balances)
+
+
+# ------------ reading ------------
+GROUPS = {
+    "day": "day",
+    "department": "department",
+    "doctor": "doctor_id",
+    "status": "status",
+}
+
+
+def revenue(date_from=None, date_to=None, group="day", department=None, doctor_id=None):
+    """Bill counts and totals, paid and unpaid, per ``group`` value."""
+    qs = RevenueRollup.objects.all()
+    if date_from:
+        qs = qs.filter(day__gte=date_from)
+    if date_to:
+        qs = qs.filter(day__lte=date_to)
+    if department:
+        qs = qs.filter(department=department)
+    if doctor_id is not None:
+        qs = qs.filter(doctor_id=doctor_id)
+    field = GROUPS[group]
+    rows = {}
+    for value, status, count, amount in (
+        qs.values(field, "status").annotate(count=Sum("bill_count"), total=Sum("amount"))
+        .order_by(field, "status").values_list(field, "status", "count", "total")
+    ):
+        row = rows.setdefault(value, {"key": value, "bills": 0, "amount": Decimal(0), "paid": Decimal(0),
+                                      "unpaid": Decimal(0)})
+        row["bills"] += count
+        row["amount"] += amount
+        if status in ("paid", "unpaid"):
+            row[status] += amount
+    for row in rows.values():
+        for f in ("amount", "paid", "unpaid"):
+            row[f] = row[f].quantize(CENTS)
+    return [row for row in rows.values() if row["bills"]]
+
+
+def default_period():
+    today = timezone.localdate()
+    return today - timedelta(days=29), today
+
+
+def top_balances(limit=20):
+    return list(
+        PatientBalance.objects.filter(outstanding__gt=0).select_related("patient__user").order_by("-outstanding")[:limit]
+    )
@@ -0,0 +1,483 @@
+"""
+Synthetic data for load and scale testing.
+
+``manage.py generate_data`` fills the database with doctors, patients and
+their availability, appointments, medical histories, prescriptions, bills,
+facilities and health resources, in volumes large enough to measure the
+app at production scale (ten million appointments and more).
+
+The data is skewed the way a hospital's is. Doctor popularity follows a Zipf
+curve, so the busiest doctors are booked solid while others have gaps.
+Patient visit rates follow a Pareto curve: most patients come a few times,
+while a chronic few (weight >= CHRONIC_WEIGHT) come constantly and
+accumulate long histories and prescriptions. Drug choice is skewed the same
+way. The same seed on the same starting database gives the same rows,
+whatever the number of workers.
+
+How it is written:
+
+* users, profiles, availability, facilities and resources go in with
+  bulk_create from this process;
+* the rest is generated per day, in tasks of DAYS_PER_TASK consecutive days
+  spread over a process pool. Each day is a fixed number of appointments,
+  handed out to the doctors working that weekday by popularity and capped
+  by their slots, so (doctor, date, time) never repeats. These rows are
+  written with executemany of plain tuples; bulk_create's per-value model
+  machinery costs ten times the insert itself at these volumes;
+* ids are assigned here, not by the database: appointment number k (counted
+  over the whole run) gets id ``first + k``, and its prescription, bill,
+  history entry and items take ids derived from k, so tasks never collide
+  and MySQL's missing bulk-insert ids do not matter. The id ranges of the
+  dependent tables have gaps where an appointment has no such row;
+* bulk inserts send no signals, so afterwards the dashboard counters and
+  revenue rollups are recomputed and the search index rebuilt.
+
+Run it against an otherwise idle database. SQLite takes one writer at a
+time, so there everything runs in one process.
+"""
+import math
+import random
+from collections import Counter
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+import django
+from django.apps import apps
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from accounts.models import User
+from doctor.formulary import read_formulary
+from doctor.models import DoctorAvailability, DoctorProfile, Prescription, PrescriptionItem
+from patient import search
+from patient.models import Appointment, Billing, HealthResource, MedicalHistory, PatientProfile
+from patient.slots import mask_to_slots, window_mask
+from . import counters, rollups
+from .models import Facility
+
+BATCH_SIZE = 5000
+DAYS_PER_TASK = 7
+SQLITE_CACHE_KB = 256 * 1024
+# share of the slots in the generated period that get booked, when --days is not given
+FILL = 0.6
+MAX_FILL = 0.95
+MAX_DAYS = 10 * 366
+
+DOCTOR_SKEW = 1.0
+PATIENT_SKEW = 1.5
+MAX_PATIENT_WEIGHT = 30.0
+CHRONIC_WEIGHT = 8.0
+DRUG_SKEW = 1.1
+MAX_ITEMS = 4
+
+PAST_STATUSES = (("completed", 0.86), ("cancelled", 0.14))
+FUTURE_STATUSES = (("confirmed", 0.55), ("pending", 0.40), ("cancelled", 0.05))
+PRESCRIBED = 0.7
+BILLED = 0.95
+HISTORY = 0.12
+CHRONIC_HISTORY = 0.45
+ALLERGIC = 0.08
+SETTLED_AFTER = timedelta(days=30)
+
+DEPARTMENTS = (
+    ("General Medicine", ("General Physician", "Internist"), 8),
+    ("Cardiology", ("Cardiologist", "Interventional Cardiologist"), 4),
+    ("Orthopedics", ("Orthopedic Surgeon", "Sports Medicine"), 4),
+    ("Pediatrics", ("Pediatrician", "Neonatologist"), 4),
+    ("Dermatology", ("Dermatologist",), 3),
+    ("Gynecology", ("Gynecologist", "Obstetrician"), 3),
+    ("ENT", ("ENT Specialist",), 2),
+    ("Neurology", ("Neurologist",), 2),
+    ("Psychiatry", ("Psychiatrist",), 2),
+    ("Endocrinology", ("Endocrinologist", "Diabetologist"), 2),
+    ("Nephrology", ("Nephrologist",), 1),
+    ("Oncology", ("Oncologist",), 1),
+)
+FIRST_NAMES = (
+    "Aarav", "Aditi", "Akash", "Ananya", "Arjun", "Bhavna", "Deepak", "Divya", "Farhan", "Gauri", "Harish",
+    "Isha", "Karan", "Kavya", "Lakshmi", "Manoj", "Meera", "Mohit", "Nandini", "Neha", "Nikhil", "Pooja",
+    "Pranav", "Priya", "Rahul", "Riya", "Rohan", "Sanjay", "Sara", "Shreya", "Suresh", "Tanvi", "Varun",
+    "Vidya", "Vikram", "Zoya",
+)
+LAST_NAMES = (
+    "Agarwal", "Banerjee", "Bhat", "Chopra", "Das", "Desai", "Fernandes", "Ghosh", "Gupta", "Iyer", "Joshi",
+    "Kapoor", "Khan", "Kumar", "Mehta", "Menon", "Mishra", "Nair", "Patel", "Pillai", "Rao", "Reddy",
+    "Shah", "Sharma", "Singh", "Thomas", "Varma", "Verma",
+)
+CITIES = ("Kochi", "Thiruvananthapuram", "Kozhikode", "Bengaluru", "Chennai", "Mumbai", "Pune", "Hyderabad")
+INSURERS = ("", "", "Star Health", "HDFC Ergo", "ICICI Lombard", "New India Assurance", "CGHS")
+DIAGNOSES = (
+    "Viral fever", "Upper respiratory tract infection", "Acute gastroenteritis", "Migraine", "Low back pain",
+    "Urinary tract infection", "Allergic rhinitis", "Conjunctivitis", "Sprained ankle", "Tension headache",
+    "Acid peptic disease", "Contact dermatitis", "Otitis media", "Anxiety", "Iron deficiency anaemia",
+)
+# chronic condition -> its usual long-term medication
+CHRONIC = (
+    ("Type 2 diabetes mellitus", "Metformin 500 mg"),
+    ("Essential hypertension", "Amlodipine 5 mg, Lisinopril 10 mg"),
+    ("Atrial fibrillation", "Warfarin 5 mg"),
+    ("Hypercholesterolaemia", "Atorvastatin 20 mg"),
+    ("Bronchial asthma", "Salbutamol inhaler"),
+    ("Hypothyroidism", "Levothyroxine 50 mcg"),
+    ("Chronic kidney disease", "Furosemide 40 mg"),
+    ("Coronary artery disease", "Aspirin 75 mg, Clopidogrel 75 mg"),
+    ("Depression", "Sertraline 50 mg"),
+    ("Epilepsy", "Levetiracetam 500 mg"),
+)
+ALLERGIES = ("Penicillin", "Sulfa drugs", "Aspirin", "Codeine", "Ibuprofen", "Peanuts", "Latex", "Cephalosporins")
+TREATMENTS = ("Rest and fluids", "Medication as prescribed", "Physiotherapy", "Diet and exercise", "Review in 2 weeks")
+DOSAGES = ("250 mg", "500 mg", "650 mg", "5 mg", "10 mg", "20 mg", "40 mg", "1 tablet", "5 ml", "2 puffs")
+FREQUENCIES = ("1-0-1", "1-1-1", "1-0-0", "0-0-1", "1-1-1-1", "SOS")
+DURATIONS = ("3 days", "5 days", "7 days", "10 days", "14 days", "1 month", "3 months")
+NOTES = ("", "", "Take after food.", "Review after the course.", "Avoid driving.", "Drink plenty of water.")
+FEES = (Decimal("300.00"), Decimal("500.00"), Decimal("500.00"), Decimal("750.00"), Decimal("1200.00"))
+ITEM_CHARGE = Decimal("85.00")
+FACILITY_KINDS = ("Ward", "ICU", "Operation Theatre", "Outpatient Clinic", "Lab", "Pharmacy", "Radiology Suite")
+BLOCKS = ("Block A", "Block B", "Block C", "Main Building", "East Wing", "West Wing")
+RESOURCE_WORDS = (
+    "health", "patients", "doctor", "treatment", "symptoms", "diet", "exercise", "sleep", "blood", "pressure",
+    "sugar", "heart", "diabetes", "asthma", "vaccination", "children", "pregnancy", "infection", "fever",
+    "hydration", "medicine", "dosage", "allergy", "screening", "cholesterol", "stress", "mental", "nutrition",
+    "vitamin", "hospital", "emergency", "recovery", "surgery", "physiotherapy", "prevention", "hygiene",
+    "monsoon", "dengue", "malaria", "kidney", "thyroid", "cancer", "smoking", "alcohol", "walking", "yoga",
+)
+MORNING = (time(9, 0), time(13, 0))
+AFTERNOON = (time(14, 0), time(17, 0))
+
+
+# ------------ planning ------------
+def _next_id(model):
+    return (model.objects.aggregate(last=Max("id"))["last"] or 0) + 1
+
+
+def _zipf(rng, n, skew):
+    """Weights 1/rank**skew for ``n`` items, the ranks shuffled."""
+    ranks = list(range(1, n + 1))
+    rng.shuffle(ranks)
+    return [1 / r ** skew for r in ranks]
+
+
+def _doctor_hours(rng):
+    """``{weekday: [(start, end)]}`` for one doctor."""
+    weekdays = [0, 1, 2, 3, 4]
+    if rng.random() < 0.3:
+        weekdays.append(5)
+    if rng.random() < 0.05:
+        weekdays.append(6)
+    windows = [MORNING, AFTERNOON] if rng.random() < 0.8 else [MORNING]
+    return {day: windows for day in weekdays}
+
+
+def plan(doctors, patients, appointments, facilities=0, resources=0, days=None, future_days=28, seed=1,
+         days_per_task=DAYS_PER_TASK):
+    """
+    Everything the workers need to know, as a small picklable dict: the
+    first id of each table, who works when, and how many appointments each
+    day gets. Raises ValueError if the appointments do not fit the slots.
+    """
+    rng = random.Random(f"{seed}:doctors")
+    hours = [_doctor_hours(rng) for _ in range(doctors)]
+    capacity = [0] * 7
+    for doctor_hours in hours:
+        for weekday, windows in doctor_hours.items():
+            capacity[weekday] += sum(len(mask_to_slots(window_mask(*w))) for w in windows)
+    if appointments and not doctors:
+        raise ValueError("Appointments need at least one doctor.")
+    if appointments and not patients:
+        raise ValueError("Appointments need at least one patient.")
+
+    if days is None:
+        days = math.ceil(appointments / (sum(capacity) / 7 * FILL)) if appointments else 0
+        if days > MAX_DAYS:
+            raise ValueError(
+                f"{doctors} doctors would need {days} days for {appointments} appointments; "
+                f"add doctors or pass --days."
+            )
+    future_days = min(future_days, days)
+    first_day = timezone.localdate() - timedelta(days=days - future_days)
+    calendar = [first_day + timedelta(days=i) for i in range(days)]
+    available = sum(capacity[day.weekday()] for day in calendar)
+    if appointments > available * MAX_FILL:
+        raise ValueError(
+            f"{appointments} appointments do not fit the {available} slots of {doctors} doctors over "
+            f"{days} days; add doctors or days."
+        )
+
+    # each day's share of the appointments in proportion to its slots (largest remainder)
+    exact = [appointments * capacity[day.weekday()] / available for day in calendar] if available else []
+    targets = [int(x) for x in exact]
+    for i in sorted(range(len(exact)), key=lambda i: targets[i] - exact[i])[:appointments - sum(targets)]:
+        targets[i] += 1
+
+    tasks, first = [], 0
+    for start in range(0, days, days_per_task):
+        chunk = list(zip(calendar[start:start + days_per_task], targets[start:start + days_per_task]))
+        tasks.append({"index": len(tasks), "first": first, "days": chunk})
+        first += sum(n for _, n in chunk)
+
+    ids = {
+        "user": _next_id(User), "doctor": _next_id(DoctorProfile), "patient": _next_id(PatientProfile),
+        "appointment": _next_id(Appointment), "prescription": _next_id(Prescription),
+        "item": _next_id(PrescriptionItem), "bill": _next_id(Billing), "history": _next_id(MedicalHistory),
+    }
+    return {
+        "seed": seed, "doctors": doctors, "patients": patients, "appointments": appointments,
+        "facilities": facilities, "resources": resources, "hours": hours, "ids": ids, "tasks": tasks,
+        # the generated history ends at the start of today, so a rerun on the same day is identical
+        "today": timezone.localdate(), "now": timezone.make_aware(datetime.combine(timezone.localdate(), time.min)),
+    }
+
+
+# ------------ people and places ------------
+def _person(rng):
+    return rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+
+
+def create_people(plan, password, batch_size=BATCH_SIZE):
+    """Doctors, patients, their users and the doctors' availability; returns the number of users."""
+    rng = random.Random(f"{plan['seed']}:people")
+    password = make_password(password)
+    ids = plan["ids"]
+    departments = [d for d, _, _ in DEPARTMENTS]
+    department_weights = [w for _, _, w in DEPARTMENTS]
+    specializations = {d: s for d, s, _ in DEPARTMENTS}
+    joined = plan["now"]
+
+    users, doctors, patients, windows = [], [], [], []
+    for i in range(plan["doctors"]):
+        user_id, doctor_id = ids["user"] + i, ids["doctor"] + i
+        first, last = _person(rng)
+        department = rng.choices(departments, department_weights)[0]
+        users.append(User(id=user_id, username=f"synth-d{user_id}", email=f"synth-d{user_id}@example.com",
+                          first_name=first, last_name=last, password=password, role="doctor", date_joined=joined))
+        doctors.append(DoctorProfile(id=doctor_id, user_id=user_id, department=department,
+                                     specialization=rng.choice(specializations[department]),
+                                     bio=f"{department} consultant."))
+        for weekday, day_windows in plan["hours"][i].items():
+            windows.extend(
+                DoctorAvailability(doctor_id=doctor_id, day_of_week=weekday, start_time=start, end_time=end)
+                for start, end in day_windows
+            )
+    offset = plan["doctors"]
+    for i in range(plan["patients"]):
+        user_id = ids["user"] + offset + i
+        first, last = _person(rng)
+        users.append(User(id=user_id, username=f"synth-p{user_id}", email=f"synth-p{user_id}@example.com",
+                          first_name=first, last_name=last, password=password, role="patient", date_joined=joined))
+        patients.append(PatientProfile(
+            id=ids["patient"] + i, user_id=user_id, phone=f"9{rng.randrange(10 ** 9):09d}",
+            address=f"{rng.randrange(1, 400)}, {rng.choice(LAST_NAMES)} Road, {rng.choice(CITIES)}",
+            insurance_info=rng.choice(INSURERS),
+        ))
+
+    with transaction.atomic():
+        User.objects.bulk_create(users, batch_size=batch_size)
+        DoctorProfile.objects.bulk_create(doctors, batch_size=batch_size)
+        PatientProfile.objects.bulk_create(patients, batch_size=batch_size)
+        DoctorAvailability.objects.bulk_create(windows, batch_size=batch_size)
+    return len(users)
+
+
+def create_places(plan, batch_size=BATCH_SIZE):
+    """Facilities and health resources; returns how many were created."""
+    rng = random.Random(f"{plan['seed']}:places")
+    facilities = [
+        Facility(name=f"{rng.choice(FACILITY_KINDS)} {i + 1}", location=rng.choice(BLOCKS),
+                 department=rng.choice(DEPARTMENTS)[0], resources=f"{rng.randrange(4, 40)} beds")
+        for i in range(plan["facilities"])
+    ]
+    word_weights = _zipf(rng, len(RESOURCE_WORDS), DOCTOR_SKEW)
+    resources = []
+    for i in range(plan["resources"]):
+        title = " ".join(rng.choices(RESOURCE_WORDS, word_weights, k=3)).capitalize()
+        paragraphs = [
+            " ".join(rng.choices(RESOURCE_WORDS, word_weights, k=rng.randrange(40, 90))).capitalize() + "."
+            for _ in range(rng.randrange(2, 6))
+        ]
+        resources.append(HealthResource(title=f"{title} ({i + 1})", content="\n\n".join(paragraphs)))
+    with transaction.atomic():
+        Facility.objects.bulk_create(facilities, batch_size=batch_size)
+        HealthResource.objects.bulk_create(resources, batch_size=batch_size)
+    return len(facilities) + len(resources)
+
+
+# ------------ appointments and what follows them ------------
+_populations = {}
+
+
+def _population(plan):
+    """Per-process: doctors by weekday, and the patients' and drugs' cumulative weights."""
+    key = (plan["seed"], plan["ids"]["doctor"], plan["ids"]["patient"], plan["doctors"], plan["patients"])
+    if key not in _populations:
+        rng = random.Random(f"{plan['seed']}:population")
+        popularity = _zipf(rng, plan["doctors"], DOCTOR_SKEW)
+        by_weekday = {weekday: [] for weekday in range(7)}
+        for i, (weight, doctor_hours) in enumerate(zip(popularity, plan["hours"])):
+            for weekday, windows in doctor_hours.items():
+                slots = [time.fromisoformat(s) for w in windows for s in mask_to_slots(window_mask(*w))]
+                by_weekday[weekday].append((plan["ids"]["doctor"] + i, weight, slots))
+        weights = [min(rng.paretovariate(PATIENT_SKEW), MAX_PATIENT_WEIGHT) for _ in range(plan["patients"])]
+        cumulative, total = [], 0.0
+        for w in weights:
+            total += w
+            cumulative.append(total)
+        drugs = read_formulary(settings.FORMULARY_FILE) or ["Paracetamol"]
+        drug_weights = _zipf(rng, len(drugs), DRUG_SKEW)
+        drug_cumulative, total = [], 0.0
+        for w in drug_weights:
+            total += w
+            drug_cumulative.append(total)
+        _populations.clear()
+        _populations[key] = (by_weekday, weights, cumulative, drugs, drug_cumulative)
+    return _populations[key]
+
+
+def _book(rng, doctors, target):
+    """``[(doctor_id, time)]``: ``target`` distinct slots among ``doctors``, busiest first."""
+    weights = [w * rng.uniform(0.5, 1.5) for _, w, _ in doctors]
+    total = sum(weights)
+    counts = [min(len(slots), int(target * w / total)) for (_, _, slots), w in zip(doctors, weights)]
+    short = target - sum(counts)
+    order = sorted(range(len(doctors)), key=weights.__getitem__, reverse=True)
+    while short:
+        for i in order:
+            if counts[i] < len(doctors[i][2]):
+                counts[i] += 1
+                short -= 1
+                if not short:
+                    break
+    booked = []
+    for (doctor_id, _, slots), n in zip(doctors, counts):
+        booked.extend((doctor_id, t) for t in sorted(rng.sample(slots, n)))
+    return booked
+
+
+def _pick(rng, choices):
+    x = rng.random()
+    for value, p in choices:
+        x -= p
+        if x < 0:
+            return value
+    return choices[-1][0]
+
+
+def _insert(model, fields, rows, batch_size):
+    """INSERT ``rows``, tuples of database-ready values for ``fields``, ``batch_size`` at a time."""
+    if not rows:
+        return
+    qn = connection.ops.quote_name
+    sql = "INSERT INTO %s (%s) VALUES (%s)" % (
+        qn(model._meta.db_table),
+        ", ".join(qn(model._meta.get_field(f).column) for f in fields),
+        ", ".join(["%s"] * len(fields)),
+    )
+    with connection.cursor() as cursor:
+        for i in range(0, len(rows), batch_size):
+            cursor.executemany(sql, rows[i:i + batch_size])
+
+
+APPOINTMENT_COLUMNS = ("id", "patient", "doctor", "date", "time", "status")
+PRESCRIPTION_COLUMNS = ("id", "doctor", "patient", "notes", "created_at")
+ITEM_COLUMNS = ("id", "prescription", "drug_name", "dosage", "frequency", "duration")
+BILL_COLUMNS = ("id", "patient", "prescription", "amount", "status", "stripe_payment_intent", "created_at", "paid_at")
+HISTORY_COLUMNS = ("id", "patient", "diagnosis", "medications", "allergies", "treatment", "date")
+
+
+def fill(plan, task, batch_size=BATCH_SIZE):
+    """Write the appointments of one task's days and the rows that follow them; returns counts per table."""
+    by_weekday, weights, cumulative, drugs, drug_cumulative = _population(plan)
+    ids, today, now = plan["ids"], plan["today"], plan["now"]
+    tz = timezone.get_current_timezone()
+    db_tz = connection.timezone
+
+    def stamp(value):
+        # what adapt_datetimefield_value() gives, without its per-call settings lookups
+        return str(value.astimezone(db_tz).replace(tzinfo=None))
+
+    if connection.vendor == "sqlite":
+        # the default 2 MB page cache thrashes on the secondary indexes of large tables
+        with connection.cursor() as cursor:
+            cursor.execute(f"PRAGMA cache_size = -{SQLITE_CACHE_KB}")
+    ops = connection.ops
+    rng = random.Random(f"{plan['seed']}:days:{task['index']}")
+    patient_indexes = range(plan["patients"])
+    written = Counter()
+    k = task["first"]
+
+    for day, target in task["days"]:
+        appointments, prescriptions, items, bills, histories = [], [], [], [], []
+        past = day < today
+        day_value = ops.adapt_datefield_value(day)
+        booked = _book(rng, by_weekday[day.weekday()], target)
+        chosen = rng.choices(patient_indexes, cum_weights=cumulative, k=len(booked))
+        for (doctor_id, t), p in zip(booked, chosen):
+            patient_id = ids["patient"] + p
+            status = _pick(rng, PAST_STATUSES if past else FUTURE_STATUSES)
+            appointments.append((ids["appointment"] + k, patient_id, doctor_id, day_value,
+                                 ops.adapt_timefield_value(t), status))
+            if status == "completed":
+                seen = datetime.combine(day, t, tz) + timedelta(minutes=rng.randrange(5, 30))
+                chronic = weights[p] >= CHRONIC_WEIGHT
+                if rng.random() < (CHRONIC_HISTORY if chronic else HISTORY):
+                    if chronic:
+                        diagnosis, medications = CHRONIC[(p * 2654435761) % len(CHRONIC)]
+                    else:
+                        diagnosis, medications = rng.choice(DIAGNOSES), ""
+                    allergies = rng.choice(ALLERGIES) if rng.random() < ALLERGIC else "None"
+                    histories.append((ids["history"] + k, patient_id, diagnosis, medications, allergies,
+                                      rng.choice(TREATMENTS), day_value))
+                if rng.random() < PRESCRIBED:
+                    rx_id = ids["prescription"] + k
+                    created = stamp(seen)
+                    prescriptions.append((rx_id, doctor_id, patient_id, rng.choice(NOTES), created))
+                    n = rng.choices(range(1, MAX_ITEMS + 1), (40, 35, 15, 10))[0]
+                    for j, drug in enumerate(rng.choices(drugs, cum_weights=drug_cumulative, k=n)):
+                        items.append((ids["item"] + k * MAX_ITEMS + j, rx_id, drug, rng.choice(DOSAGES),
+                                      rng.choice(FREQUENCIES), rng.choice(DURATIONS)))
+                    if rng.random() < BILLED:
+                        amount = rng.choice(FEES) + ITEM_CHARGE * n
+                        paid_at = None
+                        if rng.random() < (0.93 if now - seen > SETTLED_AFTER else 0.55):
+                            paid_at = min(seen + timedelta(days=rng.randrange(0, 21), minutes=rng.randrange(60)), now)
+                        bills.append((
+                            ids["bill"] + k, patient_id, rx_id, ops.adapt_decimalfield_value(amount, 10, 2),
+                            "paid" if paid_at else "unpaid", f"pi_synthetic_{ids['bill'] + k}" if paid_at else None,
+                            created, stamp(paid_at) if paid_at else None,
+                        ))
+            k += 1
+
+        with transaction.atomic():
+            _insert(Appointment, APPOINTMENT_COLUMNS, appointments, batch_size)
+            _insert(MedicalHistory, HISTORY_COLUMNS, histories, batch_size)
+            _insert(Prescription, PRESCRIPTION_COLUMNS, prescriptions, batch_size)
+            _insert(PrescriptionItem, ITEM_COLUMNS, items, batch_size)
+            _insert(Billing, BILL_COLUMNS, bills, batch_size)
+        written.update(appointments=len(appointments), histories=len(histories), prescriptions=len(prescriptions),
+                       items=len(items), bills=len(bills))
+    return written
+
+
+def init_worker():
+    # needed where workers are spawned rather than forked
+    if not apps.ready:
+        django.setup()
+
+
+# ------------ afterwards ------------
+def finish():
+    """Bring everything that bulk inserts bypass up to date."""
+    statements = connection.ops.sequence_reset_sql(no_style(), [
+        User, DoctorProfile, PatientProfile, Appointment, Prescription, PrescriptionItem, Billing, MedicalHistory,
+    ])
+    if statements:
+        with connection.cursor() as cursor:
+            for sql in statements:
+                cursor.execute(sql)
+    counters.reconcile()
+    rollups.rebuild()
+    search.rebuild_index()
+
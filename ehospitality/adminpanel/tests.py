@@ -1,3 +1,133 @@
-from django.test import TestCase
+import io
+from decimal import Decimal
 
-# Create your tests here.
+from django.http import QueryDict
+from django.test import RequestFactory, TestCase
+
+from accounts.models import User
+from doctor.models import DoctorProfile, Prescription
+from patient.models import Billing
+from . import imports, rollups
+from .models import PatientBalance, RevenueRollup
+from .pagination import paginate
+
+
+class PaginationTests(TestCase):
+    def setUp(self):
+        # repeated last names so the unique id breaks ties
+        for i in range(23):
+            User.objects.create(username=f"user{i:02d}", last_name="abc"[i % 3])
+        self.ordering = ["-last_name", "id"]
+        self.expected = list(User.objects.order_by(*self.ordering))
+
+    def page(self, query=""):
+        return paginate(RequestFactory().get("/", QueryDict(query)), User.objects.all(), self.ordering, per_page=5)
+
+    def test_forward_and_back_cover_every_row_once(self):
+        pages, page = [], self.page()
+        self.assertFalse(page.has_previous)
+        while True:
+            pages.append(list(page))
+            if not page.has_next:
+                break
+            page = self.page(page.next_query)
+        self.assertEqual([u for p in pages for u in p], self.expected)
+        self.assertEqual([len(p) for p in pages], [5, 5, 5, 5, 3])
+
+        backwards = []
+        while page.has_previous:
+            page = self.page(page.previous_query)
+            backwards.insert(0, list(page))
+        self.assertEqual(backwards, pages[:-1])
+
+    def test_keeps_other_parameters_and_ignores_a_bad_cursor(self):
+        page = self.page("q=x")
+        self.assertIn("q=x", page.next_query)
+        self.assertEqual(list(self.page("after=garbage")), self.expected[:5])
+
+    def test_rejects_unknown_fields(self):
+        with self.assertRaises(ValueError):
+            paginate(RequestFactory().get("/"), User.objects.all(), ["nope", "id"])
+
+
+class RollupTests(TestCase):
+    def setUp(self):
+        doctor = DoctorProfile.objects.create(
+            user=User.objects.create(username="doc", role="doctor"), department="Cardiology",
+        )
+        self.patient = User.objects.create(username="pat", role="patient").patientprofile
+        self.bills = [
+            Billing.objects.create(patient=self.patient, amount=amount,
+                                   prescription=Prescription.objects.create(doctor=doctor, patient=self.patient))
+            for amount in ("100.00", "250.50", "40.00")
+        ]
+        Billing.objects.create(patient=self.patient, amount="12.00")
+
+    def snapshot(self):
+        return (
+            sorted(RevenueRollup.objects.filter(bill_count__gt=0)
+                   .values_list("day", "department", "doctor_id", "status", "bill_count", "amount")),
+            sorted(PatientBalance.objects.values_list("patient_id", "unpaid_count", "outstanding")),
+        )
+
+    def test_receivers_track_creates_changes_and_deletes(self):
+        self.assertEqual(PatientBalance.objects.get().outstanding, Decimal("402.50"))
+        bill = self.bills[1]
+        bill.status = "paid"
+        bill.save()
+        self.bills[0].delete()
+        balance = PatientBalance.objects.get()
+        self.assertEqual((balance.unpaid_count, balance.outstanding), (2, Decimal("52.00")))
+        rows = {row["key"]: row for row in rollups.revenue(group="department")}
+        self.assertEqual((rows["Cardiology"]["paid"], rows["Cardiology"]["unpaid"]), (Decimal("250.50"), Decimal("40.00")))
+        self.assertEqual(rows[""]["bills"], 1)
+
+    def test_rebuild_matches_the_incremental_tables(self):
+        bill = Billing.objects.get(pk=self.bills[2].pk)
+        bill.status = "paid"
+        bill.save()
+        incremental = self.snapshot()
+        RevenueRollup.objects.update(amount=0)
+        PatientBalance.objects.all().delete()
+        rollups.rebuild(chunk_size=2)
+        self.assertEqual(self.snapshot(), incremental)
+
+    def test_bulk_writes_are_counted_explicitly(self):
+        bills = Billing.objects.bulk_create([Billing(patient=self.patient, amount="5.00") for _ in range(3)])
+        rollups.bills_created(bills)
+        self.assertEqual(PatientBalance.objects.get().unpaid_count, 7)
+
+
+class ImportTests(TestCase):
+    def rows(self, text, fmt="csv"):
+        return list(imports.read_rows(io.StringIO(text), fmt))
+
+    def test_csv_import_creates_users_and_profiles(self):
+        User.objects.create(username="taken")
+        rows = self.rows(
+            "username,email,role,department,password\n"
+            "alice,alice@example.com,doctor,Cardiology,s3cret-pass\n"
+            "bob,,patient,,\n"
+            "bob,,patient,,\n"
+            "taken,,patient,,\n"
+            "carol,not-an-email,patient,,\n"
+            "dave,,nurse,,\n"
+        )
+        report = imports.import_users(rows, workers=1)
+        self.assertEqual(report.rows, 6)
+        self.assertEqual(dict(report.created), {"doctor": 1, "patient": 1})
+        self.assertEqual([(line, name) for line, name, _ in report.errors],
+                         [(4, "bob"), (6, "carol"), (7, "dave"), (5, "taken")])
+
+        alice = User.objects.get(username="alice")
+        self.assertEqual(alice.doctor_profile.department, "Cardiology")
+        self.assertTrue(alice.check_password("s3cret-pass"))
+        self.assertFalse(User.objects.get(username="bob").has_usable_password())
+        self.assertTrue(User.objects.get(username="bob").patientprofile)
+
+    def test_jsonl_errors_and_dry_run(self):
+        rows = self.rows('{"username": "erin"}\nnot json\n[1]\n', "jsonl")
+        report = imports.import_users(rows, workers=1, dry_run=True)
+        self.assertEqual(report.error_count, 2)
+        self.assertEqual(report.created, {})
+        self.assertFalse(User.objects.filter(username="erin").exists())
@@ -6,11 +6,13 @@ app_name = "adminpanel"
 urlpatterns = [
 
     path("dashboard/", views.admin_dashboard, name="admin_dashboard"),
+    path("dashboard/cache-stats/", views.cache_stats, name="cache_stats"),  # JSON
     # User management
 
     path("users/", views.manage_users, name="manage_users"),
     path("users/edit/<int:user_id>/", views.edit_user, name="edit_user"),
     path("users/delete/<int:user_id>/", views.delete_user, name="delete_user"),
+    path("users/import/", views.import_users, name="import_users"),
 
     # Facility management
     path("facilities/", views.manage_facilities, name="manage_facilities"),
@@ -22,6 +24,15 @@ urlpatterns = [
     path("appointments/", views.manage_appointments, name="manage_appointments"),
     path("appointments/delete/<int:appointment_id>/", views.delete_appointment, name="delete_appointment"),
 
+    # Exports
+    path("exports/", views.export_list, name="export_list"),
+    path("exports/<slug:kind>/", views.export_data, name="export_data"),  # streams CSV / NDJSON
+
+    # Finance reports, read from the rollup tables
+    path("reports/revenue/", views.revenue_report, name="revenue_report"),
+    path("reports/revenue/data/", views.revenue_data, name="revenue_data"),  # JSON
+    path("reports/balances/data/", views.balance_data, name="balance_data"),  # JSON
+
 
     # Doctor Management
     path("manage-doctors/", views.manage_doctors, name="manage_doctors"),
@@ -1,16 +1,38 @@
+import io
 from datetime import date
+from itertools import islice
+from django.http import Http404, JsonResponse, StreamingHttpResponse
 from django.shortcuts import render, redirect, get_object_or_404
+from doctor import agenda
+from patient import search
 from doctor.models import DoctorProfile
 from patient.models import PatientProfile, HealthResource,Appointment
-from .forms import UserForm, FacilityForm, AppointmentForm,HealthResourceForm
+from .forms import UserForm, FacilityForm, AppointmentForm,HealthResourceForm, UserImportForm
 from accounts.models import User
+from accounts.utils import admin_required
 from .models import Facility
+from . import exports, imports, rollups
+from .counters import read_counters
+from .pagination import paginate
 from django.contrib import messages
 
+# sort options for the paginated lists; each ends in a unique key
+APPOINTMENT_SORTS = {
+    "newest": ("-date", "-time", "-id"),
+    "oldest": ("date", "time", "id"),
+}
+USER_SORTS = {
+    "newest": ("-id",),
+    "username": ("username", "id"),
+}
+
+
+def _date_param(request, name):
+    try:
+        return date.fromisoformat(request.GET.get(name, ""))
+    except ValueError:
+        return None
 
-def manage_appointments(request):
-    appointments = Appointment.objects.all().order_by("-date", "-time")
-    return render(request, "adminpanel/manage_appointments.html", {"appointments": appointments})
 
 # Edit appointment
 
@@ -36,32 +58,34 @@ def delete_appointment(request, appointment_id):
         return redirect("adminpanel:manage_appointments")
     return render(request, "adminpanel/delete_appointment.html", {"appointment": appointment})
 def admin_dashboard(request):
-    # counts
-    user_count = User.objects.count()
-    doctor_count = DoctorProfile.objects.count()
-    patient_count = PatientProfile.objects.count()
-    facility_count = Facility.objects.count()
-    resource_count = HealthResource.objects.count()
-    appointment_count = Appointment.objects.count()
-
-    appointments = Appointment.objects.all().order_by("-date")
+    # counts, kept current by adminpanel.counters
+    counts = read_counters()
 
     return render(request, "adminpanel/dashboard.html", {
-        "user_count": user_count,
-        "doctor_count": doctor_count,
-        "patient_count": patient_count,
-        "facility_count": facility_count,
-        "resource_count": resource_count,
-        "appointment_count": appointment_count,
-
-        "appointments": appointments,
+        "user_count": counts["users"],
+        "doctor_count": counts["doctors"],
+        "patient_count": counts["patients"],
+        "facility_count": counts["facilities"],
+        "resource_count": counts["resources"],
+        "appointment_count": counts["appointments"],
     })
 
 
+def cache_stats(request):
+    # per process: each worker reports its own counts
+    return JsonResponse({"agenda": agenda.stats()})
+
+
 # ------------------ USER MANAGEMENT ------------------
 def manage_users(request):
     users = User.objects.all()
-    return render(request, "adminpanel/manage_users.html", {"users": users})
+    role = request.GET.get("role")
+    if role:
+        users = users.filter(role=role)
+    page = paginate(request, users, USER_SORTS.get(request.GET.get("sort"), USER_SORTS["newest"]))
+    return render(request, "adminpanel/manage_users.html", {
+        "users": page, "page": page, "roles": User.ROLE_CHOICES, "sorts": USER_SORTS,
+    })
 
 
 def edit_user(request, user_id):
@@ -85,7 +109,11 @@ def delete_user(request, user_id):
 # ------------------ FACILITY MANAGEMENT ------------------
 def manage_facilities(request):
     facilities = Facility.objects.all()
-    return render(request, "adminpanel/facilities.html", {"facilities": facilities})
+    department = request.GET.get("department")
+    if department:
+        facilities = facilities.filter(department=department)
+    page = paginate(request, facilities, ("name", "id"))
+    return render(request, "adminpanel/facilities.html", {"facilities": page, "page": page})
 
 
 def add_facility(request):
@@ -119,8 +147,21 @@ def delete_facility(request, facility_id):
 
 # ------------------ APPOINTMENT MANAGEMENT ------------------
 def manage_appointments(request):
-    appointments = Appointment.objects.select_related("patient", "doctor").order_by("-date")
-    return render(request, "adminpanel/manage_appointments.html", {"appointments": appointments})
+    appointments = Appointment.objects.select_related("patient__user", "doctor__user")
+    status = request.GET.get("status")
+    if status:
+        appointments = appointments.filter(status=status)
+    date_from, date_to = _date_param(request, "date_from"), _date_param(request, "date_to")
+    if date_from:
+        appointments = appointments.filter(date__gte=date_from)
+    if date_to:
+        appointments = appointments.filter(date__lte=date_to)
+    if request.GET.get("department"):
+        appointments = appointments.filter(doctor__department=request.GET["department"])
+    page = paginate(request, appointments, APPOINTMENT_SORTS.get(request.GET.get("sort"), APPOINTMENT_SORTS["newest"]))
+    return render(request, "adminpanel/manage_appointments.html", {
+        "appointments": page, "page": page, "statuses": Appointment.STATUS_CHOICES, "sorts": APPOINTMENT_SORTS,
+    })
 
 
 def delete_appointment(request, appointment_id):
@@ -128,11 +169,102 @@ def delete_appointment(request, appointment_id):
     appointment.delete()
     return redirect("adminpanel:manage_appointments")
 
+
+# ------------------ EXPORTS ------------------
+@admin_required
+def export_list(request):
+    return render(request, "adminpanel/exports.html", {"kinds": exports.EXPORTS, "formats": exports.FORMATS})
+
+
+@admin_required
+def export_data(request, kind):
+    fmt = request.GET.get("format", "csv")
+    if kind not in exports.EXPORTS or fmt not in exports.FORMATS:
+        raise Http404("No such export")
+    date_from, date_to = _date_param(request, "date_from"), _date_param(request, "date_to")
+    response = StreamingHttpResponse(
+        exports.export_lines(kind, fmt, date_from, date_to), content_type=exports.FORMATS[fmt],
+    )
+    response["Content-Disposition"] = f'attachment; filename="{exports.filename(kind, fmt, date_from, date_to)}"'
+    return response
+
+# ------------------ REPORTS ------------------
+def _revenue_params(request):
+    default_from, default_to = rollups.default_period()
+    group = request.GET.get("group", "day")
+    return {
+        "date_from": _date_param(request, "date_from") or default_from,
+        "date_to": _date_param(request, "date_to") or default_to,
+        "group": group if group in rollups.GROUPS else "day",
+        "department": request.GET.get("department") or None,
+    }
+
+
+def _doctor_names(rows):
+    ids = [row["key"] for row in rows if row["key"]]
+    return {
+        d.id: d.user.get_full_name() or d.user.username
+        for d in DoctorProfile.objects.filter(id__in=ids).select_related("user")
+    }
+
+
+@admin_required
+def revenue_report(request):
+    params = _revenue_params(request)
+    rows = rollups.revenue(**params)
+    if params["group"] == "doctor":
+        names = _doctor_names(rows)
+        for row in rows:
+            row["label"] = names.get(row["key"], "No prescription")
+    totals = {f: sum(row[f] for row in rows) for f in ("bills", "amount", "paid", "unpaid")}
+    return render(request, "adminpanel/revenue_report.html", {
+        **params, "rows": rows, "totals": totals, "groups": rollups.GROUPS,
+        "balances": rollups.top_balances(),
+    })
+
+
+@admin_required
+def revenue_data(request):
+    params = _revenue_params(request)
+    rows = rollups.revenue(**params)
+    names = _doctor_names(rows) if params["group"] == "doctor" else {}
+    return JsonResponse({
+        "date_from": params["date_from"].isoformat(),
+        "date_to": params["date_to"].isoformat(),
+        "group": params["group"],
+        "rows": [
+            {**row, "key": str(row["key"]), "label": names.get(row["key"]),
+             "amount": str(row["amount"]), "paid": str(row["paid"]), "unpaid": str(row["unpaid"])}
+            for row in rows
+        ],
+    })
+
+
+@admin_required
+def balance_data(request):
+    try:
+        limit = min(max(int(request.GET.get("limit", 20)), 1), 100)
+    except ValueError:
+        limit = 20
+    return JsonResponse({"balances": [
+        {
+            "patient_id": b.patient_id,
+            "patient": b.patient.user.get_full_name() or b.patient.user.username,
+            "unpaid_count": b.unpaid_count,
+            "outstanding": str(b.outstanding),
+        }
+        for b in rollups.top_balances(limit)
+    ]})
+
 # ---------------- Doctor Management ----------------
 
 def manage_doctors(request):
-    doctors = DoctorProfile.objects.all()
-    return render(request, "adminpanel/manage_doctors.html", {"doctors": doctors})
+    doctors = DoctorProfile.objects.select_related("user")
+    department = request.GET.get("department")
+    if department:
+        doctors = doctors.filter(department=department)
+    page = paginate(request, doctors, ("-id",))
+    return render(request, "adminpanel/manage_doctors.html", {"doctors": page, "page": page})
 
 
 def add_doctor(request):
@@ -149,6 +281,30 @@ def add_doctor(request):
     return render(request, "adminpanel/user_form.html", {"form": form, "type": "Add Doctor"})
 
 
+@admin_required
+def import_users(request):
+    report = None
+    if request.method == "POST":
+        form = UserImportForm(request.POST, request.FILES)
+        if form.is_valid():
+            upload = form.cleaned_data["file"]
+            fmt = "jsonl" if upload.name.lower().endswith((".jsonl", ".ndjson")) else "csv"
+            rows = imports.read_rows(io.TextIOWrapper(upload.file, encoding="utf-8-sig", newline=""), fmt)
+            rows = list(islice(rows, imports.WEB_MAX_ROWS + 1))
+            if len(rows) > imports.WEB_MAX_ROWS:
+                form.add_error("file", f"More than {imports.WEB_MAX_ROWS} rows; import it with `manage.py import_users`.")
+            else:
+                # hash in this process: a pool would fork the web worker
+                report = imports.import_users(
+                    rows, default_role=form.cleaned_data["role"], dry_run=form.cleaned_data["dry_run"], workers=1,
+                )
+    else:
+        form = UserImportForm()
+    return render(request, "adminpanel/import_users.html", {
+        "form": form, "report": report, "max_rows": imports.WEB_MAX_ROWS,
+    })
+
+
 def edit_doctor(request, doctor_id):
     doctor = get_object_or_404(DoctorProfile, id=doctor_id)
     form = UserForm(request.POST or None, instance=doctor.user)
@@ -167,8 +323,9 @@ def delete_doctor(request, doctor_id):
 # ---------------- Patient Management ----------------
 
 def manage_patients(request):
-    patients = PatientProfile.objects.select_related("user").all()
-    return render(request, "adminpanel/manage_patients.html", {"patients": patients})
+    patients = PatientProfile.objects.select_related("user")
+    page = paginate(request, patients, ("-id",))
+    return render(request, "adminpanel/manage_patients.html", {"patients": page, "page": page})
 
 def add_patient(request):
     if request.method == "POST":
@@ -202,8 +359,12 @@ def delete_patient(request, patient_id):
 
 # List resources
 def manage_resources(request):
-    resources = HealthResource.objects.all().order_by("-published_at")
-    return render(request, "adminpanel/manage_resources.html", {"resources": resources})
+    query = request.GET.get("q", "").strip()
+    if query:
+        page = search.search(request, query)
+    else:
+        page = paginate(request, HealthResource.objects.only("id", "title", "published_at"), ("-published_at", "-id"))
+    return render(request, "adminpanel/manage_resources.html", {"resources": page, "page": page, "query": query})
 
 # Add new resource
 def add_resource(request):
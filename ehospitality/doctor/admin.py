@@ -4,10 +4,12 @@ from .models import DoctorProfile, DoctorAvailability, Prescription, Prescriptio
 @admin.register(DoctorProfile)
 class DoctorProfileAdmin(admin.ModelAdmin):
     list_display = ('user', 'specialization', 'department')
+    list_select_related = ('user',)
 
 @admin.register(DoctorAvailability)
 class DoctorAvailabilityAdmin(admin.ModelAdmin):
     list_display = ('doctor', 'day_of_week', 'start_time', 'end_time')
+    list_select_related = ('doctor__user',)
     list_filter = ('doctor', 'day_of_week')
 
 class PrescriptionItemInline(admin.TabularInline):
@@ -17,4 +19,5 @@ class PrescriptionItemInline(admin.TabularInline):
 @admin.register(Prescription)
 class PrescriptionAdmin(admin.ModelAdmin):
     list_display = ('id', 'doctor', 'patient', 'created_at')
+    list_select_related = ('doctor__user', 'patient__user')
     inlines = [PrescriptionItemInline]
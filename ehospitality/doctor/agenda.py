@@ -0,0 +1,104 @@
+"""
+Cached per-day agendas for the doctor pages.
+
+An agenda is the list of one doctor's appointments on one date, stored in the
+cache as plain dicts (id, date, time, status, patient_id, patient_name) so
+the dashboard and the appointments page can render without touching the
+database. The Appointment receivers below move the affected day to a new
+cache version (accounts.cacheversions) whenever an appointment is created,
+moved, changed or deleted, whether that happens in the doctor views, the
+booking flow or the admin.
+"""
+import threading
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+
+from accounts import cacheversions
+from patient.models import Appointment
+
+_stats = Counter()
+_stats_lock = threading.Lock()
+
+
+def _name(doctor_id, day):
+    return f"agenda:{doctor_id}:{day.isoformat()}"
+
+
+def _count(hits, misses):
+    with _stats_lock:
+        _stats["hits"] += hits
+        _stats["misses"] += misses
+
+
+def stats():
+    """Hit/miss counts of this process since it started."""
+    with _stats_lock:
+        hits, misses = _stats["hits"], _stats["misses"]
+    total = hits + misses
+    return {"hits": hits, "misses": misses, "hit_ratio": hits / total if total else None}
+
+
+def _build(doctor_id, days):
+    agendas = {day: [] for day in days}
+    rows = (
+        Appointment.objects.filter(doctor_id=doctor_id, date__in=days)
+        .order_by("date", "time", "id")
+        .values("id", "date", "time", "status", "patient_id",
+                "patient__user__first_name", "patient__user__last_name", "patient__user__username")
+    )
+    for row in rows:
+        full_name = f"{row.pop('patient__user__first_name')} {row.pop('patient__user__last_name')}".strip()
+        username = row.pop("patient__user__username")
+        row["patient_name"] = full_name or username
+        agendas[row["date"]].append(row)
+    return agendas
+
+
+def get_agendas(doctor_id, days):
+    """``{day: [appointment dicts]}`` for the given days, in two cache round trips."""
+    days = list(days)
+    names = {_name(doctor_id, day): day for day in days}
+    keys = {key: names[name] for name, key in cacheversions.keys(names).items()}
+    cached = cache.get_many(keys)
+    missing = [day for key, day in keys.items() if key not in cached]
+    _count(len(days) - len(missing), len(missing))
+
+    agendas = {keys[key]: agenda for key, agenda in cached.items()}
+    if missing:
+        built = _build(doctor_id, missing)
+        cache.set_many({key: built[day] for key, day in keys.items() if day in built}, settings.AGENDA_CACHE_SECONDS)
+        agendas.update(built)
+    return {day: agendas[day] for day in days}
+
+
+def get_agenda(doctor_id, day):
+    return get_agendas(doctor_id, [day])[day]
+
+
+def invalidate(*days):
+    """Stop serving the cached (doctor_id, date) agendas once the transaction commits."""
+    cacheversions.bump(_name(doctor_id, day) for doctor_id, day in set(days) if doctor_id and day)
+
+
+@receiver(pre_save, sender=Appointment)
+def remember_loaded_day(sender, instance, **kwargs):
+    # patient.slots resets _loaded_slot in its post_save, so keep our own copy
+    loaded = getattr(instance, "_loaded_slot", None)
+    instance._agenda_loaded_day = loaded[:2] if loaded else None
+
+
+@receiver(post_save, sender=Appointment)
+def appointment_saved(sender, instance, **kwargs):
+    days = [(instance.doctor_id, instance.date)]
+    if instance._agenda_loaded_day:
+        days.append(instance._agenda_loaded_day)
+    invalidate(*days)
+
+
+@receiver(post_delete, sender=Appointment)
+def appointment_deleted(sender, instance, **kwargs):
+    invalidate((instance.doctor_id, instance.date))
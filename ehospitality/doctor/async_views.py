@@ -0,0 +1,49 @@
+"""
+Async variants of the read-heavy doctor pages, routed instead of the ones in
+views.py when ASYNC_VIEWS is set; see patient.async_views.
+"""
+from datetime import timedelta
+from functools import partial
+
+from asgiref.sync import sync_to_async
+from django.contrib import messages
+from django.http import JsonResponse
+from django.shortcuts import redirect, render
+from django.utils import timezone
+
+from accounts import asyncdb
+from . import agenda
+from .models import DoctorAvailability
+from .views import DASHBOARD_DAYS
+
+arender = sync_to_async(render)
+
+
+async def _get_doctor(request):
+    doc = await request.identity.adoctor()
+    if not doc:
+        messages.error(request, "Please login as a doctor.")
+        return None, redirect('accounts:login')
+    return doc, None
+
+# ------------ dashboard ------------
+async def dashboard(request):
+    doc, bad = await _get_doctor(request)
+    if bad: return bad
+    today = timezone.localdate()
+    days = await asyncdb.fetch(
+        partial(agenda.get_agendas, doc.id, [today + timedelta(days=i) for i in range(DASHBOARD_DAYS)])
+    )
+    appts = [a for day in days.values() for a in day][:10]
+    return await arender(request, 'doctor/dashboard.html', {'doctor': doc, 'appointments': appts})
+
+# ------------ availability ------------
+async def availability_feed(request):
+    doc, bad = await _get_doctor(request)
+    if bad: return bad
+    data = [{
+        'dow': a.day_of_week,
+        'start': str(a.start_time),
+        'end': str(a.end_time),
+    } for a in await asyncdb.fetch(DoctorAvailability.objects.filter(doctor=doc))]
+    return JsonResponse({'availability': data})
@@ -2,6 +2,7 @@ from django import forms
 from .models import DoctorProfile, DoctorAvailability, Prescription, PrescriptionItem
 from django.forms import inlineformset_factory
 from accounts.models import User
+from patient.models import PatientProfile
 
 class DoctorProfileForm(forms.ModelForm):
     class Meta:
@@ -33,13 +34,28 @@ PrescriptionItemFormSet = inlineformset_factory(
     extra=3,
     can_delete=True,
     widgets={
-        "drug_name": forms.TextInput(attrs={"class": "form-control"}),
+        "drug_name": forms.TextInput(attrs={"class": "form-control", "list": "drug-names", "autocomplete": "off"}),
         "dosage": forms.TextInput(attrs={"class": "form-control"}),
         "frequency": forms.TextInput(attrs={"class": "form-control"}),
         "duration": forms.TextInput(attrs={"class": "form-control"}),
     }
 )
 
+class WardRoundForm(forms.Form):
+    """Patients and notes for a prescription issued to several patients at once."""
+    patients = forms.ModelMultipleChoiceField(queryset=PatientProfile.objects.none(), widget=forms.CheckboxSelectMultiple)
+    notes = forms.CharField(required=False, widget=forms.Textarea(attrs={"class": "form-control", "rows": 3}))
+    bill = forms.BooleanField(required=False, initial=True, label="Bill each patient the consultation fee")
+
+    def __init__(self, doctor, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # the patients this doctor has appointments with
+        self.fields["patients"].queryset = (
+            PatientProfile.objects.filter(appointment__doctor=doctor).distinct()
+            .select_related("user").order_by("user__first_name", "user__last_name", "user__username")
+        )
+        self.fields["patients"].label_from_instance = lambda p: p.user.get_full_name() or p.user.username
+
 class UserForm(forms.ModelForm):
     class Meta:
         model = User
@@ -0,0 +1,125 @@
+"""
+Drug-name autocomplete.
+
+Names come from the formulary file (settings.FORMULARY_FILE, one name per
+line) and from every drug name already prescribed. They are kept in memory
+as a sorted list of (casefolded name, name) pairs, so a prefix lookup is a
+bisect plus a short scan and never touches the database.
+
+New PrescriptionItem names are picked up incrementally: at most every
+DRUG_INDEX_REFRESH_SECONDS a lookup reads the items added since the last
+refresh (``id > last seen``) and inserts the new names in place.
+
+The index is per process; each worker builds its own on first use.
+"""
+import bisect
+import threading
+import time
+
+from django.conf import settings
+from django.db.models import Max
+
+from .models import PrescriptionItem
+
+LIMIT = 10
+
+
+def _key(name):
+    return " ".join(name.split()).casefold()
+
+
+def read_formulary(path):
+    """The drug names in the formulary file at ``path``; a missing file gives none."""
+    try:
+        with open(path, encoding="utf-8") as fh:
+            lines = [line.strip() for line in fh]
+    except FileNotFoundError:
+        return []
+    return [line for line in lines if line and not line.startswith("#")]
+
+
+class DrugIndex:
+    def __init__(self, names=()):
+        self._entries = []
+        self._keys = set()
+        self._last_item_id = 0
+        self._refreshed = None
+        self._lock = threading.Lock()
+        self.add(names)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def add(self, names):
+        """Insert ``names`` not already in the index (compared case-insensitively)."""
+        with self._lock:
+            new = {}
+            for name in names:
+                name = " ".join(name.split())
+                key = name.casefold()
+                if key and key not in self._keys and key not in new:
+                    new[key] = name
+            if not new:
+                return 0
+            if len(new) > len(self._entries) // 8:
+                # a big batch (the first load): re-sort once instead of many inserts
+                entries = sorted(self._entries + list(new.items()))
+            else:
+                entries = list(self._entries)
+                for entry in new.items():
+                    bisect.insort(entries, entry)
+            self._keys.update(new)
+            # readers keep using the old list until this assignment
+            self._entries = entries
+        return len(new)
+
+    def complete(self, prefix, limit=LIMIT):
+        """Up to ``limit`` names starting with ``prefix``, case-insensitively, in alphabetical order."""
+        prefix = _key(prefix)
+        if not prefix:
+            return []
+        entries = self._entries
+        results = []
+        i = bisect.bisect_left(entries, (prefix,))
+        while i < len(entries) and len(results) < limit and entries[i][0].startswith(prefix):
+            results.append(entries[i][1])
+            i += 1
+        return results
+
+    def refresh(self):
+        """Add drug names prescribed since the last refresh."""
+        items = PrescriptionItem.objects.filter(id__gt=self._last_item_id)
+        last = items.aggregate(last=Max("id"))["last"]
+        self._refreshed = time.monotonic()
+        if last is None:
+            return 0
+        names = items.filter(id__lte=last).order_by().values_list("drug_name", flat=True).distinct()
+        added = self.add(list(names))
+        self._last_item_id = last
+        return added
+
+    def refresh_if_stale(self):
+        refreshed = self._refreshed
+        if refreshed is None or time.monotonic() - refreshed >= settings.DRUG_INDEX_REFRESH_SECONDS:
+            # claim the refresh so concurrent lookups do not all run it
+            self._refreshed = time.monotonic()
+            self.refresh()
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_index():
+    """The process-wide index, built on first use and kept fresh."""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = DrugIndex(read_formulary(settings.FORMULARY_FILE))
+    _index.refresh_if_stale()
+    return _index
+
+
+def complete(prefix, limit=LIMIT):
+    return get_index().complete(prefix, limit)
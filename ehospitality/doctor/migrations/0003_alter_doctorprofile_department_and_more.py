@@ -0,0 +1,23 @@
+# Generated by Django 4.2.30 on 2026-10-18 10:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('doctor', '0002_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='doctorprofile',
+            name='department',
+            field=models.CharField(blank=True, db_index=True, max_length=120),
+        ),
+        migrations.AlterField(
+            model_name='doctorprofile',
+            name='specialization',
+            field=models.CharField(blank=True, db_index=True, max_length=120),
+        ),
+    ]
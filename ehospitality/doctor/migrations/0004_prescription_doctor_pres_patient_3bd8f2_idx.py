@@ -0,0 +1,17 @@
+# Generated by Django 4.2.30 on 2026-10-18 10:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('doctor', '0003_alter_doctorprofile_department_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='prescription',
+            index=models.Index(fields=['patient', 'created_at', 'id'], name='doctor_pres_patient_3bd8f2_idx'),
+        ),
+    ]
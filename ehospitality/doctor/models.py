@@ -4,8 +4,8 @@ from django.conf import settings
 # --- Doctor profile ---
 class DoctorProfile(models.Model):
     user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='doctor_profile')
-    specialization = models.CharField(max_length=120, blank=True)
-    department = models.CharField(max_length=120, blank=True)
+    specialization = models.CharField(max_length=120, blank=True, db_index=True)
+    department = models.CharField(max_length=120, blank=True, db_index=True)
     bio = models.TextField(blank=True)
 
     def __str__(self):
@@ -36,6 +36,9 @@ class Prescription(models.Model):
     notes = models.TextField(blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [models.Index(fields=['patient', 'created_at', 'id'])]
+
     def __str__(self):
         return f"Rx #{self.pk} - {self.patient.user.username} by {self.doctor.user.username}"
 
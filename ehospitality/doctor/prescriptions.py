@@ -0,0 +1,77 @@
+"""
+Writing prescriptions.
+
+A prescription is a header row, its items and, when the visit is billed, a
+Billing row linked to it. All of it is written in one transaction, the
+items with a single bulk_create, so a failure part-way leaves nothing
+behind.
+
+issue_to_patients() writes the same regimen for many patients at once (a
+ward round) with one bulk_create per table instead of a few inserts per
+patient.
+"""
+from decimal import Decimal
+
+from django.db import connection, transaction
+from django.db.models import Max
+
+from adminpanel import rollups
+from patient.models import Billing
+from .models import Prescription, PrescriptionItem
+
+CONSULTATION_FEE = Decimal("500.00")
+ITEM_FIELDS = ("drug_name", "dosage", "frequency", "duration")
+
+
+def items_from_formset(formset):
+    """The items of a valid PrescriptionItemFormSet, skipping blank and removed rows."""
+    return [
+        {f: form.cleaned_data[f] for f in ITEM_FIELDS}
+        for form in formset.forms
+        if form.cleaned_data and not form.cleaned_data.get("DELETE")
+    ]
+
+
+def _items(prescription_id, items):
+    return [PrescriptionItem(prescription_id=prescription_id, **item) for item in items]
+
+
+@transaction.atomic
+def issue_prescription(doctor, patient, items, notes="", fee=None):
+    """Write one prescription with its items, and a bill for ``fee`` if given."""
+    rx = Prescription.objects.create(doctor=doctor, patient=patient, notes=notes)
+    PrescriptionItem.objects.bulk_create(_items(rx.id, items))
+    if fee is not None:
+        Billing.objects.create(patient=patient, prescription=rx, amount=fee, status="unpaid")
+    return rx
+
+
+@transaction.atomic
+def issue_to_patients(doctor, patients, items, notes="", fee=None):
+    """Write the same prescription for each of ``patients``; returns the prescriptions."""
+    patients = list({p.pk: p for p in patients}.values())
+    if not patients:
+        return []
+    headers = [Prescription(doctor=doctor, patient=p, notes=notes) for p in patients]
+    if connection.features.can_return_rows_from_bulk_insert:
+        Prescription.objects.bulk_create(headers)
+    else:
+        # MySQL does not return ids from bulk inserts: read back the rows this
+        # doctor just wrote for these patients, one per patient
+        floor = Prescription.objects.aggregate(last=Max("id"))["last"] or 0
+        Prescription.objects.bulk_create(headers)
+        ids = dict(
+            Prescription.objects.filter(doctor=doctor, patient__in=patients, id__gt=floor)
+            .values_list("patient_id").annotate(last=Max("id"))
+        )
+        for rx in headers:
+            rx.id = ids[rx.patient_id]
+
+    PrescriptionItem.objects.bulk_create([item for rx in headers for item in _items(rx.id, items)])
+    if fee is not None:
+        bills = Billing.objects.bulk_create([
+            Billing(patient_id=rx.patient_id, prescription_id=rx.id, amount=fee, status="unpaid")
+            for rx in headers
+        ])
+        rollups.bills_created(bills)
+    return headers
@@ -0,0 +1,256 @@
+"""
+Allergy and interaction screening for new prescriptions.
+
+The interaction table (settings.INTERACTIONS_FILE) lists drug classes and
+pairs of drugs or classes that interact. For each patient, the allergies
+and current medications across all their MedicalHistory entries are
+compiled into one Aho-Corasick automaton whose patterns are:
+
+* every allergen (the allergy terms and, for a known drug or class, every
+  drug of that class), and
+* every drug that interacts with one of the patient's medications.
+
+Screening a prescription is then one pass of the automaton over its drug
+names, however long the history is. The compiled automaton is cached per
+patient and moved to a new cache version (accounts.cacheversions) by the
+MedicalHistory receivers below; interactions between the drugs of the
+prescription itself are found the same way with an automaton over the
+table's drug names.
+"""
+import bisect
+import hashlib
+import re
+import threading
+from collections import deque
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from accounts import cacheversions
+from patient.models import MedicalHistory
+
+# separators between terms in the free-text allergies and medications fields
+_TERM_SPLIT = re.compile(r"[,;\n/]|\band\b")
+_NO_ALLERGIES = {"none", "nil", "nka", "nkda", "no known allergies", "no known drug allergies", "n/a", "-"}
+
+
+def _normalize(text):
+    return " ".join(text.casefold().split())
+
+
+def _terms(text):
+    terms = (_normalize(t) for t in _TERM_SPLIT.split(text or ""))
+    return [t for t in terms if t and t not in _NO_ALLERGIES]
+
+
+class Matcher:
+    """An Aho-Corasick automaton; ``patterns`` maps a pattern to the payloads it reports."""
+
+    def __init__(self, patterns):
+        self.goto = [{}]
+        self.fail = [0]
+        self.out = [[]]
+        for pattern, payloads in patterns.items():
+            node = 0
+            for ch in pattern:
+                nxt = self.goto[node].get(ch)
+                if nxt is None:
+                    nxt = len(self.goto)
+                    self.goto[node][ch] = nxt
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.out.append([])
+                node = nxt
+            self.out[node].extend((len(pattern), payload) for payload in payloads)
+
+        queue = deque(self.goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, nxt in self.goto[node].items():
+                queue.append(nxt)
+                f = self.fail[node]
+                while f and ch not in self.goto[f]:
+                    f = self.fail[f]
+                self.fail[nxt] = self.goto[f].get(ch, 0)
+                self.out[nxt] = self.out[nxt] + self.out[self.fail[nxt]]
+
+    def scan(self, text):
+        """Yield (start, end, payload) for every whole-word pattern match in ``text``."""
+        goto, fail, out = self.goto, self.fail, self.out
+        node = 0
+        for i, ch in enumerate(text):
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            for length, payload in out[node]:
+                start, end = i + 1 - length, i + 1
+                if (start == 0 or not text[start - 1].isalnum()) and (end == len(text) or not text[end].isalnum()):
+                    yield start, end, payload
+
+
+# ------------ interaction table ------------
+class Table:
+    def __init__(self, classes, interactions, digest):
+        self.classes = classes
+        self.digest = digest
+        # drug or class name -> [(interacting name, warning)]
+        self.partners = {}
+        for a, b, message in interactions:
+            for x in self.expand(a):
+                for y in self.expand(b):
+                    self.partners.setdefault(x, []).append((y, message))
+                    self.partners.setdefault(y, []).append((x, message))
+        names = set(self.partners)
+        for name, members in classes.items():
+            names.add(name)
+            names.update(members)
+        self.names = Matcher({name: [name] for name in names})
+
+    def expand(self, name):
+        """``name`` and, for a class, its members."""
+        return {name} | self.classes.get(name, set())
+
+    def allergens(self, term):
+        """``term`` plus every drug of a class it names or belongs to."""
+        found = {term} | {name for _, _, name in self.names.scan(term)}
+        for name in list(found):
+            for cls, members in self.classes.items():
+                if name == cls or name in members:
+                    found |= members | {cls}
+        return found
+
+
+def read_table(path):
+    with open(path, "rb") as fh:
+        raw = fh.read()
+    classes, interactions = {}, []
+    for line in raw.decode("utf-8").splitlines():
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        if "=" in line:
+            name, members = line.split("=", 1)
+            classes[_normalize(name)] = {_normalize(m) for m in members.split(",") if m.strip()}
+        elif "+" in line and ":" in line:
+            pair, message = line.split(":", 1)
+            a, b = pair.split("+", 1)
+            interactions.append((_normalize(a), _normalize(b), message.strip()))
+        else:
+            raise ValueError(f"{path}: cannot parse {line!r}")
+    return Table(classes, interactions, hashlib.sha1(raw).hexdigest()[:12])
+
+
+_table = None
+_table_lock = threading.Lock()
+
+
+def get_table():
+    global _table
+    if _table is None:
+        with _table_lock:
+            if _table is None:
+                _table = read_table(settings.INTERACTIONS_FILE)
+    return _table
+
+
+# ------------ per-patient matchers ------------
+def _name(patient_id):
+    return f"safety:{get_table().digest}:{patient_id}"
+
+
+def _compile(histories):
+    """Build the matcher for one patient from (allergies, medications) pairs."""
+    table = get_table()
+    patterns = {}
+    for allergies, medications in histories:
+        for term in _terms(allergies):
+            for allergen in table.allergens(term):
+                patterns.setdefault(allergen, set()).add(("allergy", f"Patient is allergic to {term}."))
+        for term in _terms(medications):
+            for _, _, name in table.names.scan(term):
+                for other, message in table.partners.get(name, ()):
+                    patterns.setdefault(other, set()).add(
+                        ("interaction", f"Interacts with {term} (current medication): {message}")
+                    )
+    return Matcher({pattern: sorted(payloads) for pattern, payloads in patterns.items()})
+
+
+def get_matchers(patient_ids):
+    """``{patient_id: Matcher}``, compiled from history where not cached."""
+    names = {_name(pid): pid for pid in set(patient_ids)}
+    keys = {key: names[name] for name, key in cacheversions.keys(names).items()}
+    cached = cache.get_many(keys)
+    matchers = {keys[key]: matcher for key, matcher in cached.items()}
+    missing = [pid for key, pid in keys.items() if key not in cached]
+    if missing:
+        histories = {pid: [] for pid in missing}
+        for pid, allergies, medications in (
+            MedicalHistory.objects.filter(patient_id__in=missing)
+            .order_by().values_list("patient_id", "allergies", "medications")
+        ):
+            histories[pid].append((allergies, medications))
+        built = {pid: _compile(rows) for pid, rows in histories.items()}
+        cache.set_many({key: built[pid] for key, pid in keys.items() if pid in built}, settings.SAFETY_CACHE_SECONDS)
+        matchers.update(built)
+    return matchers
+
+
+def invalidate(*patient_ids):
+    cacheversions.bump(_name(pid) for pid in set(patient_ids) if pid)
+
+
+# ------------ screening ------------
+def _warning(drug, kind, message):
+    return {"drug": drug, "kind": kind, "message": message}
+
+
+def check_patients(patient_ids, drug_names):
+    """``{patient_id: [warning dicts]}`` for prescribing ``drug_names`` to each patient."""
+    drug_names = list(drug_names)
+    # all items as one text; starts[i] is where item i begins
+    starts, parts, offset = [], [], 0
+    for name in drug_names:
+        starts.append(offset)
+        parts.append(_normalize(name))
+        offset += len(parts[-1]) + 1
+    text = "\n".join(parts)
+
+    def item(position):
+        return bisect.bisect_right(starts, position) - 1
+
+    table = get_table()
+    common = []
+    found = {}
+    for start, _, name in table.names.scan(text):
+        found.setdefault(item(start), set()).add(name)
+    for i, names in found.items():
+        for j, others in found.items():
+            if j <= i:
+                continue
+            for name in names:
+                for partner, message in table.partners.get(name, ()):
+                    if partner in others:
+                        common.append(_warning(
+                            drug_names[j], "interaction", f"Interacts with {drug_names[i]} in this prescription: {message}"
+                        ))
+
+    results = {}
+    for pid, matcher in get_matchers(patient_ids).items():
+        warnings = list(common)
+        for start, _, (kind, message) in matcher.scan(text):
+            warnings.append(_warning(drug_names[item(start)], kind, message))
+        unique = {(w["drug"], w["kind"], w["message"]): w for w in warnings}
+        results[pid] = [unique[k] for k in sorted(unique)]
+    return results
+
+
+def check(patient_id, drug_names):
+    return check_patients([patient_id], drug_names)[patient_id]
+
+
+@receiver(post_save, sender=MedicalHistory)
+@receiver(post_delete, sender=MedicalHistory)
+def history_changed(sender, instance, **kwargs):
+    invalidate(instance.patient_id)
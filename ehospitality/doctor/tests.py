@@ -1,3 +1,158 @@
+from datetime import time, timedelta
+
+from django.core.cache import cache
 from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from accounts.models import User
+from patient.models import Appointment, MedicalHistory
+from . import agenda, safety, views
+from .formulary import DrugIndex
+from .models import DoctorProfile, Prescription, PrescriptionItem
+
+
+def make_doctor(username="doc"):
+    return DoctorProfile.objects.create(user=User.objects.create(username=username, role="doctor"))
+
+
+def make_patient(username="pat"):
+    return User.objects.create(username=username, role="patient").patientprofile
+
+
+class MatcherTests(TestCase):
+    def test_reports_every_whole_word_match(self):
+        matcher = safety.Matcher({"he": ["he"], "she": ["she"], "hers": ["hers"]})
+        found = sorted((start, payload) for start, _, payload in matcher.scan("she said hers"))
+        self.assertEqual(found, [(0, "she"), (9, "hers")])
+
+    def test_ignores_matches_inside_words(self):
+        matcher = safety.Matcher({"aspirin": ["aspirin"]})
+        self.assertEqual(list(matcher.scan("aspirinate")), [])
+        self.assertEqual([p for _, _, p in matcher.scan("low-dose aspirin 75mg")], ["aspirin"])
+
+
+class SafetyTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.patient = make_patient()
+
+    def history(self, **fields):
+        with self.captureOnCommitCallbacks(execute=True):
+            return MedicalHistory.objects.create(patient=self.patient, diagnosis="x", **fields)
+
+    def messages(self, drugs):
+        return [(w["drug"], w["kind"], w["message"]) for w in safety.check(self.patient.id, drugs)]
+
+    def test_allergy_to_a_class_member(self):
+        self.history(allergies="Penicillin")
+        self.assertEqual(
+            self.messages(["Amoxicillin 500 mg", "Paracetamol"]),
+            [("Amoxicillin 500 mg", "allergy", "Patient is allergic to penicillin.")],
+        )
+
+    def test_no_known_allergies(self):
+        self.history(allergies="NKDA")
+        self.assertEqual(self.messages(["Amoxicillin"]), [])
+
+    def test_interaction_with_current_medication(self):
+        self.history(medications="Warfarin 5 mg")
+        [(drug, kind, message)] = self.messages(["Ibuprofen 400 mg"])
+        self.assertEqual((drug, kind), ("Ibuprofen 400 mg", "interaction"))
+        self.assertIn("bleeding", message)
+
+    def test_interaction_within_the_prescription(self):
+        [(drug, kind, message)] = self.messages(["Warfarin", "Naproxen"])
+        self.assertEqual((drug, kind), ("Naproxen", "interaction"))
+        self.assertIn("Warfarin in this prescription", message)
+
+    def test_history_changes_reach_the_cached_matcher(self):
+        self.assertEqual(self.messages(["Amoxicillin"]), [])
+        entry = self.history(allergies="penicillins")
+        self.assertEqual(len(self.messages(["Amoxicillin"])), 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            entry.delete()
+        self.assertEqual(self.messages(["Amoxicillin"]), [])
+
+
+class DrugIndexTests(TestCase):
+    def test_prefix_completion_is_case_insensitive_and_sorted(self):
+        index = DrugIndex(["Ibuprofen", "ibandronate", "Amoxicillin", "IBUPROFEN"])
+        self.assertEqual(index.complete("IB"), ["ibandronate", "Ibuprofen"])
+        self.assertEqual(index.complete("ib", limit=1), ["ibandronate"])
+        self.assertEqual(index.complete("  "), [])
+
+    def test_refresh_adds_prescribed_names(self):
+        index = DrugIndex(["Amoxicillin"])
+        rx = Prescription.objects.create(doctor=make_doctor(), patient=make_patient())
+        PrescriptionItem.objects.create(prescription=rx, drug_name="Amlodipine", dosage="5 mg",
+                                        frequency="daily", duration="30 days")
+        self.assertEqual(index.refresh(), 1)
+        self.assertEqual(index.complete("am"), ["Amlodipine", "Amoxicillin"])
+        self.assertEqual(index.refresh(), 0)
+
+
+class AgendaTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.doctor = make_doctor()
+        self.patient = make_patient()
+        self.day = timezone.localdate() + timedelta(days=1)
+
+    def book(self, t, day=None):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Appointment.objects.create(patient=self.patient, doctor=self.doctor, date=day or self.day, time=t)
+
+    def test_cached_agenda_follows_appointment_changes(self):
+        self.book(time(9, 0))
+        self.assertEqual([a["time"] for a in agenda.get_agenda(self.doctor.id, self.day)], [time(9, 0)])
+        with self.assertNumQueries(0):
+            agenda.get_agenda(self.doctor.id, self.day)
+
+        moved = self.book(time(10, 0))
+        with self.captureOnCommitCallbacks(execute=True):
+            moved.date = self.day + timedelta(days=1)
+            moved.save()
+        agendas = agenda.get_agendas(self.doctor.id, [self.day, self.day + timedelta(days=1)])
+        self.assertEqual([a["time"] for a in agendas[self.day]], [time(9, 0)])
+        self.assertEqual([a["id"] for a in agendas[self.day + timedelta(days=1)]], [moved.id])
+
+
+class AppointmentsListTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.doctor = make_doctor()
+        # the app's own session login (accounts.views.login_view)
+        session = self.client.session
+        session["user_id"], session["role"] = self.doctor.user_id, "doctor"
+        session.save()
+        patient = make_patient()
+        other = make_doctor("other-doc")
+        today = timezone.localdate()
+        for i in range(60):
+            Appointment.objects.create(patient=patient, doctor=self.doctor, date=today + timedelta(days=i - 30),
+                                       time=time(9, 0), status="pending" if i % 3 else "confirmed")
+        Appointment.objects.create(patient=patient, doctor=other, date=today, time=time(10, 0))
+
+    def test_all_dates_are_paged_newest_first(self):
+        url = reverse("doctor:appointments_list")
+        seen, query = [], "status=pending"
+        while True:
+            response = self.client.get(f"{url}?{query}")
+            seen.extend(response.context["appointments"])
+            page = response.context["page"]
+            if not page.has_next:
+                break
+            query = page.next_query
+        self.assertEqual(len(seen), 40)
+        self.assertTrue(all(a["status"] == "pending" for a in seen))
+        dates = [a["date"] for a in seen]
+        self.assertEqual(dates, sorted(dates, reverse=True))
+        self.assertEqual(len(self.client.get(url).context["appointments"]), 50)
 
-# Create your tests here.
+    def test_date_shows_the_cached_day(self):
+        today = timezone.localdate()
+        response = self.client.get(reverse("doctor:appointments_list"), {"date": today.isoformat()})
+        self.assertNotIn("page", response.context)
+        self.assertEqual([(a["date"], a["time"]) for a in response.context["appointments"]], [(today, time(9, 0))])
+        self.assertEqual(response.context["appointments"], [views._row(Appointment.objects.get(doctor=self.doctor, date=today))])
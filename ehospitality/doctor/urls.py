@@ -1,10 +1,14 @@
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import async_views, views
 
 app_name = 'doctor'
 
+# the read-heavy pages have async variants, for serving under ehospitality.asgi
+reads = async_views if settings.ASYNC_VIEWS else views
+
 urlpatterns = [
-    path('', views.dashboard, name='dashboard'),
+    path('', reads.dashboard, name='dashboard'),
 
     # appointments
     path('appointments/', views.appointments_list, name='appointments_list'),
@@ -14,15 +18,18 @@ urlpatterns = [
 
     # patient detail
     path('patients/<int:patient_id>/', views.patient_detail, name='patient_detail'),
+    path('patients/<int:patient_id>/timeline/', views.patient_timeline, name='patient_timeline'),  # JSON
 
     # availability
     path('availability/', views.availability_list, name='availability_list'),
     path('availability/new/', views.availability_create, name='availability_create'),
     path('availability/<int:pk>/delete/', views.availability_delete, name='availability_delete'),
-    path('availability/feed/', views.availability_feed, name='availability_feed'),  # JSON for calendars
+    path('availability/feed/', reads.availability_feed, name='availability_feed'),  # JSON for calendars
 
     # e-prescribing
     path('prescribe/<int:patient_id>/', views.prescribe, name='prescribe'),
+    path('prescribe/ward-round/', views.ward_round, name='ward_round'),
+    path('prescribe/drugs/', views.drug_names, name='drug_names'),  # JSON for the drug name autocomplete
 
     path("prescription/add/<int:appointment_id>/", views.add_prescription, name="add_prescription"),
 
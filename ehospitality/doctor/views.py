@@ -1,42 +1,75 @@
+from datetime import date, timedelta
 from django.shortcuts import render, redirect, get_object_or_404
 from django.http import JsonResponse
+from django.urls import reverse
 from django.contrib import messages
 from django.utils import timezone
-from accounts.utils import get_session_user, require_role
 from accounts.models import User
 from .models import DoctorProfile, DoctorAvailability, Prescription
-from .forms import DoctorProfileForm, DoctorAvailabilityForm, PrescriptionForm, PrescriptionItemFormSet
-from patient.models import PatientProfile, Appointment, MedicalHistory
-from patient.models import Billing
+from .forms import DoctorProfileForm, DoctorAvailabilityForm, PrescriptionForm, PrescriptionItemFormSet, WardRoundForm
+from patient.models import PatientProfile, Appointment
+from patient import timeline
+from accounts.loaders import load
+from adminpanel.pagination import paginate
+from . import agenda, formulary, prescriptions, safety
+
+# how many days ahead the dashboard lists
+DASHBOARD_DAYS = 7
+
+# the all-dates appointments page, newest first
+APPOINTMENT_ORDERING = ('-date', '-time', '-id')
+
+# relations each template walks, fetched in batch by accounts.loaders
+PRESCRIPTION_RELATIONS = ("patient__user",)
 
 
 def _get_doctor(request):
-    user = require_role(request, ['doctor'])
-    if not user:
+    doc = request.identity.doctor
+    if not doc:
         messages.error(request, "Please login as a doctor.")
         return None, redirect('accounts:login')
-    try:
-        doc = user.doctor_profile
-    except DoctorProfile.DoesNotExist:
-        doc = DoctorProfile.objects.create(user=user)
     return doc, None
 
+def _agenda_redirect(appt):
+    return redirect(f"{reverse('doctor:appointments_list')}?date={appt.date.isoformat()}")
+
 # ------------ dashboard ------------
 def dashboard(request):
     doc, bad = _get_doctor(request)
     if bad: return bad
-    appts = Appointment.objects.filter(doctor=doc).order_by('date', 'time')[:10]
+    today = timezone.localdate()
+    days = agenda.get_agendas(doc.id, [today + timedelta(days=i) for i in range(DASHBOARD_DAYS)])
+    appts = [a for day in days.values() for a in day][:10]
     return render(request, 'doctor/dashboard.html', {'doctor': doc, 'appointments': appts})
 
 # ------------ appointments ------------
+def _row(appt):
+    # the shape of a cached agenda entry, so both listings share a template
+    return {
+        'id': appt.id, 'date': appt.date, 'time': appt.time, 'status': appt.status, 'patient_id': appt.patient_id,
+        'patient_name': appt.patient.user.get_full_name() or appt.patient.user.username,
+    }
+
+# ?date= shows one day from the cached agenda; without it, every date newest first, a page at a time
 def appointments_list(request):
     doc, bad = _get_doctor(request)
     if bad: return bad
     status = request.GET.get('status')
-    qs = Appointment.objects.filter(doctor=doc).order_by('-date', '-time')
+    context = {'status': status, 'statuses': Appointment.STATUS_CHOICES}
+    try:
+        day = date.fromisoformat(request.GET.get('date', ''))
+    except ValueError:
+        qs = Appointment.objects.filter(doctor=doc).select_related('patient__user')
+        if status:
+            qs = qs.filter(status=status)
+        page = paginate(request, qs, APPOINTMENT_ORDERING)
+        context.update(appointments=[_row(a) for a in page], page=page, today=timezone.localdate())
+        return render(request, 'doctor/appointments_list.html', context)
+    appts = agenda.get_agenda(doc.id, day)
     if status:
-        qs = qs.filter(status=status)
-    return render(request, 'doctor/appointments_list.html', {'appointments': qs})
+        appts = [a for a in appts if a['status'] == status]
+    context.update(appointments=appts, day=day, previous_day=day - timedelta(days=1), next_day=day + timedelta(days=1))
+    return render(request, 'doctor/appointments_list.html', context)
 
 def appointment_confirm(request, pk):
     doc, bad = _get_doctor(request)
@@ -45,7 +78,7 @@ def appointment_confirm(request, pk):
     appt.status = 'confirmed'
     appt.save()
     messages.success(request, 'Appointment confirmed.')
-    return redirect('doctor:appointments_list')
+    return _agenda_redirect(appt)
 
 def appointment_cancel(request, pk):
     doc, bad = _get_doctor(request)
@@ -54,7 +87,7 @@ def appointment_cancel(request, pk):
     appt.status = 'cancelled'
     appt.save()
     messages.info(request, 'Appointment cancelled.')
-    return redirect('doctor:appointments_list')
+    return _agenda_redirect(appt)
 
 def appointment_complete(request, pk):
     doc, bad = _get_doctor(request)
@@ -63,18 +96,26 @@ def appointment_complete(request, pk):
     appt.status = 'completed'
     appt.save()
     messages.success(request, 'Appointment marked completed.')
-    return redirect('doctor:appointments_list')
+    return _agenda_redirect(appt)
 
 # ------------ patient details ------------
 def patient_detail(request, patient_id):
     doc, bad = _get_doctor(request)
     if bad: return bad
-    patient = get_object_or_404(PatientProfile, pk=patient_id)
-    appts = Appointment.objects.filter(doctor=doc, patient=patient).order_by('-date', '-time')
-    histories = MedicalHistory.objects.filter(patient=patient).order_by('-date')
-    rx = patient.prescriptions.order_by('-created_at')[:10]
+    patient = get_object_or_404(PatientProfile.objects.select_related('user'), pk=patient_id)
+    page = timeline.timeline(patient, request.GET.get('before'), doctor=doc)
     return render(request, 'doctor/patient_detail.html', {
-        'doctor': doc, 'patient': patient, 'appointments': appts, 'histories': histories, 'prescriptions': rx
+        'doctor': doc, 'patient': patient, 'timeline': page
+    })
+
+def patient_timeline(request, patient_id):
+    doc, bad = _get_doctor(request)
+    if bad: return bad
+    patient = get_object_or_404(PatientProfile, pk=patient_id)
+    page = timeline.timeline(patient, request.GET.get('before'), doctor=doc)
+    return JsonResponse({
+        'entries': [timeline.serialize(e) for e in page],
+        'next': page.next_cursor,
     })
 
 # ------------ availability ------------
@@ -131,56 +172,52 @@ def availability_feed(request):
     return JsonResponse({'availability': data})
 
 # ------------ e-prescribing ------------
+def _needs_review(request, warnings):
+    # safety warnings block the save until the doctor ticks the acknowledgement
+    return bool(warnings) and not request.POST.get('acknowledge_warnings')
+
 def prescribe(request, patient_id):
     doc, bad = _get_doctor(request)
     if bad: return bad
     patient = get_object_or_404(PatientProfile, pk=patient_id)
+    warnings = []
 
     if request.method == 'POST':
         form = PrescriptionForm(request.POST)
         formset = PrescriptionItemFormSet(request.POST)
         if form.is_valid() and formset.is_valid():
-            rx = form.save(commit=False)
-            rx.doctor = doc
-            rx.patient = patient
-            rx.save()
-            formset.instance = rx
-            formset.save()
-            messages.success(request, 'Prescription saved.')
-            return redirect('doctor:patient_detail', patient_id=patient.id)
+            items = prescriptions.items_from_formset(formset)
+            warnings = safety.check(patient.id, [i['drug_name'] for i in items])
+            if not _needs_review(request, warnings):
+                prescriptions.issue_prescription(doc, patient, items, form.cleaned_data['notes'])
+                messages.success(request, 'Prescription saved.')
+                return redirect('doctor:patient_detail', patient_id=patient.id)
     else:
         form = PrescriptionForm()
         formset = PrescriptionItemFormSet()
-    return render(request, 'doctor/prescribe_form.html', {'form': form, 'formset': formset, 'patient': patient})
+    return render(request, 'doctor/prescribe_form.html', {
+        'form': form, 'formset': formset, 'patient': patient, 'warnings': warnings
+    })
 
 
 def add_prescription(request, appointment_id):
-    appointment = get_object_or_404(Appointment, id=appointment_id)
+    appointment = get_object_or_404(load(Appointment.objects.all(), PRESCRIPTION_RELATIONS), id=appointment_id)
+    warnings = []
 
     if request.method == "POST":
         form = PrescriptionForm(request.POST)
         formset = PrescriptionItemFormSet(request.POST)
 
         if form.is_valid() and formset.is_valid():
-            prescription = form.save(commit=False)
-            prescription.doctor = appointment.doctor
-            prescription.patient = appointment.patient
-            prescription.save()
-
-            items = formset.save(commit=False)
-            for item in items:
-                item.prescription = prescription
-                item.save()
-
-            # 🔹 Create Billing entry linked to prescription
-            Billing.objects.create(
-                patient=appointment.patient,
-                amount=500.00,  # example consultation fee
-                status="unpaid"
-            )
-
-            messages.success(request, "Prescription saved and bill generated.")
-            return redirect("doctor:dashboard")
+            items = prescriptions.items_from_formset(formset)
+            warnings = safety.check(appointment.patient_id, [i["drug_name"] for i in items])
+            if not _needs_review(request, warnings):
+                prescriptions.issue_prescription(
+                    appointment.doctor, appointment.patient, items,
+                    form.cleaned_data["notes"], fee=prescriptions.CONSULTATION_FEE,
+                )
+                messages.success(request, "Prescription saved and bill generated.")
+                return redirect("doctor:dashboard")
     else:
         form = PrescriptionForm()
         formset = PrescriptionItemFormSet()
@@ -189,4 +226,41 @@ def add_prescription(request, appointment_id):
         "appointment": appointment,
         "form": form,
         "formset": formset,
-    })
\ No newline at end of file
+        "warnings": warnings,
+    })
+
+
+def drug_names(request):
+    doc, bad = _get_doctor(request)
+    if bad: return bad
+    return JsonResponse({'names': formulary.complete(request.GET.get('q', ''))})
+
+
+def ward_round(request):
+    doc, bad = _get_doctor(request)
+    if bad: return bad
+    warnings = []
+
+    if request.method == 'POST':
+        form = WardRoundForm(doc, request.POST)
+        formset = PrescriptionItemFormSet(request.POST)
+        if form.is_valid() and formset.is_valid():
+            items = prescriptions.items_from_formset(formset)
+            patients = form.cleaned_data['patients']
+            checked = safety.check_patients([p.id for p in patients], [i['drug_name'] for i in items])
+            warnings = [
+                dict(w, patient=p.user.get_full_name() or p.user.username) for p in patients for w in checked[p.id]
+            ]
+            if not items:
+                messages.error(request, 'Add at least one medication.')
+            elif not _needs_review(request, warnings):
+                issued = prescriptions.issue_to_patients(
+                    doc, patients, items, form.cleaned_data['notes'],
+                    fee=prescriptions.CONSULTATION_FEE if form.cleaned_data['bill'] else None,
+                )
+                messages.success(request, f'{len(issued)} prescriptions saved.')
+                return redirect('doctor:dashboard')
+    else:
+        form = WardRoundForm(doc)
+        formset = PrescriptionItemFormSet()
+    return render(request, 'doctor/ward_round.html', {'form': form, 'formset': formset, 'warnings': warnings})
@@ -28,6 +28,68 @@ STRIPE_PUBLISHABLE_KEY = 'pk_test_51RxVMpHcFZrhrPHxC1XYRgxNqJuHYpC8WvnZskMV8ziYk
 STRIPE_SECRET_KEY = 'sk_test_51RxVMpHcFZrhrPHxKYBU2KpnaOn0wC9fySyhlXCf3pw9nEgXrg1dDtvmjkskhS4IEKn22f2VAwFNh4VfgaC7LhaO00lu7mnHvj'
 
 
+# Appointments
+# how long a slot stays reserved while the patient is on the confirm step
+SLOT_HOLD_SECONDS = 300
+# cached doctor agendas are replaced on every appointment change; this only
+# bounds how long a renamed patient can show under the old name
+AGENDA_CACHE_SECONDS = 3600
+
+# Prescriptions
+# drug names offered by the prescribing autocomplete, besides those already prescribed
+FORMULARY_FILE = BASE_DIR / 'doctor' / 'data' / 'formulary.txt'
+# how often the autocomplete index picks up newly prescribed drug names
+DRUG_INDEX_REFRESH_SECONDS = 30
+# drug classes and interacting pairs screened at prescribe time
+INTERACTIONS_FILE = BASE_DIR / 'doctor' / 'data' / 'interactions.txt'
+# compiled per-patient safety checks are replaced whenever the patient's history changes
+SAFETY_CACHE_SECONDS = 86400
+
+# Payments
+# checkout sessions are created by `manage.py process_payments`; use
+# 'patient.payments.FakeGateway' to run without Stripe. The fake keeps its
+# sessions in memory and only works within one process (the tests):
+# reconcile_payments never sees the sessions process_payments created, so
+# bills stay unpaid.
+PAYMENT_GATEWAY = 'patient.payments.StripeGateway'
+PAYMENT_CURRENCY = 'inr'
+# signing secret of the Stripe webhook endpoint (billing/webhook/)
+STRIPE_WEBHOOK_SECRET = os.environ.get('STRIPE_WEBHOOK_SECRET', '')
+
+# Profiling
+# ProfilingMiddleware times identity lookup, view, SQL and templates and sends
+# them as Server-Timing headers and log lines. Off unless a share of the
+# requests is sampled, e.g. PROFILING_SAMPLE_RATE=0.01
+PROFILING_SAMPLE_RATE = float(os.environ.get('PROFILING_SAMPLE_RATE', '0'))
+PROFILING_ENABLED = PROFILING_SAMPLE_RATE > 0
+# a request this slow arms a cProfile capture of the next request to its view,
+# written to PROFILING_DIR; no captures are taken while it is unset
+PROFILING_SLOW_MS = 500
+PROFILING_DIR = os.environ.get('PROFILING_DIR', '')
+# at most one capture per view in this many seconds
+PROFILING_CAPTURE_INTERVAL = 600
+
+# Metrics
+# /metrics serves request, latency and booking metrics in the Prometheus text format
+METRICS_ENABLED = True
+# scrapes must send "Authorization: Bearer <token>"; while it is unset the
+# endpoint answers 404 unless DEBUG is on
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+# under a pre-fork server, a directory shared by the workers (see accounts.metrics)
+METRICS_MULTIPROCESS_DIR = os.environ.get('METRICS_MULTIPROCESS_DIR', '')
+METRICS_FLUSH_SECONDS = 5
+
+# Async views
+# serve the dashboards, resources, slot search and availability feed from their
+# async variants, under ehospitality.asgi only (WSGI runs each async view on an
+# event loop of its own). Off by default: on a single CPU they measured slower
+# than the sync views; run `manage.py benchmark_async_views` on the target
+# hardware before turning them on
+ASYNC_VIEWS = os.environ.get('ASYNC_VIEWS', '') == '1'
+# threads, each with its own database connection, running the independent reads of async views
+ASYNC_DB_THREADS = 8
+
+
 # SECURITY WARNING: don't run with debug turned on in production!
 DEBUG = True
 
@@ -53,12 +115,17 @@ INSTALLED_APPS = [
 
 ]
 
+# the profiling and metrics middleware leave the chain (MiddlewareNotUsed)
+# while PROFILING_ENABLED / METRICS_ENABLED are off
 MIDDLEWARE = [
+    'accounts.middleware.ProfilingMiddleware',
+    'accounts.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'accounts.middleware.SessionIdentityMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -104,6 +171,48 @@ DATABASES = {
     }
 }
 
+# Cache
+# LocMemCache is per process; point this at a shared cache (Redis, Memcached)
+# when running several workers.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+
+# Sessions
+# Set SESSION_ENGINE to 'accounts.sessions' to keep sessions in a signed,
+# expiring cookie instead of the django_session table.
+
+SESSION_ENGINE = 'django.contrib.sessions.backends.db'
+
+# how long a process may trust a cached session epoch before re-reading it
+SESSION_EPOCH_CACHE_SECONDS = 60
+
+
+# Logging
+# request profiles are logged as JSON lines, slow ones as warnings
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'accounts.profiling': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+    },
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -5,21 +5,25 @@ from .models import PatientProfile, Appointment, MedicalHistory, Billing, Health
 @admin.register(PatientProfile)
 class PatientProfileAdmin(admin.ModelAdmin):
     list_display = ("id", "user", "phone", "insurance_info")  # removed created_at
+    list_select_related = ("user",)
 
 
 @admin.register(Appointment)
 class AppointmentAdmin(admin.ModelAdmin):
     list_display = ("id", "patient", "doctor", "date", "time", "status")
+    list_select_related = ("patient__user", "doctor__user")
 
 
 @admin.register(MedicalHistory)
 class MedicalHistoryAdmin(admin.ModelAdmin):
     list_display = ("id", "patient", "diagnosis", "date")  # replaced condition & created_at with real fields
+    list_select_related = ("patient__user",)
 
 
 @admin.register(Billing)
 class BillingAdmin(admin.ModelAdmin):
     list_display = ("id", "patient", "amount", "status", "created_at")
+    list_select_related = ("patient__user",)
 
 
 @admin.register(HealthResource)
@@ -0,0 +1,97 @@
+"""
+Async variants of the read-heavy patient pages, routed instead of the ones in
+views.py when ASYNC_VIEWS is set. A page's independent queries run at the same
+time through accounts.asyncdb; the template is rendered on the request's
+thread, off the event loop. See ASYNC_VIEWS before turning them on.
+"""
+from functools import partial
+
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse
+from django.shortcuts import redirect, render
+
+from accounts import asyncdb
+from accounts.loaders import load
+from adminpanel.pagination import paginate
+from doctor.models import DoctorProfile
+from . import search, slots
+from .models import Appointment, Billing
+from .views import DASHBOARD_RELATIONS, _slot_search_params
+
+arender = sync_to_async(render)
+
+
+async def _patient(request):
+    user = await request.identity.auser()
+    if not user or user.role != "patient":
+        return None
+    return await request.identity.apatient()
+
+
+async def patient_dashboard(request):
+    patient = await _patient(request)
+    if patient is None:
+        return redirect("accounts:login")
+
+    appointments, bills, prescriptions = await asyncdb.gather(
+        load(Appointment.objects.filter(patient=patient), DASHBOARD_RELATIONS["appointments"]),
+        Billing.objects.filter(patient=patient),
+        load(patient.prescriptions.order_by("-created_at"), DASHBOARD_RELATIONS["prescriptions"]),
+    )
+    return await arender(
+        request,
+        "patient/dashboard.html",
+        {
+            "patient": patient,
+            "appointments": appointments,
+            "bills": bills,
+            "prescriptions": prescriptions,
+        },
+    )
+
+
+async def find_slots(request):
+    if await _patient(request) is None:
+        return redirect("accounts:login")
+
+    params = _slot_search_params(request)
+    results, specializations, departments = await asyncdb.gather(
+        partial(slots.next_available, **params),
+        DoctorProfile.objects.exclude(specialization="")
+            .order_by("specialization").values_list("specialization", flat=True).distinct(),
+        DoctorProfile.objects.exclude(department="")
+            .order_by("department").values_list("department", flat=True).distinct(),
+    )
+    return await arender(request, "patient/find_slots.html", {
+        "results": results,
+        "params": params,
+        "specializations": specializations,
+        "departments": departments,
+    })
+
+
+async def find_slots_feed(request):
+    if await _patient(request) is None:
+        return JsonResponse({"error": "Please login as a patient."}, status=403)
+
+    found = await asyncdb.fetch(partial(slots.next_available, **_slot_search_params(request)))
+    data = [{
+        "doctor_id": doctor.id,
+        "doctor": doctor.user.get_full_name() or doctor.user.username,
+        "specialization": doctor.specialization,
+        "department": doctor.department,
+        "date": day.isoformat(),
+        "time": slot,
+    } for doctor, day, slot in found]
+    return JsonResponse({"slots": data})
+
+
+async def resources(request):
+    query = request.GET.get("q", "").strip()
+    if query:
+        page = await asyncdb.fetch(partial(search.search, request, query))
+    else:
+        page = await asyncdb.fetch(
+            partial(paginate, request, search.latest(), ("-published_at", "-id"), per_page=search.PER_PAGE)
+        )
+    return await arender(request, "patient/resources.html", {"resources": page, "page": page, "query": query})
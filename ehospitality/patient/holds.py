@@ -0,0 +1,125 @@
+"""
+Short-lived slot holds.
+
+Picking a slot on the booking page takes a SlotHold row (unique per doctor,
+date and time) and closes the slot in the inventory, so concurrent patients
+race on a single insert instead of on the appointment itself. Confirming turns
+the hold into an Appointment in one transaction; abandoned holds expire after
+SLOT_HOLD_SECONDS and are swept in bulk.
+"""
+import time as _time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, OperationalError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from accounts import metrics
+from .models import Appointment, SlotHold, SlotInventory
+from .slots import FREE_STATUSES, book_slot, release_slot, slot_bit, take_slot
+
+SWEEP_INTERVAL = 60
+
+_last_sweep = 0.0
+
+
+class SlotUnavailable(Exception):
+    pass
+
+
+class SlotBusy(SlotUnavailable):
+    """The database could not take the booking's locks (SQLite allows one writer at a time)."""
+
+    def __init__(self, message="Many patients are booking right now, please try again."):
+        super().__init__(message)
+
+
+def hold_ttl():
+    return timedelta(seconds=getattr(settings, "SLOT_HOLD_SECONDS", 300))
+
+
+def take_hold(patient, doctor, day, t):
+    """Reserve a slot for the patient, replacing any hold they already had."""
+    now = timezone.now()
+    try:
+        with transaction.atomic():
+            for old in SlotHold.objects.filter(patient=patient):
+                release_hold(old)
+            SlotHold.objects.filter(doctor=doctor, date=day, time=t, expires_at__lte=now).delete()
+            if Appointment.objects.filter(doctor=doctor, date=day, time=t).exclude(status__in=FREE_STATUSES).exists():
+                raise SlotUnavailable("Slot not available!")
+            try:
+                with transaction.atomic():
+                    hold = SlotHold.objects.create(
+                        patient=patient, doctor=doctor, date=day, time=t, expires_at=now + hold_ttl()
+                    )
+            except IntegrityError:
+                metrics.inc("booking_conflicts_total", step="hold")
+                raise SlotUnavailable("Sorry, this slot is being booked by another patient.")
+            take_slot(doctor.id, day, t)
+    except OperationalError:
+        # lock timeout; everything above was rolled back
+        raise SlotBusy()
+    return hold
+
+
+def release_hold(hold):
+    try:
+        if SlotHold.objects.filter(pk=hold.pk).delete()[0]:
+            release_slot(hold.doctor_id, hold.date, hold.time)
+    except OperationalError:
+        raise SlotBusy()
+
+
+def confirm_hold(hold):
+    """
+    Turn a live hold into an appointment. Raises SlotUnavailable once it has
+    expired, and SlotBusy (the hold is kept) when the database is locked.
+    """
+    try:
+        with transaction.atomic():
+            if not SlotHold.objects.filter(pk=hold.pk, expires_at__gt=timezone.now()).delete()[0]:
+                raise SlotUnavailable("Your reservation expired, please pick the slot again.")
+            try:
+                appointment = book_slot(hold.patient, hold.doctor, hold.date, hold.time)
+            except IntegrityError:
+                metrics.inc("booking_conflicts_total", step="confirm")
+                raise SlotUnavailable("Sorry, this slot was just booked by another patient.")
+    except OperationalError:
+        raise SlotBusy()
+    metrics.inc("bookings_total")
+    return appointment
+
+
+def expire_holds(now=None):
+    """Delete every expired hold and reopen its slot, one UPDATE per doctor and day."""
+    expired = list(
+        SlotHold.objects.filter(expires_at__lte=now or timezone.now()).values_list("id", "doctor_id", "date", "time")
+    )
+    if not expired:
+        return 0
+
+    bits = {}
+    for _, doctor_id, day, t in expired:
+        bits[(doctor_id, day)] = bits.get((doctor_id, day), 0) | slot_bit(t)
+    with transaction.atomic():
+        SlotHold.objects.filter(id__in=[row[0] for row in expired]).delete()
+        for (doctor_id, day), mask in bits.items():
+            SlotInventory.objects.filter(doctor_id=doctor_id, date=day).update(
+                open_mask=F("open_mask").bitor(F("capacity_mask").bitand(mask))
+            )
+    return len(expired)
+
+
+def maybe_expire_holds():
+    """Sweep expired holds at most once per SWEEP_INTERVAL seconds in this process."""
+    global _last_sweep
+    if _time.monotonic() - _last_sweep < SWEEP_INTERVAL:
+        return
+    _last_sweep = _time.monotonic()
+    try:
+        expire_holds()
+    except OperationalError:
+        # another booking has the database locked; the next request sweeps
+        _last_sweep = 0.0
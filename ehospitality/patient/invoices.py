@@ -0,0 +1,193 @@
+"""
+Monthly invoices.
+
+One invoice per patient and month lists every bill created in that month
+with the prescription it was raised for: the prescribing doctor and the
+items. ``manage.py render_invoices`` writes them in bulk at month end to
+MEDIA_ROOT/invoices/<YYYY-MM>/<patient id>.html (and .pdf), spreading the
+patients over a pool of worker processes.
+
+Each file is written under a temporary name and renamed into place, so a
+file that exists is complete; an interrupted run picks up where it stopped
+by skipping the patients whose invoices are already there. A worker renders
+CHUNK_SIZE patients at a time from two queries, their bills (with patient
+and doctor) and the prescription items of those bills.
+
+PDF output needs WeasyPrint, which is optional; HTML needs nothing extra.
+"""
+import os
+import re
+from datetime import date, datetime, time
+from decimal import Decimal
+
+from django.conf import settings
+from django.template.loader import render_to_string
+from django.utils import timezone
+
+from doctor.models import PrescriptionItem
+from .models import Billing
+
+CHUNK_SIZE = 200
+FORMATS = ("html", "pdf")
+ZERO = Decimal("0.00")
+_PERIOD = re.compile(r"^(\d{4})-(\d{2})$")
+
+
+# ------------ periods ------------
+def parse_period(period):
+    """The first day of the month named by ``period`` ("YYYY-MM"); raises ValueError otherwise."""
+    match = _PERIOD.match(period or "")
+    if not match:
+        raise ValueError(f"{period!r} is not a month (YYYY-MM).")
+    return date(int(match.group(1)), int(match.group(2)), 1)
+
+
+def period_of(day):
+    return day.strftime("%Y-%m")
+
+
+def previous_period():
+    first = timezone.localdate().replace(day=1)
+    return period_of(date.fromordinal(first.toordinal() - 1))
+
+
+def period_bounds(period):
+    """The [start, end) datetimes of ``period``."""
+    first = parse_period(period)
+    following = date(first.year + first.month // 12, first.month % 12 + 1, 1)
+    return (
+        timezone.make_aware(datetime.combine(first, time.min)),
+        timezone.make_aware(datetime.combine(following, time.min)),
+    )
+
+
+# ------------ files ------------
+def invoice_dir(period):
+    return os.path.join(settings.MEDIA_ROOT, "invoices", period)
+
+
+def invoice_path(period, patient_id, fmt="html"):
+    return os.path.join(invoice_dir(period), f"{patient_id}.{fmt}")
+
+
+def rendered(period, formats=("html",)):
+    """Ids of the patients whose invoices for ``period`` exist in every one of ``formats``."""
+    found = {fmt: set() for fmt in formats}
+    try:
+        entries = os.scandir(invoice_dir(period))
+    except FileNotFoundError:
+        return set()
+    with entries:
+        for entry in entries:
+            stem, _, fmt = entry.name.partition(".")
+            if fmt in found and stem.isdigit():
+                found[fmt].add(int(stem))
+    return set.intersection(*found.values()) if found else set()
+
+
+def remove_partial(period):
+    """Delete temporary files left by an interrupted run."""
+    try:
+        entries = os.scandir(invoice_dir(period))
+    except FileNotFoundError:
+        return 0
+    removed = 0
+    with entries:
+        for entry in entries:
+            if entry.name.endswith(".tmp"):
+                os.remove(entry.path)
+                removed += 1
+    return removed
+
+
+def _write(path, data):
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as fh:
+        fh.write(data)
+    os.replace(tmp, path)
+
+
+def _pdf(html):
+    try:
+        from weasyprint import HTML
+    except ImportError:
+        raise RuntimeError("PDF invoices need WeasyPrint (pip install weasyprint).")
+    return HTML(string=html, base_url=str(settings.BASE_DIR)).write_pdf()
+
+
+def pdf_available():
+    try:
+        import weasyprint  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+# ------------ rendering ------------
+def patients_billed(period):
+    """Ids of the patients with at least one bill in ``period``, ascending."""
+    start, end = period_bounds(period)
+    return list(
+        Billing.objects.filter(created_at__gte=start, created_at__lt=end)
+        .order_by("patient_id").values_list("patient_id", flat=True).distinct()
+    )
+
+
+def invoices(period, patient_ids):
+    """Yield the context of each invoice of ``patient_ids`` for ``period``, in patient order."""
+    start, end = period_bounds(period)
+    bills = list(
+        Billing.objects.filter(patient_id__in=patient_ids, created_at__gte=start, created_at__lt=end)
+        .select_related("patient__user", "prescription__doctor__user")
+        .order_by("patient_id", "created_at", "id")
+    )
+    items = {}
+    for item in PrescriptionItem.objects.filter(
+        prescription_id__in=[b.prescription_id for b in bills if b.prescription_id]
+    ).order_by("prescription_id", "id"):
+        items.setdefault(item.prescription_id, []).append(item)
+
+    by_patient = {}
+    for bill in bills:
+        bill.lines = items.get(bill.prescription_id, [])
+        by_patient.setdefault(bill.patient_id, []).append(bill)
+    for patient_id, patient_bills in by_patient.items():
+        total = sum((b.amount for b in patient_bills), ZERO)
+        paid = sum((b.amount for b in patient_bills if b.status == "paid"), ZERO)
+        yield {
+            "number": f"INV-{period}-{patient_id}",
+            "period": parse_period(period),
+            "issued": timezone.localdate(),
+            "patient": patient_bills[0].patient,
+            "bills": patient_bills,
+            "total": total,
+            "paid": paid,
+            "outstanding": total - paid,
+        }
+
+
+def render_invoice(context):
+    return render_to_string("patient/invoice.html", context)
+
+
+def render_patient(patient, period):
+    """The HTML invoice of one patient for ``period``, or None if they were not billed in it."""
+    for context in invoices(period, [patient.id]):
+        return render_invoice(context)
+    return None
+
+
+def write_invoices(period, patient_ids, formats=("html",)):
+    """Render and write the invoices of ``patient_ids`` for ``period``; returns how many were written."""
+    os.makedirs(invoice_dir(period), exist_ok=True)
+    written = 0
+    for context in invoices(period, patient_ids):
+        html = render_invoice(context)
+        patient_id = context["patient"].id
+        if "pdf" in formats:
+            _write(invoice_path(period, patient_id, "pdf"), _pdf(html))
+        if "html" in formats:
+            _write(invoice_path(period, patient_id, "html"), html.encode("utf-8"))
+        written += 1
+    return written
+
@@ -0,0 +1,102 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import RequestFactory
+
+from patient import search
+from patient.models import HealthResource
+
+VOCABULARY = (
+    "heart blood pressure diabetes insulin glucose asthma inhaler allergy vaccine fever infection "
+    "antibiotic virus bacteria cholesterol diet exercise sleep stress anxiety depression therapy "
+    "kidney liver lung cancer screening mammogram colon skin sun protection hydration nutrition "
+    "vitamin iron calcium bone fracture joint arthritis pain migraine headache stroke symptoms "
+    "pregnancy prenatal infant child adolescent elderly dementia memory hearing vision eye dental "
+    "smoking alcohol obesity weight surgery recovery physiotherapy wound care hygiene handwashing "
+    "influenza covid pneumonia tuberculosis malaria dengue hepatitis thyroid hormone anemia "
+    "medication dosage side effects prescription pharmacy clinic appointment emergency first aid"
+).split()
+FILLER = "the a of and to in is for with on that by this be are as or at from it can your".split()
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark HealthResource search on a throwaway test database: seed --articles "
+        "articles, then compare ranked index search with the old full listing and an "
+        "icontains scan."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--articles", type=int, default=100_000)
+        parser.add_argument("--queries", type=int, default=200)
+        parser.add_argument("--seed", type=int, default=1)
+
+    def handle(self, *args, **options):
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            self.run(options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    def seed(self, count, rng):
+        # a few words are very common, most are rare, like real medical text
+        weights = [1 / (rank + 1) for rank in range(len(VOCABULARY))]
+        batch = []
+        for _ in range(count):
+            title = " ".join(rng.choices(VOCABULARY, weights, k=rng.randint(3, 7))).capitalize()
+            words = rng.choices(VOCABULARY, weights, k=rng.randint(40, 90)) + rng.choices(FILLER, k=60)
+            rng.shuffle(words)
+            batch.append(HealthResource(title=title, content=" ".join(words)))
+            if len(batch) == 5000:
+                HealthResource.objects.bulk_create(batch)
+                batch = []
+        HealthResource.objects.bulk_create(batch)
+
+    def timed(self, fn, *args):
+        started = time.perf_counter()
+        result = fn(*args)
+        return time.perf_counter() - started, result
+
+    def report(self, label, samples):
+        samples = sorted(samples)
+        p95 = samples[min(int(len(samples) * 0.95), len(samples) - 1)]
+        self.stdout.write(
+            f"{label:<28} n={len(samples):<5} p50={statistics.median(samples) * 1000:8.1f} ms  "
+            f"p95={p95 * 1000:8.1f} ms  max={samples[-1] * 1000:8.1f} ms"
+        )
+
+    def run(self, options):
+        rng = random.Random(options["seed"])
+        elapsed, _ = self.timed(self.seed, options["articles"], rng)
+        self.stdout.write(f"seeded {options['articles']} articles in {elapsed:.1f}s")
+        elapsed, _ = self.timed(search.rebuild_index)
+        self.stdout.write(f"index backend: {search._backend()}, rebuilt in {elapsed:.1f}s")
+
+        queries = [" ".join(rng.sample(VOCABULARY, rng.choice((1, 1, 2, 3)))) for _ in range(options["queries"])]
+        factory = RequestFactory()
+
+        listing = [self.timed(lambda: list(HealthResource.objects.order_by("-published_at")))[0] for _ in range(3)]
+        self.report("full listing (old page)", listing)
+
+        ranked, hits = [], 0
+        for q in queries:
+            elapsed, page = self.timed(search.search, factory.get("/", {"q": q}), q)
+            ranked.append(elapsed)
+            hits += bool(len(page))
+        self.report(f"search ({search._backend()})", ranked)
+
+        deep = [self.timed(search.search, factory.get("/", {"q": q, "page": 10}), q)[0] for q in queries[:50]]
+        self.report("search, page 10", deep)
+
+        scans = [self.timed(search._search_like, search.terms(q), search.PER_PAGE + 1, 0)[0] for q in queries[:20]]
+        self.report("icontains scan", scans)
+
+        # a term no article contains: the scan has to read every row to find that out
+        miss = ["xylophone"]
+        self.report("search, no match", [self.timed(search.search, factory.get("/", {"q": miss[0]}), miss[0])[0] for _ in range(5)])
+        self.report("icontains scan, no match", [self.timed(search._search_like, miss, search.PER_PAGE + 1, 0)[0] for _ in range(5)])
+
+        self.stdout.write(f"queries with results: {hits}/{len(queries)}")
@@ -0,0 +1,28 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from doctor.models import DoctorProfile
+from patient.slots import materialize
+
+
+class Command(BaseCommand):
+    help = "Precompute the open appointment slots of every doctor for the coming days."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, default=30, help="Number of days to build, starting today.")
+        parser.add_argument("--batch", type=int, default=200, help="Doctors per batch.")
+
+    def handle(self, *args, **options):
+        today = timezone.localdate()
+        dates = [today + timedelta(days=i) for i in range(options["days"])]
+        doctor_ids = list(DoctorProfile.objects.values_list("id", flat=True))
+
+        built = 0
+        for i in range(0, len(doctor_ids), options["batch"]):
+            built += len(materialize(doctor_ids[i:i + options["batch"]], dates))
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Slot inventory ready for {len(doctor_ids)} doctors over {len(dates)} days ({built} rows)."
+        ))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from patient.holds import expire_holds
+
+
+class Command(BaseCommand):
+    help = "Release every slot hold whose confirmation window has passed."
+
+    def handle(self, *args, **options):
+        count = expire_holds()
+        self.stdout.write(self.style.SUCCESS(f"Expired {count} slot holds."))
@@ -0,0 +1,149 @@
+import random
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError, connection, connections
+from django.db.models import Count
+from django.utils import timezone
+
+from accounts.models import User
+from doctor.models import DoctorProfile
+from patient import holds
+from patient.models import Appointment, PatientProfile, SlotHold, SlotInventory
+from patient.slots import materialize, open_slots
+
+
+class Command(BaseCommand):
+    help = (
+        "Book the same doctor from many threads through the hold/confirm flow and check "
+        "that no slot is double booked. Runs against a throwaway test database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--threads", type=int, default=16)
+        parser.add_argument("--days", type=int, default=1, help="Days of slots the hot doctor offers.")
+        parser.add_argument("--seed", type=int, default=1)
+        parser.add_argument("--max-errors", type=int, default=0,
+                            help="Attempts that may fail with something other than a lost race (default 0).")
+
+    def handle(self, *args, **options):
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            self.run(options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    def run(self, options):
+        threads = options["threads"]
+        doctor = DoctorProfile.objects.create(user=User.objects.create(username="loadtest-doctor", role="doctor"))
+        for i in range(threads):
+            User.objects.create(username=f"loadtest-patient-{i}", role="patient")
+        patients = list(PatientProfile.objects.order_by("id"))
+        today = timezone.localdate()
+        days = [today + timedelta(days=i + 1) for i in range(options["days"])]
+        materialize([doctor.id], days)
+
+        outcomes = Counter()
+        errors = Counter()
+        queries = Counter()
+        lock = threading.Lock()
+        stop = threading.Event()
+
+        def count_queries(execute, sql, params, many, context):
+            queries[threading.get_ident()] += 1
+            return execute(sql, params, many, context)
+
+        def lost_race(e):
+            # SlotBusy is a lock timeout, not a lost race
+            return isinstance(e, (holds.SlotUnavailable, IntegrityError)) and not isinstance(e, holds.SlotBusy)
+
+        def release(hold):
+            # the lock that failed the confirm can fail the release as well; keep trying
+            for _ in range(100):
+                try:
+                    return holds.release_hold(hold)
+                except holds.SlotBusy:
+                    time.sleep(0.01)
+
+        def attempt(patient, day):
+            free = open_slots(doctor.id, day)
+            if not free:
+                return None
+            # everybody goes for the earliest slot to maximise contention
+            t = datetime.strptime(free[0], "%H:%M").time()
+            try:
+                hold = holds.take_hold(patient, doctor, day, t)
+            except Exception as e:
+                if lost_race(e):
+                    return "conflict"
+                raise
+            try:
+                holds.confirm_hold(hold)
+            except Exception as e:
+                if lost_race(e):
+                    return "conflict"
+                # reopen the slot now instead of when the hold expires
+                release(hold)
+                raise
+            return "booked"
+
+        def worker(patient, rng):
+            with connection.execute_wrapper(count_queries):
+                while not stop.is_set():
+                    try:
+                        result = attempt(patient, rng.choice(days))
+                        if result is None and not any(open_slots(doctor.id, d) for d in days):
+                            break
+                    except Exception as e:
+                        # only a lost race is an expected outcome; lock timeouts and the like fail the run
+                        with lock:
+                            errors[type(e).__name__] += 1
+                            if sum(errors.values()) > options["max_errors"]:
+                                stop.set()
+                        continue
+                    if result:
+                        with lock:
+                            outcomes[result] += 1
+            connections.close_all()
+
+        workers = [
+            threading.Thread(target=worker, args=(p, random.Random(options["seed"] + i)))
+            for i, p in enumerate(patients)
+        ]
+        started = time.perf_counter()
+        for w in workers:
+            w.start()
+        for w in workers:
+            w.join()
+        elapsed = time.perf_counter() - started
+
+        booked = Appointment.objects.filter(doctor=doctor).count()
+        duplicates = (
+            Appointment.objects.filter(doctor=doctor).values("date", "time").order_by()
+            .annotate(n=Count("id")).filter(n__gt=1).count()
+        )
+        leaked = SlotInventory.objects.filter(doctor=doctor, open_mask__gt=0).count()
+        holds_left = SlotHold.objects.count()
+
+        self.stdout.write(f"threads:          {threads}")
+        self.stdout.write(f"elapsed:          {elapsed:.2f}s")
+        self.stdout.write(f"attempts:         {sum(outcomes.values())} ({dict(outcomes)})")
+        self.stdout.write(f"appointments:     {booked}")
+        self.stdout.write(f"errors:           {sum(errors.values())} ({dict(errors)})")
+        self.stdout.write(f"holds left:       {holds_left}")
+        self.stdout.write(f"bookings/s:       {booked / elapsed:.1f}")
+        self.stdout.write(f"queries:          {sum(queries.values())}")
+        if sum(errors.values()) > options["max_errors"]:
+            raise CommandError(
+                f"{sum(errors.values())} attempts failed with an unexpected error ({dict(errors)}); "
+                f"the run was stopped with {leaked} days of open slots left."
+            )
+        if duplicates or leaked or holds_left or booked != outcomes["booked"]:
+            raise CommandError(
+                f"Inconsistent result: {duplicates} double booked slots, {leaked} days with open slots left, "
+                f"{holds_left} holds left, {booked} appointments for {outcomes['booked']} confirmed bookings."
+            )
+        self.stdout.write(self.style.SUCCESS("No slot was double booked."))
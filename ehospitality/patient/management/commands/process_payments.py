@@ -0,0 +1,53 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from patient import payments
+
+
+class Command(BaseCommand):
+    help = (
+        "Run payment workers: create checkout sessions for queued payment jobs. "
+        "Runs until interrupted, or with --once until the queue is empty."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=4, help="Worker threads; provider calls are I/O bound.")
+        parser.add_argument("--batch", type=int, default=10, help="Jobs each worker claims at a time.")
+        parser.add_argument("--poll", type=float, default=1.0, help="Seconds an idle worker waits before polling again.")
+        parser.add_argument("--once", action="store_true", help="Exit once no job is due.")
+
+    def handle(self, *args, **options):
+        if options["workers"] < 1 or options["batch"] < 1:
+            raise CommandError("--workers and --batch must be positive.")
+        stop = threading.Event()
+        processed = []
+
+        def worker():
+            done = 0
+            try:
+                while not stop.is_set():
+                    count = payments.work(options["batch"])
+                    done += count
+                    if not count:
+                        if options["once"]:
+                            break
+                        stop.wait(options["poll"])
+            finally:
+                connection.close()
+            processed.append(done)
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(options["workers"]) as pool:
+            futures = [pool.submit(worker) for _ in range(options["workers"])]
+            try:
+                for future in futures:
+                    future.result()
+            except KeyboardInterrupt:
+                stop.set()
+        self.stdout.write(self.style.SUCCESS(
+            f"Processed {sum(processed)} payment jobs in {time.perf_counter() - started:.1f}s."
+        ))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from patient import payments
+
+
+class Command(BaseCommand):
+    help = "Ask the payment provider about open checkout sessions and mark the paid bills paid."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch", type=int, default=100, help="Sessions looked up per round.")
+
+    def handle(self, *args, **options):
+        count = payments.reconcile(options["batch"])
+        self.stdout.write(self.style.SUCCESS(f"Marked {count} bills paid."))
@@ -0,0 +1,77 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from patient import invoices
+
+
+class Command(BaseCommand):
+    help = (
+        "Write the invoice of every patient billed in a month to MEDIA_ROOT/invoices/<YYYY-MM>/, "
+        "using a pool of worker processes. Invoices already written are kept, so an interrupted "
+        "run can simply be started again."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("period", nargs="?", help="Month to invoice, YYYY-MM; defaults to last month.")
+        parser.add_argument("--format", action="append", choices=invoices.FORMATS, dest="formats",
+                            help="Output format, may be repeated (default html).")
+        parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                            help="Worker processes; 1 renders in this process.")
+        parser.add_argument("--chunk-size", type=int, default=invoices.CHUNK_SIZE,
+                            help="Patients a worker renders per task.")
+        parser.add_argument("--force", action="store_true", help="Render invoices that already exist again.")
+
+    def handle(self, *args, **options):
+        period = options["period"] or invoices.previous_period()
+        try:
+            invoices.parse_period(period)
+        except ValueError as e:
+            raise CommandError(str(e))
+        formats = tuple(options["formats"] or ("html",))
+        if "pdf" in formats and not invoices.pdf_available():
+            raise CommandError("PDF invoices need WeasyPrint (pip install weasyprint).")
+        if options["workers"] < 1 or options["chunk_size"] < 1:
+            raise CommandError("--workers and --chunk-size must be positive.")
+
+        started = time.perf_counter()
+        invoices.remove_partial(period)
+        billed = invoices.patients_billed(period)
+        done = set() if options["force"] else invoices.rendered(period, formats)
+        todo = [pid for pid in billed if pid not in done]
+        size = options["chunk_size"]
+        chunks = [todo[i:i + size] for i in range(0, len(todo), size)]
+        self.stdout.write(
+            f"{period}: {len(billed)} patients billed, {len(billed) - len(todo)} already invoiced, "
+            f"{len(todo)} to render."
+        )
+
+        written = 0
+        if options["workers"] == 1 or len(chunks) <= 1:
+            for chunk in chunks:
+                written += invoices.write_invoices(period, chunk, formats)
+                self.progress(written, len(todo), options)
+        else:
+            # forked workers must not share this process's database connections
+            connections.close_all()
+            with ProcessPoolExecutor(options["workers"], initializer=django.setup) as pool:
+                futures = [pool.submit(invoices.write_invoices, period, chunk, formats) for chunk in chunks]
+                try:
+                    for future in as_completed(futures):
+                        written += future.result()
+                        self.progress(written, len(todo), options)
+                except KeyboardInterrupt:
+                    pool.shutdown(wait=True, cancel_futures=True)
+                    raise CommandError(f"Interrupted after {written} invoices; run again to continue.")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {written} invoices to {invoices.invoice_dir(period)} in {time.perf_counter() - started:.1f}s."
+        ))
+
+    def progress(self, written, total, options):
+        if options["verbosity"] > 1:
+            self.stderr.write(f"{written} of {total} invoices written")
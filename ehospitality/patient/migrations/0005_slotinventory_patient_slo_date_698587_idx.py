@@ -0,0 +1,17 @@
+# Generated by Django 4.2.30 on 2026-10-18 10:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patient', '0004_slotinventory'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='slotinventory',
+            index=models.Index(fields=['date', 'doctor'], name='patient_slo_date_698587_idx'),
+        ),
+    ]
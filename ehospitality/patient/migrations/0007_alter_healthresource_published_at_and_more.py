@@ -0,0 +1,26 @@
+# Generated by Django 4.2.30 on 2026-10-18 10:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patient', '0006_slothold'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='healthresource',
+            name='published_at',
+            field=models.DateTimeField(auto_now_add=True, db_index=True),
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['date', 'time', 'id'], name='patient_app_date_d2e2ef_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['status', 'date', 'time', 'id'], name='patient_app_status_bd8499_idx'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+from django.db import migrations
+
+FTS_TABLE = "patient_healthresource_fts"
+
+
+def create_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == "sqlite":
+        schema_editor.execute(
+            f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5(title, content, tokenize='porter unicode61')"
+        )
+        schema_editor.execute(
+            f"INSERT INTO {FTS_TABLE} (rowid, title, content) SELECT id, title, content FROM patient_healthresource"
+        )
+    elif vendor == "mysql":
+        schema_editor.execute(f"CREATE FULLTEXT INDEX {FTS_TABLE} ON patient_healthresource (title, content)")
+
+
+def drop_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == "sqlite":
+        schema_editor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+    elif vendor == "mysql":
+        schema_editor.execute(f"DROP INDEX {FTS_TABLE} ON patient_healthresource")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patient', '0007_alter_healthresource_published_at_and_more'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 4.2.30 on 2026-10-18 10:34
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patient', '0009_appointment_patient_app_patient_e0c75d_idx_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='billing',
+            name='paid_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='PaymentJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('ready', 'Ready'), ('failed', 'Failed')], default='queued', max_length=20)),
+                ('success_url', models.URLField(max_length=500)),
+                ('cancel_url', models.URLField(max_length=500)),
+                ('session_id', models.CharField(blank=True, db_index=True, max_length=255)),
+                ('checkout_url', models.URLField(blank=True, max_length=1000)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('error', models.TextField(blank=True)),
+                ('run_after', models.DateTimeField()),
+                ('claimed_at', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('bill', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='payment_jobs', to='patient.billing')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'run_after'], name='patient_pay_status_2d2027_idx')],
+            },
+        ),
+    ]
@@ -30,11 +30,59 @@ class Appointment(models.Model):
     class Meta:
         unique_together = ('doctor', 'date', 'time')
         ordering = ['date', 'time']
+        indexes = [
+            models.Index(fields=['date', 'time', 'id']),
+            models.Index(fields=['status', 'date', 'time', 'id']),
+            models.Index(fields=['patient', 'date', 'time', 'id']),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # remember the slot as loaded so signal handlers can tell what moved
+        instance._loaded_slot = (
+            instance.__dict__.get("doctor_id"),
+            instance.__dict__.get("date"),
+            instance.__dict__.get("time"),
+            instance.__dict__.get("status"),
+        )
+        return instance
 
     def __str__(self):
         return f"{self.date} {self.time} - Dr.{self.doctor.user.username} with {self.patient.user.username}"
 
 
+class SlotInventory(models.Model):
+    """Open slots of one doctor on one day, one bit per slot (see patient.slots)."""
+    doctor = models.ForeignKey("doctor.DoctorProfile", on_delete=models.CASCADE, related_name="slot_inventory")
+    date = models.DateField()
+    capacity_mask = models.BigIntegerField(default=0)
+    open_mask = models.BigIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('doctor', 'date')
+        indexes = [models.Index(fields=['date', 'doctor'])]
+
+    def __str__(self):
+        return f"Slots for doctor {self.doctor_id} on {self.date}"
+
+
+class SlotHold(models.Model):
+    """Short-lived reservation of a slot while the patient confirms (see patient.holds)."""
+    patient = models.ForeignKey(PatientProfile, on_delete=models.CASCADE, related_name="slot_holds")
+    doctor = models.ForeignKey("doctor.DoctorProfile", on_delete=models.CASCADE, related_name="slot_holds")
+    date = models.DateField()
+    time = models.TimeField()
+    expires_at = models.DateTimeField(db_index=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ('doctor', 'date', 'time')
+
+    def __str__(self):
+        return f"Hold {self.date} {self.time} - doctor {self.doctor_id} for {self.patient_id}"
+
+
 class MedicalHistory(models.Model):
     patient = models.ForeignKey(PatientProfile, on_delete=models.CASCADE)
     diagnosis = models.TextField()
@@ -43,17 +91,13 @@ class MedicalHistory(models.Model):
     treatment = models.TextField(blank=True, null=True)
     date = models.DateField(auto_now_add=True)
 
+    class Meta:
+        indexes = [models.Index(fields=["patient", "date", "id"])]
+
     def __str__(self):
         return f"History for {self.patient.user.username} on {self.date}"
 
 
-class HealthResource(models.Model):
-    title = models.CharField(max_length=200)
-    content = models.TextField()
-    published_at = models.DateTimeField(auto_now_add=True)
-
-    def __str__(self):
-        return self.title
 class Billing(models.Model):
     patient = models.ForeignKey(PatientProfile, on_delete=models.CASCADE, related_name="bills")
     prescription = models.OneToOneField(
@@ -63,15 +107,60 @@ class Billing(models.Model):
     status = models.CharField(max_length=20, choices=[("unpaid", "Unpaid"), ("paid", "Paid")], default="unpaid")
     stripe_payment_intent = models.CharField(max_length=255, blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    paid_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["patient", "created_at", "id"])]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # what the revenue rollups counted this bill as (see adminpanel.rollups)
+        instance._loaded_bill = (
+            instance.__dict__.get("patient_id"),
+            instance.__dict__.get("prescription_id"),
+            instance.__dict__.get("status"),
+            instance.__dict__.get("amount"),
+            instance.__dict__.get("created_at"),
+        )
+        return instance
 
     def __str__(self):
         return f"Bill {self.id} - {self.patient.user.username} ({self.status})"
 
 
+class PaymentJob(models.Model):
+    """A queued checkout-session request for a bill (see patient.payments)."""
+    STATUS_CHOICES = [
+        ("queued", "Queued"),
+        ("running", "Running"),
+        ("ready", "Ready"),
+        ("failed", "Failed"),
+    ]
+
+    bill = models.ForeignKey(Billing, on_delete=models.CASCADE, related_name="payment_jobs")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="queued")
+    success_url = models.URLField(max_length=500)
+    cancel_url = models.URLField(max_length=500)
+    session_id = models.CharField(max_length=255, blank=True, db_index=True)
+    checkout_url = models.URLField(max_length=1000, blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True)
+    run_after = models.DateTimeField()
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["status", "run_after"])]
+
+    def __str__(self):
+        return f"Payment job {self.id} for bill {self.bill_id} ({self.status})"
+
+
 class HealthResource(models.Model):
     title = models.CharField(max_length=200)
     content = models.TextField()
-    published_at = models.DateTimeField(auto_now_add=True)
+    published_at = models.DateTimeField(auto_now_add=True, db_index=True)
 
     def __str__(self):
         return self.title
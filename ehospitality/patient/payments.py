@@ -0,0 +1,270 @@
+"""
+Bill payments, off the request path.
+
+Paying a bill only queues a PaymentJob; the web request then polls the job
+and is redirected to the checkout page once it is ready. ``manage.py
+process_payments`` runs a pool of workers that claim queued jobs with
+SELECT ... FOR UPDATE SKIP LOCKED, create the checkout session with the
+payment provider and retry failures with exponential backoff.
+
+A bill is marked paid only on the provider's word: from the checkout
+webhook, or from ``manage.py reconcile_payments``, which asks the provider
+about recent open sessions in bulk. Both go through mark_bills_paid(), which
+only touches bills that are still unpaid, so replays are harmless.
+
+The provider is settings.PAYMENT_GATEWAY: StripeGateway, or FakeGateway, an
+in-memory stand-in that only works within one process (the tests).
+"""
+import itertools
+import json
+import threading
+from datetime import timedelta
+
+import stripe
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from adminpanel import rollups
+from .models import Billing, PaymentJob
+
+MAX_ATTEMPTS = 5
+# a running job not finished within this long is assumed lost and queued again
+CLAIM_TIMEOUT = timedelta(minutes=5)
+# Stripe expires checkout sessions after 24 hours
+CHECKOUT_TTL = timedelta(hours=23)
+PAID_EVENTS = ("checkout.session.completed", "checkout.session.async_payment_succeeded")
+
+
+class GatewayError(Exception):
+    pass
+
+
+# ------------ gateways ------------
+class StripeGateway:
+    def create_checkout(self, bill, job):
+        """Create a checkout session for ``bill``; returns (session id, checkout url)."""
+        try:
+            session = stripe.checkout.Session.create(
+                api_key=settings.STRIPE_SECRET_KEY,
+                # a retried job gets the session of its first attempt back
+                idempotency_key=f"payment-job-{job.id}",
+                payment_method_types=["card"],
+                line_items=[{
+                    "price_data": {
+                        "currency": settings.PAYMENT_CURRENCY,
+                        "product_data": {"name": f"Hospital Bill #{bill.id}"},
+                        "unit_amount": int(bill.amount * 100),
+                    },
+                    "quantity": 1,
+                }],
+                mode="payment",
+                client_reference_id=str(bill.id),
+                metadata={"bill_id": bill.id, "job_id": job.id},
+                success_url=job.success_url,
+                cancel_url=job.cancel_url,
+            )
+        except stripe.StripeError as e:
+            raise GatewayError(str(e)) from e
+        return session.id, session.url
+
+    def paid_sessions(self, session_ids):
+        """``{session id: payment intent}`` for the given sessions that have been paid."""
+        paid = {}
+        for session_id in session_ids:
+            try:
+                session = stripe.checkout.Session.retrieve(session_id, api_key=settings.STRIPE_SECRET_KEY)
+            except stripe.StripeError as e:
+                raise GatewayError(str(e)) from e
+            if session.payment_status == "paid":
+                paid[session_id] = session.payment_intent or ""
+        return paid
+
+    def parse_event(self, payload, signature):
+        """Verify a webhook request and return its event as a dict."""
+        try:
+            event = stripe.Webhook.construct_event(payload, signature, settings.STRIPE_WEBHOOK_SECRET)
+        except (ValueError, stripe.SignatureVerificationError) as e:
+            raise GatewayError(str(e)) from e
+        return event.to_dict()
+
+
+class FakeGateway:
+    """
+    Stands in for Stripe within one process: its sessions live in memory, so
+    a session created by one process is unknown to the others. Checkout
+    "redirects" straight to the success url, and every session is paid as
+    soon as it is created unless ``outcome`` is set to "unpaid".
+    ``fail_next`` makes that many of the next calls raise GatewayError.
+    """
+
+    def __init__(self, outcome="paid"):
+        self.outcome = outcome
+        self.fail_next = 0
+        self.sessions = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def _maybe_fail(self):
+        with self._lock:
+            if self.fail_next:
+                self.fail_next -= 1
+                raise GatewayError("fake gateway failure")
+
+    def create_checkout(self, bill, job):
+        self._maybe_fail()
+        with self._lock:
+            session_id = f"cs_fake_{next(self._ids)}"
+            self.sessions[session_id] = {
+                "id": session_id,
+                "client_reference_id": str(bill.id),
+                "metadata": {"bill_id": bill.id, "job_id": job.id},
+                "payment_status": self.outcome,
+                "payment_intent": f"pi_fake_{session_id}",
+            }
+        return session_id, f"{job.success_url}?session_id={session_id}"
+
+    def paid_sessions(self, session_ids):
+        self._maybe_fail()
+        return {
+            sid: self.sessions[sid]["payment_intent"]
+            for sid in session_ids
+            if sid in self.sessions and self.sessions[sid]["payment_status"] == "paid"
+        }
+
+    def parse_event(self, payload, signature):
+        try:
+            return json.loads(payload)
+        except ValueError as e:
+            raise GatewayError(str(e)) from e
+
+    def completed_event(self, session_id):
+        """Pay the session and return the webhook payload Stripe would send for it."""
+        with self._lock:
+            session = dict(self.sessions[session_id], payment_status="paid")
+            self.sessions[session_id] = session
+        return json.dumps({"type": "checkout.session.completed", "data": {"object": session}})
+
+
+_gateway = None
+
+
+def get_gateway():
+    global _gateway
+    if _gateway is None:
+        _gateway = import_string(settings.PAYMENT_GATEWAY)()
+    return _gateway
+
+
+# ------------ queue ------------
+def start_payment(bill, success_url, cancel_url):
+    """The job that gets ``bill`` a checkout session: a pending or still valid one if there is one."""
+    now = timezone.now()
+    job = (
+        PaymentJob.objects.filter(bill=bill)
+        .filter(Q(status__in=("queued", "running")) | Q(status="ready", created_at__gte=now - CHECKOUT_TTL))
+        .order_by("-id").first()
+    )
+    if job is None:
+        job = PaymentJob.objects.create(bill=bill, success_url=success_url, cancel_url=cancel_url, run_after=now)
+    return job
+
+
+def claim(batch):
+    """Mark up to ``batch`` due jobs as running and return them; concurrent workers get different jobs."""
+    now = timezone.now()
+    PaymentJob.objects.filter(status="running", claimed_at__lt=now - CLAIM_TIMEOUT).update(status="queued")
+    due = PaymentJob.objects.filter(status="queued", run_after__lte=now).order_by("run_after", "id")
+    if connection.features.has_select_for_update_skip_locked:
+        with transaction.atomic():
+            ids = list(due.select_for_update(skip_locked=True).values_list("id", flat=True)[:batch])
+            PaymentJob.objects.filter(id__in=ids).update(status="running", claimed_at=now)
+    else:
+        # no row locks (SQLite): workers may read the same ids, and each job
+        # goes to whoever flips its status first
+        ids = [
+            job_id for job_id in due.values_list("id", flat=True)[:batch]
+            if due.filter(pk=job_id).update(status="running", claimed_at=now)
+        ]
+    return list(PaymentJob.objects.filter(id__in=ids).select_related("bill").order_by("id"))
+
+
+def run(job):
+    """Create the checkout session for one claimed job."""
+    job.attempts += 1
+    if job.bill.status == "paid":
+        job.status, job.error = "failed", "Bill is already paid."
+    else:
+        try:
+            job.session_id, job.checkout_url = get_gateway().create_checkout(job.bill, job)
+        except Exception as e:
+            job.error = str(e)
+            if job.attempts >= MAX_ATTEMPTS:
+                job.status = "failed"
+            else:
+                job.status = "queued"
+                job.run_after = timezone.now() + timedelta(seconds=2 ** job.attempts)
+        else:
+            job.status, job.error = "ready", ""
+    job.save(update_fields=["status", "session_id", "checkout_url", "attempts", "error", "run_after"])
+    return job
+
+
+def work(batch=10):
+    """Claim and run one batch; returns how many jobs were run."""
+    jobs = claim(batch)
+    for job in jobs:
+        run(job)
+    return len(jobs)
+
+
+# ------------ settlement ------------
+def mark_bills_paid(payments):
+    """Mark the bills in ``{bill_id: payment intent}`` paid, skipping any already paid."""
+    if not payments:
+        return 0
+    now = timezone.now()
+    with transaction.atomic():
+        bills = list(Billing.objects.select_for_update().filter(id__in=list(payments), status="unpaid"))
+        for bill in bills:
+            bill.status = "paid"
+            bill.paid_at = now
+            bill.stripe_payment_intent = payments[bill.id] or bill.stripe_payment_intent
+        Billing.objects.bulk_update(bills, ["status", "paid_at", "stripe_payment_intent"], batch_size=500)
+        rollups.bills_changed(bills)
+    return len(bills)
+
+
+def _bill_id(session):
+    bill_id = (session.get("metadata") or {}).get("bill_id") or session.get("client_reference_id")
+    return int(bill_id) if bill_id else None
+
+
+def handle_event(event):
+    """Apply one webhook event; returns the number of bills it marked paid."""
+    if event.get("type") not in PAID_EVENTS:
+        return 0
+    session = event["data"]["object"]
+    if session.get("payment_status") != "paid" or not _bill_id(session):
+        return 0
+    return mark_bills_paid({_bill_id(session): session.get("payment_intent") or ""})
+
+
+def reconcile(batch=100):
+    """Ask the provider about the open checkout sessions of unpaid bills and settle the paid ones."""
+    jobs = (
+        PaymentJob.objects.filter(status="ready", bill__status="unpaid",
+                                  created_at__gte=timezone.now() - CHECKOUT_TTL - timedelta(hours=1))
+        .exclude(session_id="").order_by("id").values_list("id", "session_id", "bill_id")
+    )
+    settled = 0
+    last = 0
+    while True:
+        rows = list(jobs.filter(id__gt=last)[:batch])
+        if not rows:
+            return settled
+        last = rows[-1][0]
+        paid = get_gateway().paid_sessions([session_id for _, session_id, _ in rows])
+        settled += mark_bills_paid({bill_id: paid[sid] for _, sid, bill_id in rows if sid in paid})
@@ -0,0 +1,198 @@
+"""
+Ranked full-text search over HealthResource title and content.
+
+The index depends on the database:
+
+* SQLite - an FTS5 table (FTS_TABLE) created by migration 0008 and kept in
+  sync by the post_save/post_delete receivers below. Code that bypasses
+  signals (bulk_create, update) calls rebuild_index() afterwards.
+* MySQL  - a FULLTEXT index on (title, content), maintained by InnoDB.
+* other  - no index; every term is matched with icontains.
+
+Results are ranked (bm25 / MATCH score), paged with LIMIT/OFFSET and carry
+a short highlighted snippet instead of the whole article.
+"""
+import re
+
+from django.db import connection
+from django.db.models import Q
+from django.db.models.functions import Substr
+from django.db.models.signals import post_save, post_delete, post_migrate
+from django.dispatch import receiver
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+from .models import HealthResource
+
+FTS_TABLE = "patient_healthresource_fts"
+PER_PAGE = 20
+SNIPPET_WORDS = 30
+EXCERPT_CHARS = 240
+# title matches weigh more than body matches (bm25 column weights)
+TITLE_WEIGHT = 10.0
+
+_MARK_OPEN, _MARK_CLOSE = "\x02", "\x03"
+_backends = {}
+
+
+def _backend():
+    name = connection.settings_dict["NAME"]
+    if name not in _backends:
+        if connection.vendor == "sqlite":
+            _backends[name] = "fts5" if FTS_TABLE in connection.introspection.table_names() else "like"
+        elif connection.vendor == "mysql":
+            _backends[name] = "fulltext"
+        else:
+            _backends[name] = "like"
+    return _backends[name]
+
+
+def terms(query):
+    return [t.lower() for t in re.findall(r"\w+", query or "")][:8]
+
+
+def _highlight(text):
+    html = escape(text)
+    return mark_safe(html.replace(_MARK_OPEN, "<mark>").replace(_MARK_CLOSE, "</mark>"))
+
+
+def make_snippet(text, words, length=SNIPPET_WORDS):
+    """A window of ``length`` words around the first match, terms highlighted."""
+    tokens = text.split()
+    first = next((i for i, tok in enumerate(tokens) if any(w in tok.lower() for w in words)), 0)
+    start = max(first - length // 3, 0)
+    window = " ".join(tokens[start:start + length])
+    if words:
+        pattern = re.compile("(" + "|".join(re.escape(w) for w in words) + ")", re.IGNORECASE)
+        window = pattern.sub(_MARK_OPEN + r"\1" + _MARK_CLOSE, window)
+    prefix = "… " if start else ""
+    suffix = " …" if start + length < len(tokens) else ""
+    return _highlight(prefix + window + suffix)
+
+
+class SearchPage:
+    """One page of search results; same interface as adminpanel's KeysetPage."""
+
+    def __init__(self, results, request, number, has_next):
+        self.object_list = results
+        self.number = number
+        self.has_next = has_next
+        self.has_previous = number > 1
+        self._request = request
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def _query(self, number):
+        params = self._request.GET.copy()
+        params["page"] = number
+        return params.urlencode()
+
+    @property
+    def next_query(self):
+        return self._query(self.number + 1) if self.has_next else ""
+
+    @property
+    def previous_query(self):
+        return self._query(self.number - 1) if self.has_previous else ""
+
+
+def latest():
+    """All resources, newest first, with a short plain-text excerpt instead of the content."""
+    return (
+        HealthResource.objects.only("id", "title", "published_at")
+        .annotate(excerpt=Substr("content", 1, EXCERPT_CHARS))
+        .order_by("-published_at", "-id")
+    )
+
+
+def _search_fts5(words, limit, offset):
+    match = " ".join(f'"{w}"*' for w in words)
+    return list(HealthResource.objects.raw(
+        f"SELECT r.id, r.title, r.published_at, "
+        f"snippet({FTS_TABLE}, -1, %s, %s, %s, {SNIPPET_WORDS}) AS snippet "
+        f"FROM {FTS_TABLE} JOIN patient_healthresource r ON r.id = {FTS_TABLE}.rowid "
+        f"WHERE {FTS_TABLE} MATCH %s "
+        f"ORDER BY bm25({FTS_TABLE}, {TITLE_WEIGHT}, 1.0), r.id DESC LIMIT %s OFFSET %s",
+        [_MARK_OPEN, _MARK_CLOSE, "…", match, limit, offset],
+    ))
+
+
+def _search_fulltext(words, limit, offset):
+    against = " ".join(f"+{w}*" for w in words)
+    return list(HealthResource.objects.raw(
+        "SELECT id, title, content, published_at, "
+        "MATCH(title, content) AGAINST (%s IN BOOLEAN MODE) AS score "
+        "FROM patient_healthresource WHERE MATCH(title, content) AGAINST (%s IN BOOLEAN MODE) "
+        "ORDER BY score DESC, id DESC LIMIT %s OFFSET %s",
+        [against, against, limit, offset],
+    ))
+
+
+def _search_like(words, limit, offset):
+    qs = HealthResource.objects.only("id", "title", "content", "published_at")
+    for w in words:
+        qs = qs.filter(Q(title__icontains=w) | Q(content__icontains=w))
+    return list(qs.order_by("-published_at", "-id")[offset:offset + limit])
+
+
+def search(request, query, per_page=PER_PAGE):
+    """The ``?page=`` page of resources matching ``query``, best match first."""
+    words = terms(query)
+    try:
+        number = max(int(request.GET.get("page", 1)), 1)
+    except ValueError:
+        number = 1
+    if not words:
+        return SearchPage([], request, 1, False)
+
+    backend = _backend()
+    finder = {"fts5": _search_fts5, "fulltext": _search_fulltext, "like": _search_like}[backend]
+    rows = finder(words, per_page + 1, (number - 1) * per_page)
+    for row in rows[:per_page]:
+        if backend == "fts5":
+            row.snippet = _highlight(row.snippet)
+        else:
+            row.snippet = make_snippet(row.content, words)
+    return SearchPage(rows[:per_page], request, number, has_next=len(rows) > per_page)
+
+
+def rebuild_index():
+    """Refill the SQLite FTS table from patient_healthresource."""
+    if _backend() != "fts5":
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE}")
+        cursor.execute(
+            f"INSERT INTO {FTS_TABLE} (rowid, title, content) "
+            f"SELECT id, title, content FROM patient_healthresource"
+        )
+
+
+@receiver(post_migrate)
+def forget_backend(sender, **kwargs):
+    # migration 0008 may just have created (or dropped) the FTS table
+    _backends.clear()
+
+
+@receiver(post_save, sender=HealthResource)
+def resource_saved(sender, instance, raw=False, **kwargs):
+    if _backend() != "fts5":
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [instance.pk])
+        cursor.execute(
+            f"INSERT INTO {FTS_TABLE} (rowid, title, content) VALUES (%s, %s, %s)",
+            [instance.pk, instance.title, instance.content],
+        )
+
+
+@receiver(post_delete, sender=HealthResource)
+def resource_deleted(sender, instance, **kwargs):
+    if _backend() != "fts5":
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [instance.pk])
@@ -0,0 +1,225 @@
+"""
+Materialized slot inventory.
+
+Every (doctor, date) pair has one SlotInventory row holding two bitmaps with
+one bit per SLOT_MINUTES interval of the day (48 bits for 30 minute slots):
+
+* capacity_mask - slots inside the doctor's DoctorAvailability windows
+* open_mask     - capacity slots that are not taken by an appointment or a
+                  live SlotHold (patient.holds)
+
+Rows are built lazily (or ahead of time with ``manage.py build_slot_inventory``)
+and then patched in place by the Appointment signal receivers below, so reading
+the open slots of a day is a single indexed lookup.
+"""
+from datetime import time, timedelta
+
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from doctor.models import DoctorAvailability, DoctorProfile
+from .models import Appointment, SlotHold, SlotInventory
+
+SLOT_MINUTES = 30
+SLOTS_PER_DAY = 24 * 60 // SLOT_MINUTES
+
+# used for doctors that have not published any availability yet
+DEFAULT_HOURS = (time(9, 0), time(17, 0))
+
+# appointment statuses that give the slot back
+FREE_STATUSES = ("cancelled",)
+
+
+def _minutes(t):
+    return t.hour * 60 + t.minute
+
+
+def slot_bit(t):
+    return 1 << (_minutes(t) // SLOT_MINUTES)
+
+
+def slot_time(index):
+    minutes = index * SLOT_MINUTES
+    return time(minutes // 60, minutes % 60)
+
+
+def window_mask(start, end):
+    # slots that both start and end inside [start, end)
+    first = -(-_minutes(start) // SLOT_MINUTES)
+    last = _minutes(end) // SLOT_MINUTES
+    if last <= first:
+        return 0
+    return ((1 << (last - first)) - 1) << first
+
+
+def mask_to_slots(mask):
+    return [slot_time(i).strftime("%H:%M") for i in range(SLOTS_PER_DAY) if mask >> i & 1]
+
+
+def occupies(status):
+    return status not in FREE_STATUSES
+
+
+def materialize(doctor_ids, dates):
+    """
+    Return {(doctor_id, date): open_mask} for every requested pair, building
+    the missing inventory rows in a fixed number of queries.
+    """
+    doctor_ids, dates = list(doctor_ids), list(dates)
+    masks = {
+        (doctor_id, day): mask
+        for doctor_id, day, mask in SlotInventory.objects.filter(
+            doctor_id__in=doctor_ids, date__in=dates
+        ).values_list("doctor_id", "date", "open_mask")
+    }
+    missing = [(d, day) for d in doctor_ids for day in dates if (d, day) not in masks]
+    if not missing:
+        return masks
+
+    missing_doctors = {d for d, _ in missing}
+    windows = {}
+    for doctor_id, dow, start, end in DoctorAvailability.objects.filter(
+        doctor_id__in=missing_doctors
+    ).values_list("doctor_id", "day_of_week", "start_time", "end_time"):
+        windows.setdefault(doctor_id, {}).setdefault(dow, []).append((start, end))
+
+    booked = {}
+    for doctor_id, day, t in Appointment.objects.filter(
+        doctor_id__in=missing_doctors, date__in={day for _, day in missing}
+    ).exclude(status__in=FREE_STATUSES).values_list("doctor_id", "date", "time"):
+        booked[(doctor_id, day)] = booked.get((doctor_id, day), 0) | slot_bit(t)
+    # a held slot stays closed when its row is rebuilt; expired holds reopen it when swept
+    for doctor_id, day, t in SlotHold.objects.filter(
+        doctor_id__in=missing_doctors, date__in={day for _, day in missing}, expires_at__gt=timezone.now()
+    ).values_list("doctor_id", "date", "time"):
+        booked[(doctor_id, day)] = booked.get((doctor_id, day), 0) | slot_bit(t)
+
+    rows = []
+    for doctor_id, day in missing:
+        if doctor_id in windows:
+            day_windows = windows[doctor_id].get(day.weekday(), [])
+        else:
+            day_windows = [DEFAULT_HOURS]
+        capacity = 0
+        for start, end in day_windows:
+            capacity |= window_mask(start, end)
+        open_mask = capacity & ~booked.get((doctor_id, day), 0)
+        rows.append(SlotInventory(doctor_id=doctor_id, date=day, capacity_mask=capacity, open_mask=open_mask))
+        masks[(doctor_id, day)] = open_mask
+
+    SlotInventory.objects.bulk_create(rows, ignore_conflicts=True)
+    return masks
+
+
+def open_slots(doctor_id, day):
+    """Open "HH:MM" slots of a doctor on a day."""
+    mask = SlotInventory.objects.filter(doctor_id=doctor_id, date=day).values_list("open_mask", flat=True).first()
+    if mask is None:
+        mask = materialize([doctor_id], [day])[(doctor_id, day)]
+    return mask_to_slots(mask)
+
+
+def take_slot(doctor_id, day, t):
+    bit = slot_bit(t)
+    SlotInventory.objects.filter(doctor_id=doctor_id, date=day).update(
+        open_mask=F("open_mask") - F("open_mask").bitand(bit)
+    )
+
+
+def release_slot(doctor_id, day, t):
+    bit = slot_bit(t)
+    SlotInventory.objects.filter(doctor_id=doctor_id, date=day).update(
+        open_mask=F("open_mask").bitor(F("capacity_mask").bitand(bit))
+    )
+
+
+def book_slot(patient, doctor, day, t):
+    """
+    Create an appointment in a slot. A cancelled appointment still holds the
+    (doctor, date, time) unique key, so it is removed to make room.
+    Raises IntegrityError if somebody else holds the slot.
+    """
+    with transaction.atomic():
+        Appointment.objects.filter(doctor=doctor, date=day, time=t, status__in=FREE_STATUSES).delete()
+        return Appointment.objects.create(patient=patient, doctor=doctor, date=day, time=t)
+
+
+@receiver(post_save, sender=Appointment)
+def appointment_saved(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    old = getattr(instance, "_loaded_slot", None)
+    new = (instance.doctor_id, instance.date, instance.time, instance.status)
+    held = old[:3] if old and occupies(old[3]) else None
+    wanted = new[:3] if occupies(new[3]) else None
+    if held != wanted:
+        if held:
+            release_slot(*held)
+        if wanted:
+            take_slot(*wanted)
+    instance._loaded_slot = new
+
+
+@receiver(post_delete, sender=Appointment)
+def appointment_deleted(sender, instance, **kwargs):
+    if occupies(instance.status):
+        release_slot(instance.doctor_id, instance.date, instance.time)
+
+
+@receiver(post_save, sender=DoctorAvailability)
+@receiver(post_delete, sender=DoctorAvailability)
+def availability_changed(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    # capacity changed: drop the upcoming rows, they are rebuilt on the next read
+    SlotInventory.objects.filter(doctor_id=instance.doctor_id, date__gte=timezone.localdate()).delete()
+
+
+def next_available(specialization=None, department=None, days=7, limit=10):
+    """
+    Earliest ``limit`` open slots over the next ``days`` days across every
+    doctor matching the filters, as (doctor, date, "HH:MM") tuples.
+    """
+    doctors = DoctorProfile.objects.select_related("user")
+    if specialization:
+        doctors = doctors.filter(specialization=specialization)
+    if department:
+        doctors = doctors.filter(department=department)
+    doctors = {d.id: d for d in doctors}
+    if not doctors:
+        return []
+
+    now = timezone.localtime()
+    dates = [now.date() + timedelta(days=i) for i in range(days)]
+    masks = {
+        (doctor_id, day): mask
+        for doctor_id, day, mask in SlotInventory.objects.filter(
+            date__range=(dates[0], dates[-1]), doctor_id__in=list(doctors)
+        ).values_list("doctor_id", "date", "open_mask")
+    }
+    if len(masks) < len(doctors) * len(dates):
+        masks = materialize(doctors, dates)
+
+    # slots that already started today are not offered
+    past = (1 << -(-_minutes(now.time()) // SLOT_MINUTES)) - 1
+
+    found = []
+    for day in dates:
+        for doctor_id in doctors:
+            mask = masks.get((doctor_id, day), 0)
+            if day == dates[0]:
+                mask &= ~past
+            i = 0
+            while mask:
+                if mask & 1:
+                    found.append((day, i, doctor_id))
+                mask >>= 1
+                i += 1
+        if len(found) >= limit:
+            break
+
+    found.sort()
+    return [(doctors[doctor_id], day, slot_time(i).strftime("%H:%M")) for day, i, doctor_id in found[:limit]]
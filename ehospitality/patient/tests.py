@@ -1,3 +1,267 @@
+import json
+from datetime import time, timedelta
+from unittest import mock
+
+from django.db import OperationalError
 from django.test import TestCase
+from django.utils import timezone
+
+from accounts.models import User
+from doctor.models import DoctorAvailability, DoctorProfile, Prescription
+from . import holds, payments, slots, timeline
+from .models import Appointment, Billing, MedicalHistory, PaymentJob, SlotHold, SlotInventory
+
+
+def make_doctor(username="doc"):
+    return DoctorProfile.objects.create(user=User.objects.create(username=username, role="doctor"))
+
+
+def make_patient(username="pat"):
+    # accounts' post_save receiver creates the profile
+    return User.objects.create(username=username, role="patient").patientprofile
+
+
+class SlotMaskTests(TestCase):
+    def test_window_mask_keeps_whole_slots_only(self):
+        mask = slots.window_mask(time(9, 15), time(10, 45))
+        self.assertEqual(slots.mask_to_slots(mask), ["09:30", "10:00"])
+
+    def test_empty_window(self):
+        self.assertEqual(slots.window_mask(time(9, 10), time(9, 30)), 0)
+        self.assertEqual(slots.window_mask(time(10, 0), time(9, 0)), 0)
+
+    def test_slot_bit_round_trip(self):
+        for index in (0, 19, slots.SLOTS_PER_DAY - 1):
+            t = slots.slot_time(index)
+            self.assertEqual(slots.slot_bit(t), 1 << index)
+
+
+class InventoryTests(TestCase):
+    def setUp(self):
+        self.doctor = make_doctor()
+        self.patient = make_patient()
+        self.day = timezone.localdate() + timedelta(days=3)
+
+    def test_default_hours_without_availability(self):
+        free = slots.open_slots(self.doctor.id, self.day)
+        self.assertEqual(free[0], "09:00")
+        self.assertEqual(free[-1], "16:30")
+        self.assertEqual(len(free), 16)
+
+    def test_availability_windows(self):
+        DoctorAvailability.objects.create(
+            doctor=self.doctor, day_of_week=self.day.weekday(), start_time=time(14, 0), end_time=time(15, 0),
+        )
+        self.assertEqual(slots.open_slots(self.doctor.id, self.day), ["14:00", "14:30"])
+        # another weekday has none
+        self.assertEqual(slots.open_slots(self.doctor.id, self.day + timedelta(days=1)), [])
+
+    def test_appointments_patch_the_inventory(self):
+        slots.materialize([self.doctor.id], [self.day])
+        appointment = Appointment.objects.create(patient=self.patient, doctor=self.doctor, date=self.day, time=time(9, 0))
+        self.assertNotIn("09:00", slots.open_slots(self.doctor.id, self.day))
+
+        appointment.time = time(10, 0)
+        appointment.save()
+        free = slots.open_slots(self.doctor.id, self.day)
+        self.assertIn("09:00", free)
+        self.assertNotIn("10:00", free)
+
+        appointment.status = "cancelled"
+        appointment.save()
+        self.assertIn("10:00", slots.open_slots(self.doctor.id, self.day))
+
+    def test_materialize_counts_existing_appointments(self):
+        Appointment.objects.create(patient=self.patient, doctor=self.doctor, date=self.day, time=time(9, 30))
+        SlotInventory.objects.all().delete()
+        mask = slots.materialize([self.doctor.id], [self.day])[(self.doctor.id, self.day)]
+        self.assertNotIn("09:30", slots.mask_to_slots(mask))
+        self.assertIn("09:00", slots.mask_to_slots(mask))
+
+    def test_book_slot_replaces_a_cancelled_appointment(self):
+        Appointment.objects.create(
+            patient=self.patient, doctor=self.doctor, date=self.day, time=time(9, 0), status="cancelled",
+        )
+        other = make_patient("other")
+        appointment = slots.book_slot(other, self.doctor, self.day, time(9, 0))
+        self.assertEqual(Appointment.objects.get(doctor=self.doctor, date=self.day, time=time(9, 0)), appointment)
+
+
+class HoldTests(TestCase):
+    def setUp(self):
+        self.doctor = make_doctor()
+        self.patient = make_patient()
+        self.other = make_patient("other")
+        self.day = timezone.localdate() + timedelta(days=2)
+        self.t = time(11, 0)
+
+    def test_hold_closes_the_slot_and_confirm_books_it(self):
+        self.assertIn("11:00", slots.open_slots(self.doctor.id, self.day))
+        hold = holds.take_hold(self.patient, self.doctor, self.day, self.t)
+        self.assertNotIn("11:00", slots.open_slots(self.doctor.id, self.day))
+        appointment = holds.confirm_hold(hold)
+        self.assertEqual(appointment.patient, self.patient)
+        self.assertFalse(SlotHold.objects.exists())
+
+    def test_rebuilt_inventory_keeps_held_slots_closed(self):
+        holds.take_hold(self.patient, self.doctor, self.day, self.t)
+        # no row yet at hold time, or one dropped by an availability change
+        SlotInventory.objects.all().delete()
+        self.assertNotIn("11:00", slots.open_slots(self.doctor.id, self.day))
+        SlotHold.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        SlotInventory.objects.all().delete()
+        self.assertIn("11:00", slots.open_slots(self.doctor.id, self.day))
+
+    def test_second_patient_loses_the_race(self):
+        holds.take_hold(self.patient, self.doctor, self.day, self.t)
+        with self.assertRaises(holds.SlotUnavailable):
+            holds.take_hold(self.other, self.doctor, self.day, self.t)
+
+    def test_new_hold_replaces_the_patients_old_one(self):
+        holds.take_hold(self.patient, self.doctor, self.day, self.t)
+        holds.take_hold(self.patient, self.doctor, self.day, time(12, 0))
+        self.assertEqual(SlotHold.objects.get().time, time(12, 0))
+        self.assertIn("11:00", slots.open_slots(self.doctor.id, self.day))
+
+    def test_expired_hold_cannot_be_confirmed_and_is_swept(self):
+        hold = holds.take_hold(self.patient, self.doctor, self.day, self.t)
+        SlotHold.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        with self.assertRaises(holds.SlotUnavailable):
+            holds.confirm_hold(hold)
+        self.assertEqual(holds.expire_holds(), 1)
+        self.assertIn("11:00", slots.open_slots(self.doctor.id, self.day))
+
+    def test_locked_database_is_reported_as_busy(self):
+        with mock.patch.object(holds, "take_slot", side_effect=OperationalError("database is locked")):
+            with self.assertRaises(holds.SlotBusy):
+                holds.take_hold(self.patient, self.doctor, self.day, self.t)
+        self.assertFalse(SlotHold.objects.exists())
+
+
+class TimelineTests(TestCase):
+    def setUp(self):
+        self.doctor = make_doctor()
+        self.other_doctor = make_doctor("other-doc")
+        self.patient = make_patient()
+        today = timezone.localdate()
+        for i in range(12):
+            doctor = self.doctor if i % 2 else self.other_doctor
+            Appointment.objects.create(patient=self.patient, doctor=doctor, date=today - timedelta(days=i), time=time(9, 0))
+        for i in range(5):
+            rx = Prescription.objects.create(doctor=self.doctor, patient=self.patient)
+            Billing.objects.create(patient=self.patient, prescription=rx, amount=10)
+            MedicalHistory.objects.create(patient=self.patient, diagnosis=f"d{i}")
+
+    def pages(self, **kwargs):
+        entries, cursor = [], None
+        while True:
+            page = timeline.timeline(self.patient, cursor, limit=4, **kwargs)
+            entries.extend(page)
+            if not page.has_next:
+                return entries
+            cursor = page.next_cursor
+
+    def test_pages_cover_every_entry_once_newest_first(self):
+        entries = self.pages()
+        self.assertEqual(len(entries), 12 + 5 * 3)
+        keys = [(e["type"], e["id"]) for e in entries]
+        self.assertEqual(len(set(keys)), len(keys))
+        stamps = [e["timestamp"] for e in entries]
+        self.assertEqual(stamps, sorted(stamps, reverse=True))
+
+    def test_doctor_sees_own_appointments_and_no_bills(self):
+        entries = self.pages(doctor=self.doctor)
+        appointments = [e["object"] for e in entries if e["type"] == "appointment"]
+        self.assertEqual(len(appointments), 6)
+        self.assertTrue(all(a.doctor_id == self.doctor.id for a in appointments))
+        self.assertFalse([e for e in entries if e["type"] == "bill"])
+
+    def test_mangled_cursor_starts_over(self):
+        self.assertIsNone(timeline.decode_cursor("not-a-cursor"))
+        first = timeline.timeline(self.patient, "not-a-cursor", limit=4)
+        self.assertEqual([e["id"] for e in first], [e["id"] for e in timeline.timeline(self.patient, limit=4)])
+
+
+class PaymentTests(TestCase):
+    def setUp(self):
+        self.gateway = payments.FakeGateway()
+        patcher = mock.patch.object(payments, "_gateway", self.gateway)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.patient = make_patient()
+        self.bill = Billing.objects.create(patient=self.patient, amount=250)
+
+    def start(self, bill=None):
+        return payments.start_payment(bill or self.bill, "http://testserver/paid/", "http://testserver/cancelled/")
+
+    def make_due(self):
+        PaymentJob.objects.update(run_after=timezone.now())
+
+    def test_failed_calls_are_retried_with_backoff(self):
+        job = self.start()
+        self.assertEqual(self.start(), job)
+        self.gateway.fail_next = 2
+        before = timezone.now()
+        self.assertEqual(payments.work(), 1)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts, job.error), ("queued", 1, "fake gateway failure"))
+        self.assertGreaterEqual(job.run_after, before + timedelta(seconds=2))
+        # not due yet
+        self.assertEqual(payments.work(), 0)
+
+        self.make_due()
+        payments.work()
+        job.refresh_from_db()
+        self.assertGreaterEqual(job.run_after, before + timedelta(seconds=4))
+        self.make_due()
+        payments.work()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ("ready", 3))
+        self.assertTrue(job.checkout_url.startswith("http://testserver/paid/?session_id="))
+        # a ready job is reused instead of opening another session
+        self.assertEqual(self.start(), job)
+
+    def test_job_fails_after_max_attempts(self):
+        job = self.start()
+        self.gateway.fail_next = payments.MAX_ATTEMPTS
+        for _ in range(payments.MAX_ATTEMPTS):
+            self.make_due()
+            payments.work()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ("failed", payments.MAX_ATTEMPTS))
+        self.assertNotEqual(self.start(), job)
+
+    def test_webhook_replays_pay_the_bill_once(self):
+        self.gateway.outcome = "unpaid"
+        self.start()
+        payments.work()
+        job = PaymentJob.objects.get()
+        payload = self.gateway.completed_event(job.session_id)
+        self.assertEqual(payments.handle_event(json.loads(payload)), 1)
+        self.assertEqual(payments.handle_event(json.loads(payload)), 0)
+        self.bill.refresh_from_db()
+        self.assertEqual((self.bill.status, self.bill.stripe_payment_intent), ("paid", f"pi_fake_{job.session_id}"))
+        self.assertEqual(self.bill.patient.balance.unpaid_count, 0)
+
+        response = self.client.post("/patient/billing/webhook/", payload, content_type="application/json")
+        self.assertEqual(response.json(), {"received": True, "bills_paid": 0})
+        response = self.client.post("/patient/billing/webhook/", "not json", content_type="application/json")
+        self.assertEqual(response.status_code, 400)
+
+    def test_reconcile_settles_paid_sessions_only(self):
+        self.gateway.outcome = "unpaid"
+        other = Billing.objects.create(patient=self.patient, amount=40)
+        self.start()
+        job = self.start(other)
+        payments.work()
+        self.assertEqual(payments.reconcile(), 0)
 
-# Create your tests here.
+        # paid without the webhook arriving
+        self.gateway.completed_event(PaymentJob.objects.get(pk=job.pk).session_id)
+        self.gateway.fail_next = 1
+        with self.assertRaises(payments.GatewayError):
+            payments.reconcile()
+        self.assertEqual(payments.reconcile(batch=1), 1)
+        self.assertEqual(payments.reconcile(), 0)
+        self.assertEqual(Billing.objects.get(pk=other.pk).status, "paid")
+        self.assertEqual(Billing.objects.get(pk=self.bill.pk).status, "unpaid")
@@ -0,0 +1,161 @@
+"""
+One patient's appointments, medical history, prescriptions and bills as a
+single timeline, newest first.
+
+Each record type is read with its own query on a (patient, timestamp, id)
+index, limited to one page, and the sorted per-type lists are merged with
+heapq.merge. Entries are ordered by (timestamp, type rank, id); the cursor
+is that triple for the last entry of the page, so the next page starts with
+the same bounded queries however long the patient's record is.
+
+Appointments are placed at their date and time, history entries at the
+start of their date and prescriptions and bills at their creation time.
+A doctor's view of the timeline has only their own appointments with the
+patient and no bills.
+"""
+import base64
+import heapq
+import json
+from datetime import datetime, time
+
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from adminpanel.pagination import keyset_filter
+from doctor.models import Prescription
+from .models import Appointment, Billing, MedicalHistory
+
+PER_PAGE = 20
+# larger than any primary key; see _bound
+_MAX_ID = 2 ** 63 - 1
+
+
+def _at(day, at=time.min):
+    return timezone.make_aware(datetime.combine(day, at))
+
+
+class Source:
+    """How to read one record type in timeline order."""
+
+    def __init__(self, kind, rank, model, fields, timestamp, relations=()):
+        self.kind = kind
+        self.rank = rank
+        self.model = model
+        self.fields = fields
+        self.timestamp = timestamp
+        self.relations = relations
+
+    def ordering(self):
+        return tuple(f"-{f}" for f in self.fields) + ("-id",)
+
+    def cursor_values(self, ts):
+        """The cursor timestamp in this source's fields, and whether it lands exactly on a row time."""
+        local = timezone.localtime(ts)
+        if self.fields == ("date", "time"):
+            return [local.date(), local.time()], True
+        if self.fields == ("date",):
+            return [local.date()], local.time() == time.min
+        return [ts], True
+
+    def _bound(self, cursor):
+        """Keyset values matching every row that sorts after ``cursor`` (newest first)."""
+        ts, rank, last_id = cursor
+        values, exact = self.cursor_values(ts)
+        if not exact:
+            # the cursor falls inside this row's time slot (a history date):
+            # the whole date sorts below it
+            return values + [_MAX_ID]
+        if rank == self.rank:
+            return values + [last_id]
+        # same timestamp: lower ranks still come after the cursor, higher ones do not
+        return values + [_MAX_ID if self.rank < rank else 0]
+
+    def fetch(self, patient, cursor, limit, doctor=None):
+        qs = self.model.objects.filter(patient=patient)
+        if doctor is not None and self.kind == "appointment":
+            qs = qs.filter(doctor=doctor)
+        if self.relations:
+            qs = qs.select_related(*[r for r in self.relations if r != "items"])
+            if "items" in self.relations:
+                qs = qs.prefetch_related("items")
+        if cursor:
+            qs = qs.filter(keyset_filter(self.ordering(), self._bound(cursor)))
+        return [
+            (self.timestamp(obj), self.rank, obj.id, self.kind, obj)
+            for obj in qs.order_by(*self.ordering())[:limit]
+        ]
+
+
+SOURCES = (
+    Source("appointment", 0, Appointment, ("date", "time"), lambda a: _at(a.date, a.time), ("doctor__user",)),
+    Source("history", 1, MedicalHistory, ("date",), lambda h: _at(h.date)),
+    Source("prescription", 2, Prescription, ("created_at",), lambda p: p.created_at, ("doctor__user", "items")),
+    Source("bill", 3, Billing, ("created_at",), lambda b: b.created_at),
+)
+
+
+def encode_cursor(entry):
+    ts, rank, obj_id = entry[:3]
+    raw = json.dumps([ts.isoformat(), rank, obj_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    try:
+        ts, rank, obj_id = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        ts = parse_datetime(ts)
+        if ts is None or timezone.is_naive(ts):
+            return None
+        return ts, int(rank), int(obj_id)
+    except Exception:
+        # a mangled cursor starts over from the newest entry
+        return None
+
+
+class TimelinePage:
+    def __init__(self, entries, has_next):
+        self.entries = [
+            {"type": kind, "timestamp": ts, "id": obj_id, "object": obj}
+            for ts, rank, obj_id, kind, obj in entries
+        ]
+        self.has_next = has_next
+        self.next_cursor = encode_cursor(entries[-1]) if has_next else None
+
+    def __iter__(self):
+        return iter(self.entries)
+
+    def __len__(self):
+        return len(self.entries)
+
+
+def timeline(patient, cursor=None, limit=PER_PAGE, doctor=None):
+    """
+    The page of ``patient``'s timeline that follows ``cursor`` (an encoded
+    cursor string or None), as ``doctor`` may see it when one is given.
+    """
+    position = decode_cursor(cursor) if cursor else None
+    sources = [s for s in SOURCES if doctor is None or s.kind != "bill"]
+    streams = [source.fetch(patient, position, limit + 1, doctor) for source in sources]
+    merged = heapq.merge(*streams, key=lambda entry: entry[:3], reverse=True)
+    entries = [entry for _, entry in zip(range(limit + 1), merged)]
+    return TimelinePage(entries[:limit], has_next=len(entries) > limit)
+
+
+def serialize(entry):
+    """A JSON-friendly dict for one timeline entry."""
+    obj = entry["object"]
+    data = {"type": entry["type"], "id": entry["id"], "timestamp": entry["timestamp"].isoformat()}
+    if entry["type"] == "appointment":
+        data.update(status=obj.status, doctor=obj.doctor.user.get_full_name() or obj.doctor.user.username)
+    elif entry["type"] == "history":
+        data.update(diagnosis=obj.diagnosis, treatment=obj.treatment, allergies=obj.allergies,
+                    medications=obj.medications)
+    elif entry["type"] == "prescription":
+        data.update(
+            doctor=obj.doctor.user.get_full_name() or obj.doctor.user.username, notes=obj.notes,
+            items=[{"drug_name": i.drug_name, "dosage": i.dosage, "frequency": i.frequency, "duration": i.duration}
+                   for i in obj.items.all()],
+        )
+    elif entry["type"] == "bill":
+        data.update(amount=str(obj.amount), status=obj.status, prescription_id=obj.prescription_id)
+    return data
@@ -1,24 +1,35 @@
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import async_views, views
 
 app_name = "patient"
 
+# the read-heavy pages have async variants, for serving under ehospitality.asgi
+reads = async_views if settings.ASYNC_VIEWS else views
+
 urlpatterns = [
     path("register/", views.patient_register, name="patient_register"),
     path("login/", views.patient_login, name="patient_login"),
-    path("dashboard/", views.patient_dashboard, name="patient_dashboard"),
+    path("dashboard/", reads.patient_dashboard, name="patient_dashboard"),
+    path("timeline/", views.patient_timeline, name="timeline"),  # JSON
 
     #Appoinment
     path("appointment/book/", views.book_appointment, name="book_appointment"),
+    path("appointment/confirm/<int:hold_id>/", views.confirm_appointment, name="confirm_appointment"),
+    path("appointment/find/", reads.find_slots, name="find_slots"),
+    path("appointment/find/feed/", reads.find_slots_feed, name="find_slots_feed"),  # JSON
 
     # Billing
     path("billing/", views.billing_list, name="billing_list"),
     path("billing/pay/<int:bill_id>/", views.pay_bill, name="pay_bill"),
+    path("billing/pay/status/<int:job_id>/", views.payment_status, name="payment_status"),
     path("billing/success/<int:bill_id>/", views.payment_success, name="payment_success"),
     path("billing/cancel/<int:bill_id>/", views.payment_cancel, name="payment_cancel"),
+    path("billing/webhook/", views.payment_webhook, name="payment_webhook"),
+    path("billing/invoices/<str:period>/", views.invoice, name="invoice"),
 
     # Resource
-    path("resources/", views.resources, name="resources"),
+    path("resources/", reads.resources, name="resources"),
 
 
 ]
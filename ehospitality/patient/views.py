@@ -1,25 +1,34 @@
-from django.db import IntegrityError
+import os
+
+from django.http import FileResponse, Http404, HttpResponse, JsonResponse
 from django.shortcuts import render, redirect, get_object_or_404
+from django.urls import reverse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
 from django.contrib.auth import get_user_model
 from django.contrib.auth.hashers import make_password, check_password
-from django.conf import settings
 from django.utils.datetime_safe import date
-from .models import PatientProfile, Appointment, MedicalHistory, Billing, HealthResource
+from django.utils import timezone
+from .models import PatientProfile, Appointment, MedicalHistory, Billing, HealthResource, PaymentJob, SlotHold
 from .forms import PatientRegisterForm, AppointmentForm, MedicalHistoryForm, BillingForm
 from doctor.models import DoctorProfile
-from datetime import datetime, timedelta
-import stripe
+from datetime import datetime
+from . import holds, invoices, payments, search, slots, timeline
+from adminpanel.pagination import paginate
+from accounts.loaders import load
 
 User = get_user_model()
 
-# Session-based login
+# relations each template walks, fetched in batch by accounts.loaders
+DASHBOARD_RELATIONS = {
+    "appointments": ("doctor__user",),
+    "prescriptions": ("doctor__user", "items"),
+}
+BOOKING_RELATIONS = ("user",)
+
+# Session-based login, resolved once per request by SessionIdentityMiddleware
 def get_logged_in_user(request):
-    if "user_id" in request.session:
-        try:
-            return User.objects.get(id=request.session["user_id"])
-        except User.DoesNotExist:
-            return None
-    return None
+    return request.identity.user
 
 
 def patient_register(request):
@@ -58,11 +67,11 @@ def patient_dashboard(request):
     if not user or user.role != "patient":
         return redirect("accounts:login")
 
-    patient, created = PatientProfile.objects.get_or_create(user=user)
+    patient = request.identity.patient
 
-    appointments = Appointment.objects.filter(patient=patient)
+    appointments = load(Appointment.objects.filter(patient=patient), DASHBOARD_RELATIONS["appointments"])
     bills = Billing.objects.filter(patient=patient)
-    prescriptions = patient.prescriptions.all().order_by("-created_at")
+    prescriptions = load(patient.prescriptions.order_by("-created_at"), DASHBOARD_RELATIONS["prescriptions"])
 
     return render(
         request,
@@ -80,7 +89,7 @@ def medical_history(request):
     user = get_logged_in_user(request)
     if not user or user.role != "patient":
         return redirect("patient_login")
-    patient = PatientProfile.objects.get(user=user)
+    patient = request.identity.patient
     history = MedicalHistory.objects.filter(patient=patient)
     return render(request, "patient/medical_history.html", {"history": history})
 
@@ -89,7 +98,7 @@ def add_medical_history(request):
     user = get_logged_in_user(request)
     if not user or user.role != "patient":
         return redirect("patient_login")
-    patient = PatientProfile.objects.get(user=user)
+    patient = request.identity.patient
 
     if request.method == "POST":
         form = MedicalHistoryForm(request.POST)
@@ -107,50 +116,37 @@ def billing_list(request):
     user = get_logged_in_user(request)
     if not user or user.role != "patient":
         return redirect("patient_login")
-    patient = PatientProfile.objects.get(user=user)
-    bills = Billing.objects.filter(patient=patient)
-    return render(request, "patient/billing_list.html", {"bills": bills})
+    patient = request.identity.patient
+    bills = list(Billing.objects.filter(patient=patient).order_by("-created_at", "-id"))
+    periods = sorted({invoices.period_of(timezone.localdate(b.created_at)) for b in bills}, reverse=True)
+    invoice_list = [
+        {"period": period, "pdf": os.path.exists(invoices.invoice_path(period, patient.id, "pdf"))}
+        for period in periods
+    ]
+    return render(request, "patient/billing_list.html", {"bills": bills, "invoices": invoice_list})
 
 
-def pay_bill(request, bill_id):
+def invoice(request, period):
     user = get_logged_in_user(request)
     if not user or user.role != "patient":
-        return redirect("patient_login")
-    bill = get_object_or_404(Billing, id=bill_id)
-
-    # Simple Stripe Checkout (placeholder)
-
-    stripe.api_key = settings.STRIPE_SECRET_KEY
-    checkout_session = stripe.checkout.Session.create(
-        payment_method_types=["card"],
-        line_items=[{
-            "price_data": {
-                "currency": "usd",
-                "product_data": {"name": f"Bill {bill.id}"},
-                "unit_amount": int(bill.amount * 100),
-            },
-            "quantity": 1,
-        }],
-        mode="payment",
-        success_url="http://localhost:8000/patient/billing/",
-        cancel_url="http://localhost:8000/patient/billing/",
-    )
-    return redirect(checkout_session.url, code=303)
-
-
-def resources(request):
-    resources = HealthResource.objects.all()
-    return render(request, "patient/resources.html", {"resources": resources})
-
-
-def generate_time_slots(start="09:00", end="17:00", interval=30):
-    slots = []
-    start_time = datetime.strptime(start, "%H:%M")
-    end_time = datetime.strptime(end, "%H:%M")
-    while start_time < end_time:  # exclude end time
-        slots.append(start_time.strftime("%H:%M"))
-        start_time += timedelta(minutes=interval)
-    return slots
+        return redirect("accounts:login")
+    try:
+        invoices.parse_period(period)
+    except ValueError:
+        raise Http404("No such invoice")
+    patient = request.identity.patient
+    fmt = "pdf" if request.GET.get("format") == "pdf" else "html"
+
+    # the month-end copy written by render_invoices, if there is one
+    path = invoices.invoice_path(period, patient.id, fmt)
+    if os.path.exists(path):
+        return FileResponse(open(path, "rb"), as_attachment=fmt == "pdf", filename=f"invoice-{period}.{fmt}")
+    if fmt == "pdf":
+        raise Http404("No such invoice")
+    html = invoices.render_patient(patient, period)
+    if html is None:
+        raise Http404("No such invoice")
+    return HttpResponse(html)
 
 
 def book_appointment(request):
@@ -158,10 +154,10 @@ def book_appointment(request):
     if not user or user.role != "patient":
         return redirect("patient_login")
 
-    patient = PatientProfile.objects.get(user=user)
-    doctors = DoctorProfile.objects.all()
-    all_slots = generate_time_slots()
+    patient = request.identity.patient
+    doctors = load(DoctorProfile.objects.all(), BOOKING_RELATIONS)
     available_slots = []
+    holds.maybe_expire_holds()
 
     selected_doctor = None
     selected_date = None
@@ -186,29 +182,22 @@ def book_appointment(request):
                     error = "You cannot book for past dates."
                 else:
 
-                    booked = Appointment.objects.filter(
-                        doctor=selected_doctor,
-                        date=selected_date_obj
-                    ).values_list("time", flat=True)
-
-
-                    booked_str = [t.strftime("%H:%M") for t in booked]
-                    available_slots = [slot for slot in all_slots if slot not in booked_str]
+                    available_slots = slots.open_slots(selected_doctor.id, selected_date_obj)
 
                     if time_val:
                         if time_val not in available_slots:
                             error = "Slot not available!"
                         else:
                             try:
-                                Appointment.objects.create(
-                                    patient=patient,
-                                    doctor=selected_doctor,
-                                    date=selected_date_obj,
-                                    time=datetime.strptime(time_val, "%H:%M").time()
+                                hold = holds.take_hold(
+                                    patient,
+                                    selected_doctor,
+                                    selected_date_obj,
+                                    datetime.strptime(time_val, "%H:%M").time()
                                 )
-                                return redirect("patient:patient_dashboard")
-                            except IntegrityError:
-                                error = "Sorry, this slot was just booked by another patient."
+                                return redirect("patient:confirm_appointment", hold_id=hold.id)
+                            except holds.SlotUnavailable as e:
+                                error = str(e)
 
     return render(request, "patient/book_appointment.html", {
         "doctors": doctors,
@@ -221,12 +210,92 @@ def book_appointment(request):
 
 
 
+def confirm_appointment(request, hold_id):
+    user = get_logged_in_user(request)
+    if not user or user.role != "patient":
+        return redirect("accounts:login")
+
+    hold = get_object_or_404(SlotHold.objects.select_related("doctor__user"), id=hold_id, patient=request.identity.patient)
+    error = None
+
+    if request.method == "POST":
+        try:
+            if request.POST.get("action") == "release":
+                holds.release_hold(hold)
+                return redirect("patient:book_appointment")
+            holds.confirm_hold(hold)
+            return redirect("patient:patient_dashboard")
+        except holds.SlotUnavailable as e:
+            error = str(e)
+
+    return render(request, "patient/confirm_appointment.html", {"hold": hold, "error": error})
+
+
+def _slot_search_params(request):
+    try:
+        days = min(max(int(request.GET.get("days", 7)), 1), 60)
+        limit = min(max(int(request.GET.get("limit", 10)), 1), 50)
+    except ValueError:
+        days, limit = 7, 10
+    return {
+        "specialization": request.GET.get("specialization") or None,
+        "department": request.GET.get("department") or None,
+        "days": days,
+        "limit": limit,
+    }
+
+
+def find_slots(request):
+    user = get_logged_in_user(request)
+    if not user or user.role != "patient":
+        return redirect("accounts:login")
+
+    params = _slot_search_params(request)
+    results = slots.next_available(**params)
+    return render(request, "patient/find_slots.html", {
+        "results": results,
+        "params": params,
+        "specializations": DoctorProfile.objects.exclude(specialization="")
+            .order_by("specialization").values_list("specialization", flat=True).distinct(),
+        "departments": DoctorProfile.objects.exclude(department="")
+            .order_by("department").values_list("department", flat=True).distinct(),
+    })
+
+
+def find_slots_feed(request):
+    user = get_logged_in_user(request)
+    if not user or user.role != "patient":
+        return JsonResponse({"error": "Please login as a patient."}, status=403)
+
+    data = [{
+        "doctor_id": doctor.id,
+        "doctor": doctor.user.get_full_name() or doctor.user.username,
+        "specialization": doctor.specialization,
+        "department": doctor.department,
+        "date": day.isoformat(),
+        "time": slot,
+    } for doctor, day, slot in slots.next_available(**_slot_search_params(request))]
+    return JsonResponse({"slots": data})
+
+
+def patient_timeline(request):
+    user = get_logged_in_user(request)
+    if not user or user.role != "patient":
+        return JsonResponse({"error": "Please login as a patient."}, status=403)
+
+    page = timeline.timeline(request.identity.patient, request.GET.get("before"))
+    return JsonResponse({
+        "entries": [timeline.serialize(e) for e in page],
+        "next": page.next_cursor,
+    })
+
+
 def edit_medical_history(request, history_id):
     user = get_logged_in_user(request)
     if not user or user.role != "patient":
         return redirect("patient_login")
 
-    patient = PatientProfile.objects.get(user=user)
+    patient = request.identity.patient
     entry = get_object_or_404(MedicalHistory, id=history_id, patient=patient)
 
     if request.method == "POST":
@@ -245,53 +314,77 @@ def delete_medical_history(request, history_id):
     if not user or user.role != "patient":
         return redirect("patient_login")
 
-    patient = PatientProfile.objects.get(user=user)
+    patient = request.identity.patient
     entry = get_object_or_404(MedicalHistory, id=history_id, patient=patient)
     entry.delete()
     return redirect("medical_history")
 
-stripe.api_key = settings.STRIPE_SECRET_KEY
+def _patient_bill(request, bill_id):
+    return get_object_or_404(Billing, id=bill_id, patient=request.identity.patient)
 
-def pay_bill(request, bill_id):
-    bill = get_object_or_404(Billing, id=bill_id)
-
-    if request.method == "POST":
-        # Create a Stripe Checkout Session
-        checkout_session = stripe.checkout.Session.create(
-            payment_method_types=["card"],
-            line_items=[{
-                "price_data": {
-                    "currency": "inr",
-                    "product_data": {"name": f"Hospital Bill #{bill.id}"},
-                    "unit_amount": int(bill.amount * 100)
-                },
-                "quantity": 1,
-            }],
-            mode="payment",
-            success_url=request.build_absolute_uri(
-                f"/patient/billing/success/{bill.id}/"
-            ),
-            cancel_url=request.build_absolute_uri(
-                f"/patient/billing/cancel/{bill.id}/"
-            ),
 
+def pay_bill(request, bill_id):
+    user = get_logged_in_user(request)
+    if not user or user.role != "patient":
+        return redirect("accounts:login")
+    bill = _patient_bill(request, bill_id)
+
+    if request.method == "POST" and bill.status == "unpaid":
+        # the checkout session is created by the payment workers; wait for it on the status page
+        job = payments.start_payment(
+            bill,
+            success_url=request.build_absolute_uri(reverse("patient:payment_success", args=[bill.id])),
+            cancel_url=request.build_absolute_uri(reverse("patient:payment_cancel", args=[bill.id])),
         )
-        return redirect(checkout_session.url, code=303)
+        return redirect("patient:payment_status", job_id=job.id)
 
     return render(request, "patient/pay_bill.html", {"bill": bill})
 
 
+def payment_status(request, job_id):
+    user = get_logged_in_user(request)
+    if not user or user.role != "patient":
+        return redirect("accounts:login")
+    job = get_object_or_404(
+        PaymentJob.objects.select_related("bill"), id=job_id, bill__patient=request.identity.patient
+    )
+
+    if request.GET.get("format") == "json":
+        return JsonResponse({
+            "status": job.status,
+            "checkout_url": job.checkout_url if job.status == "ready" else None,
+            "error": job.error if job.status == "failed" else None,
+        })
+    if job.status == "ready":
+        return redirect(job.checkout_url, code=303)
+    return render(request, "patient/payment_pending.html", {"job": job, "bill": job.bill})
+
+
 def payment_success(request, bill_id):
-    bill = get_object_or_404(Billing, id=bill_id)
-    bill.status = "paid"   # ✅ mark as paid
-    bill.save()
+    # the bill is marked paid by the webhook or reconciliation, not by visiting this page
+    bill = _patient_bill(request, bill_id)
     return render(request, "patient/payment_success.html", {"bill": bill})
 
 
 def payment_cancel(request, bill_id):
-    bill = get_object_or_404(Billing, id=bill_id)
+    bill = _patient_bill(request, bill_id)
     return render(request, "patient/payment_cancel.html", {"bill": bill})
 
+
+@csrf_exempt
+@require_POST
+def payment_webhook(request):
+    gateway = payments.get_gateway()
+    try:
+        event = gateway.parse_event(request.body, request.META.get("HTTP_STRIPE_SIGNATURE", ""))
+    except payments.GatewayError:
+        return JsonResponse({"error": "Invalid payload."}, status=400)
+    return JsonResponse({"received": True, "bills_paid": payments.handle_event(event)})
+
 def resources(request):
-    resources = HealthResource.objects.all().order_by("-published_at")
-    return render(request, "patient/resources.html", {"resources": resources})
+    query = request.GET.get("q", "").strip()
+    if query:
+        page = search.search(request, query)
+    else:
+        page = paginate(request, search.latest(), ("-published_at", "-id"), per_page=search.PER_PAGE)
+    return render(request, "patient/resources.html", {"resources": page, "page": page, "query": query})